@@ -0,0 +1,196 @@
+# apps/emr/files/access_retention.py
+# Retention of DocumentAccessLog.
+#
+# Raw access rows stay in the live table for AUDIT_LOG['ARCHIVE_DAYS']; older
+# days are compacted, one day per transaction: the rows move to
+# DocumentAccessLogArchive and are rolled into DocumentAccessDaily (count,
+# first and last access per document, user and action). A day that is
+# compacted again (e.g. spooled events loaded late) adds to the existing
+# counts. Archived rows are only deleted when AUDIT_LOG['RETENTION_DAYS'] is
+# set; older days are then answered from the daily counts alone.
+# access_history() answers audit lookups over all three tables.
+#
+# MySQL cannot partition tables that have foreign keys, so the archive table
+# plays the role of the old partitions.
+
+import datetime
+import logging
+import itertools
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.tenant_cache import current_alias
+from apps.emr.files.models import DocumentAccessDaily, DocumentAccessLog, DocumentAccessLogArchive
+
+logger = logging.getLogger(__name__)
+
+_config        = getattr(settings, 'AUDIT_LOG', {})
+ARCHIVE_DAYS   = _config.get('ARCHIVE_DAYS', 180)
+RETENTION_DAYS = _config.get('RETENTION_DAYS')      # None: archived rows are kept
+
+KEY_FIELDS   = ('document_id', 'user_id', 'action')
+COPY_FIELDS  = ('id', *KEY_FIELDS, 'timestamp', 'info')
+BATCH_SIZE   = 1000
+
+
+def _day_bounds(day):
+    """[start, end) of a local calendar day, as aware datetimes."""
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    return start, timezone.make_aware(datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min))
+
+
+def _cutoff(days):
+    """First local day that is not older than `days` (None for None)."""
+    return None if days is None else timezone.localdate() - datetime.timedelta(days=days)
+
+
+def compact(archive_days=ARCHIVE_DAYS, alias=None, retention_days=RETENTION_DAYS):
+    """
+    Archive every whole day older than `archive_days` (see compact_day()),
+    then purge archived days older than `retention_days` unless it is None.
+    Returns {'days': …, 'rows': raw rows archived, 'daily': daily rows written,
+    'purged': archived rows deleted}.
+    """
+    alias  = alias or current_alias()
+    cutoff = _cutoff(archive_days)
+    stats  = {'days': 0, 'rows': 0, 'daily': 0, 'purged': 0}
+
+    oldest = DocumentAccessLog.objects.using(alias).order_by('timestamp').values_list('timestamp', flat=True)
+    while True:
+        first = oldest.first()
+        if first is None or timezone.localdate(first) >= cutoff:
+            break
+        rows, daily = compact_day(timezone.localdate(first), alias)
+        stats['days']  += 1
+        stats['rows']  += rows
+        stats['daily'] += daily
+
+    stats['purged'] = purge(retention_days, alias)
+    return stats
+
+
+def compact_day(day, alias):
+    """
+    Move one local day of the live log to the archive and add it to the daily
+    counts; returns (raw rows archived, daily rows written).
+    """
+    start, end = _day_bounds(day)
+    with transaction.atomic(using=alias):
+        raw = DocumentAccessLog.objects.using(alias).filter(timestamp__gte=start, timestamp__lt=end)
+        groups = list(
+            raw.order_by().values(*KEY_FIELDS)
+               .annotate(count=Count('pk'), first_at=Min('timestamp'), last_at=Max('timestamp'))
+        )
+        if not groups:
+            return 0, 0
+
+        existing = {
+            (row.document_id, row.user_id, row.action): row
+            for row in DocumentAccessDaily.objects.using(alias).select_for_update().filter(day=day)
+        }
+        created, updated = [], []
+        for group in groups:
+            key  = tuple(group[field] for field in KEY_FIELDS)
+            row  = existing.get(key)
+            if row is None:
+                created.append(DocumentAccessDaily(
+                    day=day, count=group['count'], first_at=group['first_at'], last_at=group['last_at'],
+                    **dict(zip(KEY_FIELDS, key)),
+                ))
+            else:
+                row.count   += group['count']
+                row.first_at = min(row.first_at, group['first_at'])
+                row.last_at  = max(row.last_at, group['last_at'])
+                updated.append(row)
+        DocumentAccessDaily.objects.using(alias).bulk_create(created, batch_size=1000)
+        DocumentAccessDaily.objects.using(alias).bulk_update(updated, ['count', 'first_at', 'last_at'], batch_size=1000)
+
+        rows = raw.order_by('pk').values(*COPY_FIELDS).iterator(chunk_size=BATCH_SIZE)
+        while batch := list(itertools.islice(rows, BATCH_SIZE)):
+            DocumentAccessLogArchive.objects.using(alias).bulk_create(
+                [DocumentAccessLogArchive(**row) for row in batch]
+            )
+        archived = sum(group['count'] for group in groups)
+        raw.delete()
+    logger.info("Access log: archived %s on %s (%d rows → %d daily)", day, alias, archived, len(groups))
+    return archived, len(created) + len(updated)
+
+
+def purge(retention_days=RETENTION_DAYS, alias=None):
+    """
+    Delete archived rows of the days older than `retention_days` (their daily
+    counts stay), BATCH_SIZE rows per statement; returns the rows deleted.
+    Nothing is deleted when `retention_days` is None.
+    """
+    if retention_days is None:
+        return 0
+    alias   = alias or current_alias()
+    expired = DocumentAccessLogArchive.objects.using(alias).filter(
+        timestamp__lt=_day_bounds(_cutoff(retention_days))[0],
+    )
+    purged = 0
+    while pks := list(expired.order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE]):
+        purged += DocumentAccessLogArchive.objects.using(alias).filter(pk__in=pks).delete()[0]
+    if purged:
+        logger.info("Access log: purged %d archived rows on %s", purged, alias)
+    return purged
+
+
+def _per_day(rows):
+    """Raw access rows grouped by local day, document, user and action."""
+    return (
+        rows.order_by().annotate(day=TruncDate('timestamp', tzinfo=timezone.get_current_timezone()))
+            .values('day', *KEY_FIELDS)
+            .annotate(count=Count('pk'), first_at=Min('timestamp'), last_at=Max('timestamp'))
+    )
+
+
+def access_history(document=None, user=None, start=None, end=None, action=None):
+    """
+    Daily access counts over live and archived data, newest day first:
+    [{'day', 'document_id', 'user_id', 'action', 'count', 'first_at', 'last_at'}, …].
+    `start` / `end` are dates (inclusive). Archived days are counted from the
+    archive table, purged ones from the daily counts.
+    """
+    filters = {}
+    if document is not None:
+        filters['document'] = document
+    if user is not None:
+        filters['user'] = user
+    if action is not None:
+        filters['action'] = action
+
+    live     = DocumentAccessLog.objects.filter(**filters)
+    archived = DocumentAccessLogArchive.objects.filter(**filters)
+    daily    = DocumentAccessDaily.objects.filter(**filters)
+    # the daily counts duplicate the archive: only use them for the days before
+    # its oldest row, i.e. purged (or compacted before the archive existed)
+    oldest = DocumentAccessLogArchive.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+    if oldest is not None:
+        daily = daily.filter(day__lt=timezone.localdate(oldest))
+    if start is not None:
+        live     = live.filter(timestamp__gte=_day_bounds(start)[0])
+        archived = archived.filter(timestamp__gte=_day_bounds(start)[0])
+        daily    = daily.filter(day__gte=start)
+    if end is not None:
+        live     = live.filter(timestamp__lt=_day_bounds(end)[1])
+        archived = archived.filter(timestamp__lt=_day_bounds(end)[1])
+        daily    = daily.filter(day__lte=end)
+
+    merged = defaultdict(lambda: {'count': 0, 'first_at': None, 'last_at': None})
+    daily_rows = daily.order_by().values('day', *KEY_FIELDS, 'count', 'first_at', 'last_at')
+    for row in (*daily_rows, *_per_day(archived), *_per_day(live)):
+        entry = merged[(row['day'], *(row[field] for field in KEY_FIELDS))]
+        entry['count'] += row['count']
+        entry['first_at'] = min(filter(None, (entry['first_at'], row['first_at'])))
+        entry['last_at']  = max(filter(None, (entry['last_at'], row['last_at'])))
+
+    return [
+        {'day': key[0], **dict(zip(KEY_FIELDS, key[1:])), **values}
+        for key, values in sorted(merged.items(), key=lambda item: item[0][0], reverse=True)
+    ]
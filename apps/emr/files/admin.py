@@ -8,6 +8,10 @@ from .models import (
     ProtocolAssignment,
     Document,
     DocumentAccessLog,
+    DocumentAccessLogArchive,
+    DocumentAccessDaily,
+    DocumentSaveJob,
+    DocumentVersion,
 )
 
 
@@ -56,6 +60,14 @@ class ProtocolAssignmentAdmin(admin.ModelAdmin):
     ordering = ('path_pattern',)
 
 
+class DocumentVersionInline(admin.TabularInline):
+    model = DocumentVersion
+    extra = 0
+    can_delete = False
+    fields = ('revision', 'sha256', 'size', 'source', 'created_at')
+    readonly_fields = fields
+
+
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
     list_display = (
@@ -67,6 +79,7 @@ class DocumentAdmin(admin.ModelAdmin):
     raw_id_fields = ('patient',)
     date_hierarchy = 'created_at'
     readonly_fields = ('id', 'created_at', 'updated_at')
+    inlines = (DocumentVersionInline,)
 
 
 @admin.register(DocumentAccessLog)
@@ -77,3 +90,36 @@ class DocumentAccessLogAdmin(admin.ModelAdmin):
         'document__relative_path', 'user__username', 'action'
     )
     date_hierarchy = 'timestamp'
+    list_select_related = ('document', 'user')
+    show_full_result_count = False    # COUNT(*) over the whole log on every page
+
+
+@admin.register(DocumentAccessLogArchive)
+class DocumentAccessLogArchiveAdmin(admin.ModelAdmin):
+    list_display = ('document', 'action', 'user', 'timestamp')
+    list_filter = ('action', 'timestamp')
+    search_fields = ('document__relative_path', 'user__username')
+    date_hierarchy = 'timestamp'
+    list_select_related = ('document', 'user')
+    raw_id_fields = ('document', 'user')
+    show_full_result_count = False
+
+
+@admin.register(DocumentAccessDaily)
+class DocumentAccessDailyAdmin(admin.ModelAdmin):
+    list_display = ('document', 'action', 'user', 'day', 'count', 'first_at', 'last_at')
+    list_filter = ('action', 'day')
+    search_fields = ('document__relative_path', 'user__username')
+    date_hierarchy = 'day'
+    list_select_related = ('document', 'user')
+    raw_id_fields = ('document', 'user')
+
+
+@admin.register(DocumentSaveJob)
+class DocumentSaveJobAdmin(admin.ModelAdmin):
+    list_display = ('key', 'document', 'status', 'attempts', 'size', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('key', 'document__relative_path')
+    list_select_related = ('document',)
+    raw_id_fields = ('document',)
+    readonly_fields = ('sha256', 'last_error', 'created_at', 'updated_at')
@@ -5,3 +5,8 @@ class FilesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.emr.files'
     verbose_name = 'EMR File Server'
+
+    def ready(self):
+        from apps.emr.files import permissions, protocol_matcher
+        permissions.install()
+        protocol_matcher.install()
@@ -0,0 +1,208 @@
+# apps/emr/files/audit.py
+# DocumentAccessLog writes, batched per request.
+#
+# record() only appends the event to the request's buffer (set up by
+# AuditMiddleware, right after InstrumentationMiddleware so the tenant
+# context is active); when the response is ready the whole buffer goes out
+# at once, according to AUDIT_LOG['MODE']:
+#   - 'sync':   one INSERT per event, immediately (no buffering);
+#   - 'bulk':   one bulk_create per request;
+#   - 'celery': one write_access_logs task per request;
+#   - 'spool':  one fsync'd append to SPOOL_DIR/<tenant>/<pid>.jsonl, loaded
+#               in bulk by `manage.py load_access_logs`.
+# Events that cannot be written or sent are spooled instead of dropped.
+# Outside a request (commands, tasks) events are written at once.
+
+import os
+import json
+import fcntl
+import logging
+import contextvars
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.tenant_cache import current_alias
+from apps.emr.files.models import Document, DocumentAccessLog
+
+logger = logging.getLogger(__name__)
+
+_config   = getattr(settings, 'AUDIT_LOG', {})
+MODE      = _config.get('MODE', 'bulk')
+SPOOL_DIR = _config.get('SPOOL_DIR', os.path.join(settings.BASE_DIR, 'logs', 'audit_spool'))
+
+_buffer = contextvars.ContextVar('audit_buffer', default=None)
+
+
+def record(document, user, action, info=None):
+    """Queue one access event (written when the request ends)."""
+    event = {
+        'document': str(document.pk),
+        'user':     user.pk if user is not None and user.is_authenticated else None,
+        'action':   action,
+        'info':     info or {},
+        'at':       timezone.now().isoformat(),
+    }
+    buffer = _buffer.get()
+    if buffer is None or MODE == 'sync':
+        flush([event], mode='sync')
+    else:
+        buffer.append(event)
+
+
+def flush(events, mode=None, alias=None):
+    """Ship a batch of events according to `mode` (default: MODE); never raises."""
+    if not events:
+        return
+    mode  = mode or MODE
+    alias = alias or current_alias()
+    try:
+        if mode == 'celery':
+            from apps.emr.files.tasks import write_access_logs
+            write_access_logs.delay(events)
+        elif mode == 'spool':
+            spool(events, alias)
+        else:
+            write(events)
+        return
+    except Exception:
+        logger.exception("Audit: could not %s %d access events, spooling them", mode, len(events))
+    if mode != 'spool':
+        try:
+            spool(events, alias)
+            return
+        except Exception:
+            pass
+    logger.critical("Audit: lost %d access events: %s", len(events), json.dumps(events))
+
+
+def write(events):
+    """
+    Insert events (dicts as built by record()) with one bulk_create; events of
+    documents deleted meanwhile are logged and dropped. Returns how many were
+    written.
+    """
+    ids      = {event['document'] for event in events}
+    existing = {str(pk) for pk in Document.objects.filter(pk__in=ids).values_list('pk', flat=True)}
+    if len(existing) < len(ids):
+        dropped = [event for event in events if event['document'] not in existing]
+        logger.warning("Audit: dropping %d access events of deleted documents: %s",
+                       len(dropped), json.dumps(dropped))
+        events = [event for event in events if event['document'] in existing]
+    DocumentAccessLog.objects.bulk_create([
+        DocumentAccessLog(
+            document_id = event['document'],
+            user_id     = event['user'],
+            action      = event['action'],
+            info        = event['info'],
+            timestamp   = parse_datetime(event['at']),
+        )
+        for event in events
+    ])
+    return len(events)
+
+
+# ------------------------------------------------------------------- spool
+
+def spool_path(alias):
+    return os.path.join(SPOOL_DIR, alias, f'{os.getpid()}.jsonl')
+
+
+def spool(events, alias):
+    """
+    Append events to this process' spool file and fsync it. The lock and the
+    inode check keep us from writing into a file the loader already took.
+    """
+    path = spool_path(alias)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = ''.join(json.dumps(event, separators=(',', ':')) + '\n' for event in events).encode()
+    while True:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                renamed = os.fstat(fd).st_ino != os.stat(path).st_ino
+            except FileNotFoundError:
+                renamed = True
+            if renamed:
+                continue
+            os.write(fd, data)
+            os.fsync(fd)
+            return
+        finally:
+            os.close(fd)
+
+
+def claim_spool_files(alias):
+    """Rename the tenant's spool files for loading; returns the claimed paths."""
+    folder = os.path.join(SPOOL_DIR, alias)
+    if not os.path.isdir(folder):
+        return []
+    claimed = []
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if name.endswith('.loading'):
+            claimed.append(path)     # left over by an interrupted load
+        elif name.endswith('.jsonl'):
+            target = f'{path}.{timezone.now():%Y%m%d%H%M%S%f}.loading'
+            os.rename(path, target)
+            claimed.append(target)
+    return claimed
+
+
+def read_spool_file(path):
+    """Events of a claimed spool file (waits for a writer still holding it)."""
+    with open(path, 'rb') as fh:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        events = []
+        for line in fh:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                logger.error("Audit: skipping a torn line in %s", path)
+        return events
+
+
+# -------------------------------------------------------------- middleware
+
+class AuditMiddleware:
+    """Collects the request's access events and flushes them once at the end."""
+
+    sync_capable  = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        events = []
+        token  = _buffer.set(events)
+        try:
+            response = self.get_response(request)
+        finally:
+            _buffer.reset(token)
+        self._flush(events, response)
+        return response
+
+    async def __acall__(self, request):
+        events = []
+        token  = _buffer.set(events)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _buffer.reset(token)
+        if events:
+            await sync_to_async(self._flush)(events, response)
+        return response
+
+    @staticmethod
+    def _flush(events, response):
+        # a failed request rolled its writes back (ATOMIC_REQUESTS): so do we
+        if response.status_code < 500:
+            flush(events)
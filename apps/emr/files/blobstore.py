@@ -0,0 +1,242 @@
+# apps/emr/files/blobstore.py
+# Content-addressed storage behind Document.relative_path.
+#
+# Every content ever stored is one blob, ROOT/ab/cd/<sha256>, written once
+# and made read-only. The patient tree stays what users and the indexer see:
+# a patient file is a clone of (or a hard link to, or a copy of) the blob of
+# its current content, so identical scans share storage and an editor save
+# adds a new blob and re-points the path with an atomic rename. Each stored
+# content is a DocumentVersion row (document, revision, sha256).
+#
+# BLOB_STORE['LINK']:
+#   - 'reflink':  copy-on-write clone (btrfs, XFS; default). Identical
+#                 contents share their extents, and an in-place write to a
+#                 patient file never reaches the blob or another patient's
+#                 file. Filesystems without reflinks (ext4) get plain copies;
+#   - 'copy':     plain copy, no sharing;
+#   - 'hardlink': patient file and blob are the same inode, deduplicating
+#                 on any filesystem. Only for trees no process writes in
+#                 place: the blob's read-only mode does not stop root (or a
+#                 share served as root), and such a write silently changes
+#                 the blob, its versions and every other patient file of
+#                 the same content.
+# Links need ROOT on the same filesystem as PATIENT_DATA; otherwise (EXDEV,
+# no reflink support, …) the file is copied.
+#
+# Blobs never change, so backing up ROOT is incremental by construction.
+# Existing trees are hashed into the store by `manage.py import_blobstore`,
+# which refuses to run where LINK would end up copying (see link_supported).
+
+import os
+import stat
+import uuid
+import errno
+import fcntl
+import shutil
+import hashlib
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+from apps.emr.files.models import Document, DocumentVersion
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'BLOB_STORE', {})
+ROOT    = _config.get('ROOT') or os.path.join(settings.PATIENT_DATA, '.blobs')
+LINK    = _config.get('LINK', 'reflink')
+
+CHUNK_SIZE = 1024 * 1024
+FICLONE    = 0x40049409          # linux/fs.h: _IOW(0x94, 9, int)
+READ_ONLY  = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+
+# errors after which a link / clone is retried as a copy
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EMLINK, errno.EPERM}
+_fallbacks_logged = set()     # (LINK, errno): warned once per process, not per file
+
+
+def blob_path(sha256):
+    return os.path.join(ROOT, sha256[:2], sha256[2:4], sha256)
+
+
+def hash_file(path):
+    """(sha256 hex digest, size) of a file, read in CHUNK_SIZE pieces."""
+    digest = hashlib.sha256()
+    size   = 0
+    with open(path, 'rb') as fh:
+        while True:
+            chunk = fh.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def put(path, sha256, move=False, copy=True):
+    """
+    Make sure the blob `sha256` exists, taking it from `path` (linked or
+    copied; renamed away when `move`). Returns True if the blob is new,
+    False if it was already stored (the content is deduplicated), None if
+    `path` could not be linked and `copy` is false (nothing was stored).
+    """
+    target = blob_path(sha256)
+    if os.path.exists(target):
+        if move:
+            os.remove(path)
+        return False
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = f'{target}.{uuid.uuid4().hex}.tmp'
+    try:
+        if move:
+            try:
+                os.rename(path, tmp)
+            except OSError as exc:
+                if exc.errno != errno.EXDEV:
+                    raise
+                _copy(path, tmp)
+                os.remove(path)
+        elif _link(path, tmp, copy) is None:
+            return None
+        os.chmod(tmp, READ_ONLY)
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+    _fsync_dir(os.path.dirname(target))
+    return True
+
+
+def checkout(sha256, relative_path, copy=True):
+    """
+    Point PATIENT_DATA/<relative_path> at the blob (atomic rename over the
+    old file); returns the patient file's stat result for the manifest, or
+    None (file left alone) when it could not be linked and `copy` is false.
+    """
+    source = blob_path(sha256)
+    target = os.path.join(settings.PATIENT_DATA, relative_path)
+    try:
+        st = os.stat(target)
+        if LINK == 'hardlink' and st.st_ino == os.stat(source).st_ino and st.st_dev == os.stat(source).st_dev:
+            return st
+    except FileNotFoundError:
+        pass
+
+    folder = os.path.dirname(target)
+    os.makedirs(folder, exist_ok=True)
+    tmp = os.path.join(folder, f'.{os.path.basename(target)}.{uuid.uuid4().hex}.tmp')
+    try:
+        if _link(source, tmp, copy) is None:
+            return None
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+    _fsync_dir(folder)
+    return os.stat(target)
+
+
+def add_version(document_id, sha256, size, source):
+    """
+    Record the document's current revision as stored under `sha256`; call
+    inside the transaction that changed the revision.
+    """
+    with transaction.atomic():
+        revision = Document.objects.filter(pk=document_id).values_list('revision', flat=True).get()
+        Document.objects.filter(pk=document_id).update(sha256=sha256)
+        version, _ = DocumentVersion.objects.update_or_create(
+            document_id=document_id, revision=revision,
+            defaults={'sha256': sha256, 'size': size, 'source': source},
+        )
+    return version
+
+
+def content_sha256(document):
+    """
+    SHA-256 of a document's current content: Document.sha256 when it is the
+    current revision's (recorded by a save or the import), else the file's.
+    """
+    if document.sha256 and DocumentVersion.objects.filter(
+        document=document, revision=document.revision, sha256=document.sha256,
+    ).exists():
+        return document.sha256
+    return hash_file(os.path.join(settings.PATIENT_DATA, document.relative_path))[0]
+
+
+def open_version(version):
+    """Binary file object with the content of a DocumentVersion."""
+    return open(blob_path(version.sha256), 'rb')
+
+
+# ------------------------------------------------------------------ copies
+
+def link_supported():
+    """
+    Whether LINK actually shares storage between PATIENT_DATA and ROOT (tried
+    on a scratch file; a fallback to a copy does not count).
+    """
+    if LINK == 'copy':
+        return False
+    os.makedirs(ROOT, exist_ok=True)
+    name   = f'.link-probe.{uuid.uuid4().hex}'
+    source = os.path.join(settings.PATIENT_DATA, name)
+    target = os.path.join(ROOT, name)
+    try:
+        with open(source, 'xb') as fh:
+            fh.write(b'probe')
+        return _link(source, target, copy=False) is True
+    finally:
+        for path in (source, target):
+            if os.path.lexists(path):
+                os.remove(path)
+
+
+def _link(source, target, copy=True):
+    """
+    Create `target` with the content of `source` as BLOB_STORE['LINK'] says:
+    True when it shares storage with `source`, False when it had to be
+    copied, None (nothing created) when it could not be linked and not `copy`.
+    """
+    try:
+        if LINK == 'hardlink':
+            os.link(source, target)
+            return True
+        if LINK == 'reflink':
+            _reflink(source, target)
+            return True
+    except OSError as exc:
+        if exc.errno not in _FALLBACK_ERRNOS:
+            raise
+        if os.path.lexists(target):
+            os.remove(target)
+        if copy and (LINK, exc.errno) not in _fallbacks_logged:
+            _fallbacks_logged.add((LINK, exc.errno))
+            logger.warning("Blob store: cannot %s %s (%s), copying (logged once)", LINK, source, exc)
+    if not copy:
+        return None
+    _copy(source, target)
+    return False
+
+
+def _reflink(source, target):
+    with open(source, 'rb') as src, open(target, 'xb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def _copy(source, target):
+    with open(source, 'rb') as src, open(target, 'xb') as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        dst.flush()
+        os.fsync(dst.fileno())
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
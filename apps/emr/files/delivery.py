@@ -0,0 +1,190 @@
+# apps/emr/files/delivery.py
+# How a patient file, once authorised, gets to the client.
+#
+# serve_patient_file does the IP / JWT checks in Django and then asks the
+# configured backend for the response (FILE_DELIVERY['BACKEND']):
+#   - 'python':   FileResponse streamed by the worker (development default);
+#   - 'nginx':    empty response with X-Accel-Redirect to an `internal`
+#                 location aliasing PATIENT_DATA (see nginx/appseed-app.conf);
+#   - 'sendfile': X-Sendfile with the absolute path (Apache mod_xsendfile,
+#                 lighttpd, …);
+#   - or the dotted path of a FileDelivery subclass.
+# With the offloading backends the worker is free as soon as the headers
+# are written; the front server does the transfer (and Range requests).
+#
+# Every backend answers conditional requests first: ETag and Last-Modified
+# come from the file's stat (mtime, size), so If-None-Match /
+# If-Modified-Since get a 304 without touching the file. The Python backend
+# also honours Range (single → 206, several → multipart/byteranges).
+
+import os
+import uuid
+import mimetypes
+import functools
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils.module_loading import import_string
+
+_config         = getattr(settings, 'FILE_DELIVERY', {})
+BACKEND         = _config.get('BACKEND', 'python')
+INTERNAL_PREFIX = _config.get('INTERNAL_PREFIX', '/protected/patient_data/')
+
+CHUNK_SIZE = 64 * 1024
+MAX_RANGES = 16         # more than that: the whole file is sent instead
+
+
+@functools.lru_cache(maxsize=256)
+def content_type_for(extension):
+    """Content type by file extension ('.pdf'), cached."""
+    content_type, _ = mimetypes.guess_type('file' + extension)
+    return content_type or 'application/octet-stream'
+
+
+def validators(st):
+    """(ETag, Last-Modified timestamp) of a file, from its stat result (same ETag as nginx)."""
+    return f'"{int(st.st_mtime):x}-{st.st_size:x}"', int(st.st_mtime)
+
+
+def parse_range(header, size):
+    """
+    [(first, last), …] for a 'bytes=' Range header; [] when none of the ranges
+    is satisfiable (416), None when the header is to be ignored (200).
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    ranges = []
+    for spec in header[6:].split(','):
+        first, dash, last = spec.strip().partition('-')
+        if not dash or not (first or last) or not (first or '0').isdigit() or not (last or '0').isdigit():
+            return None
+        if not first:                                  # suffix: the last N bytes
+            if int(last) > 0 and size > 0:
+                ranges.append((max(0, size - int(last)), size - 1))
+            continue
+        first, last = int(first), (int(last) if last else None)
+        if last is not None and last < first:
+            return None
+        if first < size:
+            ranges.append((first, size - 1 if last is None else min(last, size - 1)))
+    return ranges if len(ranges) <= MAX_RANGES else None
+
+
+class FileDelivery:
+    """Builds the response for a file under settings.PATIENT_DATA."""
+
+    def serve(self, request, relative_path, st):
+        """Conditional handling, then response(); `st` is the file's stat result."""
+        etag, last_modified = validators(st)
+        resp = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if resp is None:
+            resp = self.response(request, relative_path, st)
+        resp['ETag']          = etag
+        resp['Last-Modified'] = http_date(last_modified)
+        resp['Cache-Control'] = 'private, no-cache'    # revalidate, never shared caches
+        return resp
+
+    def response(self, request, relative_path, st):
+        raise NotImplementedError
+
+    @staticmethod
+    def full_path(relative_path):
+        return os.path.join(settings.PATIENT_DATA, relative_path)
+
+    @staticmethod
+    def content_type(relative_path):
+        return content_type_for(os.path.splitext(relative_path)[1].lower())
+
+
+class PythonDelivery(FileDelivery):
+    def response(self, request, relative_path, st):
+        content_type = self.content_type(relative_path)
+        ranges = parse_range(request.headers.get('Range'), st.st_size) if self._range_applies(request, st) else None
+
+        if ranges is None:
+            resp = FileResponse(open(self.full_path(relative_path), 'rb'), content_type=content_type)
+        elif not ranges:
+            resp = HttpResponse(status=416)
+            resp['Content-Range'] = f'bytes */{st.st_size}'
+        elif len(ranges) == 1:
+            first, last = ranges[0]
+            resp = StreamingHttpResponse(self._read(relative_path, ranges), status=206, content_type=content_type)
+            resp['Content-Range']  = f'bytes {first}-{last}/{st.st_size}'
+            resp['Content-Length'] = last - first + 1
+        else:
+            boundary = uuid.uuid4().hex
+            parts    = [
+                (f'\r\n--{boundary}\r\nContent-Type: {content_type}\r\n'
+                 f'Content-Range: bytes {first}-{last}/{st.st_size}\r\n\r\n').encode()
+                for first, last in ranges
+            ]
+            closing = f'\r\n--{boundary}--\r\n'.encode()
+            resp = StreamingHttpResponse(
+                self._read(relative_path, ranges, parts, closing), status=206,
+                content_type=f'multipart/byteranges; boundary={boundary}',
+            )
+            resp['Content-Length'] = (sum(len(part) for part in parts) + len(closing)
+                                      + sum(last - first + 1 for first, last in ranges))
+        resp['Accept-Ranges'] = 'bytes'
+        return resp
+
+    @staticmethod
+    def _range_applies(request, st):
+        """If-Range: only serve a range of the version the client already has."""
+        if_range = request.headers.get('If-Range')
+        if not if_range:
+            return True
+        etag, last_modified = validators(st)
+        if if_range.startswith(('"', 'W/')):
+            return if_range == etag
+        return parse_http_date_safe(if_range) == last_modified
+
+    def _read(self, relative_path, ranges, parts=None, closing=b''):
+        with open(self.full_path(relative_path), 'rb') as fh:
+            for i, (first, last) in enumerate(ranges):
+                if parts:
+                    yield parts[i]
+                fh.seek(first)
+                remaining = last - first + 1
+                while remaining > 0:
+                    chunk = fh.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        return
+                    remaining -= len(chunk)
+                    yield chunk
+            if closing:
+                yield closing
+
+
+class NginxDelivery(FileDelivery):
+    def response(self, request, relative_path, st):
+        resp = HttpResponse(content_type=self.content_type(relative_path))
+        resp['X-Accel-Redirect'] = INTERNAL_PREFIX + quote(relative_path.replace(os.sep, '/'))
+        return resp
+
+
+class SendfileDelivery(FileDelivery):
+    def response(self, request, relative_path, st):
+        resp = HttpResponse(content_type=self.content_type(relative_path))
+        resp['X-Sendfile'] = os.path.abspath(self.full_path(relative_path))
+        return resp
+
+
+BACKENDS = {
+    'python':   PythonDelivery,
+    'nginx':    NginxDelivery,
+    'sendfile': SendfileDelivery,
+}
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        cls = BACKENDS.get(BACKEND) or import_string(BACKEND)
+        _backend = cls()
+    return _backend
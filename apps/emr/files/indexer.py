@@ -0,0 +1,395 @@
+# apps/emr/files/indexer.py
+
+import os
+import logging
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from apps.emr.identity.models import Patient
+from apps.emr.files.models import (
+    Document,
+    DocumentType,
+    FileExtension,
+)
+from apps.emr.files import search_index, thumbnails
+from apps.emr.files.protocol_matcher import get_matcher
+from apps.emr.files.walker import WORKERS, parallel_walk, scan_tree
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DOCUMENT_TYPE = 1      # pk of the DocumentType used outside known subfolders
+CHUNK_SIZE            = 500    # rows per bulk_create / bulk_update / UPDATE … IN
+
+
+# one file on disk, with the stat fields kept in the Document manifest
+FileEntry = namedtuple(
+    'FileEntry',
+    ['patient_dir', 'relative_path', 'file_name', 'size', 'mtime_ns', 'inode'],
+)
+
+# the Document fields the indexer owns, as stored in / compared with the DB
+MANIFEST_FIELDS = (
+    'patient_id', 'file_name', 'file_extension_id', 'protocol_id', 'document_type_id',
+    'file_size', 'file_mtime_ns', 'file_inode',
+)
+
+
+def walk_patient_files(base_path, errors, accept=None, workers=WORKERS):
+    """
+    Yield a FileEntry for every file under <base_path>/<patient_dir>/…, the
+    patient folders being walked in parallel (order is not preserved).
+    Only patient folders for which accept(patient_dir) is true are walked.
+    Patient folders that could not be read completely are added to `errors`
+    (their documents must not be treated as deleted).
+    """
+    for entry in parallel_walk(base_path, accept=accept, onerror=_onerror(errors), workers=workers):
+        yield _file_entry(entry)
+
+
+def walk_folder(base_path, rel_dir, errors):
+    """FileEntry for every file below <base_path>/<rel_dir> (rel_dir starts with the patient folder)."""
+    for entry in scan_tree(base_path, rel_dir, onerror=_onerror(errors)):
+        yield _file_entry(entry)
+
+
+def _onerror(errors):
+    def onerror(patient_dir, exc):
+        logger.warning("Index: cannot read %s: %s", exc.filename, exc)
+        errors.add(patient_dir)
+    return onerror
+
+
+def _file_entry(entry):
+    return FileEntry(
+        patient_dir   = entry.top,
+        relative_path = entry.relative_path,
+        file_name     = entry.name,
+        size          = entry.stat.st_size,
+        mtime_ns      = entry.stat.st_mtime_ns,
+        inode         = entry.stat.st_ino,
+    )
+
+
+class DocumentRules:
+    """
+    Everything needed to turn a file path into Document fields, loaded once:
+    patients by folder name, document types by subfolder, file extensions
+    and protocol assignments. Shared by the indexer and the live watcher.
+    """
+
+    def __init__(self):
+        self.patients = dict(
+            Patient.objects.filter(patient_id__isnull=False).values_list('patient_id', 'pk')
+        )
+        self.document_types = dict(
+            DocumentType.objects.values_list('representative_relative_path', 'pk')
+        )
+        # fails loudly, as before, when the default type is missing
+        self.default_document_type = DocumentType.objects.values_list('pk', flat=True).get(
+            pk=DEFAULT_DOCUMENT_TYPE
+        )
+        self.extensions  = dict(FileExtension.objects.values_list('code', 'pk'))
+        self.protocols   = get_matcher()
+
+    def patient(self, patient_dir):
+        """Patient pk for a top-level folder name (Patient.patient_id), or None."""
+        try:
+            return self.patients.get(int(patient_dir))
+        except ValueError:
+            return None
+
+    def document_type(self, relative_path):
+        """DocumentType of the first subfolder under the patient folder, else the default."""
+        parts = relative_path.split(os.sep)
+        subfolder = parts[1] if len(parts) > 2 else None
+        return self.document_types.get(subfolder, self.default_document_type)
+
+    def protocol(self, relative_path):
+        """PermissionProtocol pk of the first matching ProtocolAssignment, or None."""
+        return self.protocols.match(relative_path)
+
+    def extension(self, file_name):
+        """FileExtension pk for the file's extension (created on first sight)."""
+        code = os.path.splitext(file_name)[1].lstrip('.').lower()
+        if code not in self.extensions:
+            ext, _ = FileExtension.objects.get_or_create(code=code, defaults={'name': code.upper()})
+            self.extensions[code] = ext.pk
+        return self.extensions[code]
+
+    def resolve(self, entry, patient_id):
+        """Manifest values (MANIFEST_FIELDS) for a file, or None when no protocol matches."""
+        protocol_id = self.protocol(entry.relative_path)
+        if protocol_id is None:
+            return None
+        return {
+            'patient_id':        patient_id,
+            'file_name':         entry.file_name,
+            'file_extension_id': self.extension(entry.file_name),
+            'protocol_id':       protocol_id,
+            'document_type_id':  self.document_type(entry.relative_path),
+            'file_size':         entry.size,
+            'file_mtime_ns':     entry.mtime_ns,
+            'file_inode':        entry.inode,
+        }
+
+
+class DocumentIndexer:
+    """
+    Incremental, bulk-writing replacement of the per-file update_or_create walk.
+
+    1. Preload the rules (DocumentRules) and the current manifest of every
+       Document (pk + MANIFEST_FIELDS) in two handfuls of queries.
+    2. Walk the tree; compare each file with its manifest row.
+    3. Write only what changed: new rows with bulk_create, changed rows with
+       bulk_update, unchanged rows get the new scan generation through one
+       UPDATE … WHERE pk IN (…) per chunk. Every chunk is its own transaction.
+    4. Rows still on an older generation were not seen on disk and are
+       deleted, except in patient folders that could not be read completely
+       (and not at all when the whole tree comes back empty).
+    """
+
+    def __init__(self, base_path=None, chunk_size=CHUNK_SIZE):
+        self.base_path  = base_path or settings.PATIENT_DATA
+        self.chunk_size = chunk_size
+        self.rules      = None
+        self.changed    = []     # pks of new / changed content, for thumbnails and text
+
+    def run(self):
+        stats = {
+            'created': 0,
+            'updated': 0,
+            'unchanged': 0,
+            'skipped_no_protocol': 0,
+            'skipped_no_patient': 0,
+            'deleted': 0,
+            'unreadable_folders': 0,
+        }
+        rules = self.rules = DocumentRules()
+        self.generation = self._current_generation() + 1
+
+        manifest = {
+            row[1]: (row[0], row[2:])
+            for row in Document.objects.values_list('pk', 'relative_path', *MANIFEST_FIELDS).iterator(chunk_size=5000)
+        }
+
+        created, updated, unchanged = [], [], []
+        errors, missing_patients = set(), set()
+
+        def has_patient(patient_dir):
+            if patient_dir.startswith('.'):
+                return False               # .blobs, .incoming: not patient folders
+            if rules.patient(patient_dir) is None:
+                missing_patients.add(patient_dir)
+                return False
+            return True
+
+        seen = 0
+        for entry in walk_patient_files(self.base_path, errors, accept=has_patient):
+            seen += 1
+            patient_id = rules.patient(entry.patient_dir)
+            known  = manifest.get(entry.relative_path)
+            values = rules.resolve(entry, patient_id)
+            if values is None:
+                stats['skipped_no_protocol'] += 1
+                if known is not None:
+                    unchanged.append(known[0])     # keep the row, as before
+                continue
+
+            self._classify(entry, values, known, created, updated, unchanged)
+
+            if len(created) >= self.chunk_size:
+                stats['created'] += self._create(created)
+            if len(updated) >= self.chunk_size:
+                stats['updated'] += self._update(updated)
+            if len(unchanged) >= self.chunk_size:
+                stats['unchanged'] += self._touch(unchanged)
+
+        stats['created']   += self._create(created)
+        stats['updated']   += self._update(updated)
+        stats['unchanged'] += self._touch(unchanged)
+        stats['skipped_no_patient'] = len(missing_patients)
+        stats['unreadable_folders'] = len(errors)
+
+        if not seen and manifest:
+            # an unmounted network share looks like an empty folder
+            logger.error("Index: no files under %s, not deleting %d documents", self.base_path, len(manifest))
+        else:
+            stats['deleted'] = self._delete_stale(rules, errors)
+        self._schedule_derived()
+        return stats
+
+    def apply(self, paths, moves=()):
+        """
+        Bring the rows for a few changed paths in line with the disk, in one
+        transaction (used by the watch_documents command). Paths are relative
+        to base_path and may be files or folders:
+
+        - moves: (old, new) pairs; the rows are renamed, so Document ids and
+          their access logs survive a rename or a move between folders;
+        - an existing file is created / updated, an existing folder is walked;
+        - a path that no longer exists deletes its row and every row below it.
+
+        Rules are loaded on first use; call refresh_rules() to reload them.
+        """
+        if self.rules is None:
+            self.refresh_rules()
+        rules = self.rules
+        self.generation = self._current_generation()
+        stats = dict.fromkeys(('created', 'updated', 'unchanged', 'moved', 'deleted', 'skipped'), 0)
+
+        with transaction.atomic():
+            for old, new in moves:
+                stats['moved'] += self._move(old, new)
+
+            entries, gone, errors = [], [], set()
+            for rel in sorted(set(paths) | {new for _, new in moves}):
+                full = os.path.join(self.base_path, rel)
+                if os.path.isdir(full):
+                    entries.extend(walk_folder(self.base_path, rel, errors))
+                else:
+                    entry = self._entry(rel, full)
+                    if entry is not None:
+                        entries.append(entry)
+                    else:
+                        gone.append(rel)
+
+            # a new folder and a file inside it may both be in `paths`
+            entries = list({entry.relative_path: entry for entry in entries}.values())
+
+            known = {}
+            rel_paths = [entry.relative_path for entry in entries]
+            for i in range(0, len(rel_paths), self.chunk_size):
+                for row in (Document.objects.filter(relative_path__in=rel_paths[i:i + self.chunk_size])
+                                .values_list('pk', 'relative_path', *MANIFEST_FIELDS)):
+                    known[row[1]] = (row[0], row[2:])
+
+            created, updated, unchanged = [], [], []
+            for entry in entries:
+                patient_id = rules.patient(entry.patient_dir)
+                values = rules.resolve(entry, patient_id) if patient_id is not None else None
+                if values is None:
+                    stats['skipped'] += 1
+                    continue
+                self._classify(entry, values, known.get(entry.relative_path), created, updated, unchanged)
+            stats['unchanged'] = len(unchanged)
+            stats['created']   = self._create(created)
+            stats['updated']   = self._update(updated)
+
+            for rel in gone:
+                deleted, _ = Document.objects.filter(
+                    Q(relative_path=rel) | Q(relative_path__startswith=rel + os.sep)
+                ).delete()
+                stats['deleted'] += deleted
+            transaction.on_commit(self._schedule_derived)
+        return stats
+
+    def refresh_rules(self):
+        self.rules = DocumentRules()
+
+    # ----------------------------------------------------------------- helpers
+
+    @staticmethod
+    def _current_generation():
+        return Document.objects.aggregate(g=Max('scan_generation'))['g'] or 0
+
+    @staticmethod
+    def _entry(relative_path, full_path):
+        """FileEntry for one file, or None when it no longer exists."""
+        try:
+            st = os.stat(full_path)
+        except FileNotFoundError:
+            return None
+        return FileEntry(
+            patient_dir   = relative_path.split(os.sep)[0],
+            relative_path = relative_path,
+            file_name     = os.path.basename(relative_path),
+            size          = st.st_size,
+            mtime_ns      = st.st_mtime_ns,
+            inode         = st.st_ino,
+        )
+
+    def _classify(self, entry, values, known, created, updated, unchanged):
+        if known is None:
+            created.append(Document(relative_path=entry.relative_path,
+                                    scan_generation=self.generation, **values))
+        elif known[1] != tuple(values[field] for field in MANIFEST_FIELDS):
+            doc = Document(pk=known[0], scan_generation=self.generation, **values)
+            # new content (not just new rules): new revision, so a new OnlyOffice key
+            old_size, old_mtime, _ = known[1][-3:]      # file_size, file_mtime_ns, file_inode
+            doc._content_changed = old_size is not None and (old_size, old_mtime) != (entry.size, entry.mtime_ns)
+            updated.append(doc)
+        else:
+            unchanged.append(known[0])
+
+    def _move(self, old, new):
+        """Rename the row of a moved file, or the rows below a moved folder."""
+        if Document.objects.filter(relative_path=new).exists():
+            return 0
+        moved = Document.objects.filter(relative_path=old).update(relative_path=new)
+        if moved:
+            return moved
+        rows = list(Document.objects.filter(relative_path__startswith=old + os.sep).only('pk', 'relative_path'))
+        for doc in rows:
+            doc.relative_path = new + doc.relative_path[len(old):]
+        Document.objects.bulk_update(rows, ['relative_path'], batch_size=self.chunk_size)
+        return len(rows)
+
+    # ------------------------------------------------------------ chunk writes
+
+    def _create(self, batch):
+        with transaction.atomic():
+            Document.objects.bulk_create(batch, batch_size=self.chunk_size)
+        self.changed.extend(doc.pk for doc in batch)
+        count = len(batch)
+        batch.clear()
+        return count
+
+    def _update(self, batch):
+        now = timezone.now()
+        for doc in batch:
+            doc.updated_at = now      # bulk_update does not run auto_now
+        changed = [doc.pk for doc in batch if doc._content_changed]
+        with transaction.atomic():
+            Document.objects.bulk_update(
+                batch,
+                [*(f.removesuffix('_id') for f in MANIFEST_FIELDS), 'scan_generation', 'updated_at'],
+                batch_size=self.chunk_size,
+            )
+            if changed:
+                Document.objects.filter(pk__in=changed).update(revision=F('revision') + 1)
+        self.changed.extend(changed)
+        count = len(batch)
+        batch.clear()
+        return count
+
+    def _schedule_derived(self):
+        """Queue previews and text extraction for what this run created or changed."""
+        changed, self.changed = self.changed, []
+        if changed:
+            thumbnails.schedule(changed)
+            search_index.schedule(changed)
+
+    def _touch(self, pks):
+        with transaction.atomic():
+            Document.objects.filter(pk__in=pks).update(scan_generation=self.generation)
+        count = len(pks)
+        pks.clear()
+        return count
+
+    def _delete_stale(self, rules, errors):
+        stale = Document.objects.filter(scan_generation__lt=self.generation)
+        protected = [rules.patient(patient_dir) for patient_dir in errors]
+        if protected:
+            stale = stale.exclude(patient_id__in=[pk for pk in protected if pk is not None])
+        deleted = 0
+        while True:
+            pks = list(stale.values_list('pk', flat=True)[:self.chunk_size])
+            if not pks:
+                return deleted
+            with transaction.atomic():
+                Document.objects.filter(pk__in=pks).delete()
+            deleted += len(pks)
@@ -0,0 +1,45 @@
+# apps/emr/files/management/commands/compact_access_logs.py
+from django.core.management.base import BaseCommand, CommandError
+
+from core.db_routers import tenant
+from core.tenant_tasks import ensure_tenant_database, tenant_aliases
+from apps.emr.files.access_retention import ARCHIVE_DAYS, RETENTION_DAYS, compact
+
+
+class Command(BaseCommand):
+    help = ('Move DocumentAccessLog rows older than the archive period to the archive table and its daily '
+            'counts; purge archived rows past the retention period if one is set')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant',
+            dest='tenants',
+            action='append',
+            help='Tenant database alias (repeatable, default: every tenant)',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=ARCHIVE_DAYS,
+            help=f'Days of access rows to keep in the live table (default: {ARCHIVE_DAYS})',
+        )
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=RETENTION_DAYS,
+            help=('Delete archived rows older than this, keeping their daily counts '
+                  f"(default: {'never' if RETENTION_DAYS is None else RETENTION_DAYS})"),
+        )
+
+    def handle(self, *args, **options):
+        for alias in options['tenants'] or tenant_aliases():
+            try:
+                ensure_tenant_database(alias)
+            except LookupError as exc:
+                raise CommandError(str(exc))
+            with tenant(alias):
+                stats = compact(options['days'], alias, options['retention_days'])
+            self.stdout.write(
+                f"{alias}: {stats['rows']} access rows from {stats['days']} days archived "
+                f"({stats['daily']} daily rows), {stats['purged']} archived rows purged"
+            )
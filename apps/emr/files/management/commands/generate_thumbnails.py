@@ -0,0 +1,59 @@
+# apps/emr/files/management/commands/generate_thumbnails.py
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.db_routers import tenant
+from core.tenant_tasks import ensure_tenant_database, tenant_aliases
+from apps.emr.files import thumbnails
+from apps.emr.files.models import Document
+from apps.emr.files.walker import WORKERS
+
+
+class Command(BaseCommand):
+    help = 'Render missing document thumbnails (or, with --all, check every previewable document)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant',
+            dest='tenants',
+            action='append',
+            help='Tenant database alias (repeatable, default: every tenant)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Also re-check documents that have a thumbnail (re-rendered only if their content changed)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=WORKERS,
+            help=f'Documents rendered in parallel (default: {WORKERS})',
+        )
+
+    def handle(self, *args, **options):
+        for alias in options['tenants'] or tenant_aliases():
+            try:
+                ensure_tenant_database(alias)
+            except LookupError as exc:
+                raise CommandError(str(exc))
+            with tenant(alias):
+                qs = Document.objects.filter(file_extension__code__in=thumbnails.PREVIEWABLE)
+                if not options['all']:
+                    qs = qs.filter(thumbnail_sha256='')
+                pks = list(qs.values_list('pk', flat=True))
+                # the pool threads do not inherit the tenant context: enter it in each
+                with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                    results = list(pool.map(lambda pk: self.render(alias, pk), pks))
+            failed = results.count(False)
+            self.stdout.write(f"{alias}: {len(pks) - failed} thumbnails up to date, {failed} failed")
+
+    def render(self, alias, pk):
+        with tenant(alias):
+            try:
+                thumbnails.render(pk)
+                return True
+            except Exception as exc:
+                self.stderr.write(f"{pk}: {exc}")
+                return False
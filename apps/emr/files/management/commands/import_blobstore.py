@@ -0,0 +1,125 @@
+# apps/emr/files/management/commands/import_blobstore.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from core.db_routers import tenant
+from core.tenant_tasks import ensure_tenant_database, tenant_aliases
+from apps.emr.files import blobstore
+from apps.emr.files.models import Document, DocumentVersion
+from apps.emr.files.walker import WORKERS
+
+CHUNK_SIZE = 500
+
+
+def _hash(relative_path):
+    """(sha256, size, stat) of a patient file; None if it is missing or changed while hashed."""
+    path = os.path.join(settings.PATIENT_DATA, relative_path)
+    try:
+        before = os.stat(path)
+        sha256, size = blobstore.hash_file(path)
+        after = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if (before.st_size, before.st_mtime_ns, before.st_ino) != (after.st_size, after.st_mtime_ns, after.st_ino):
+        return None
+    return sha256, size, after
+
+
+class Command(BaseCommand):
+    help = ('Hash patient files into the content-addressed blob store, linking duplicates '
+            'and recording a DocumentVersion for every document without one (re-runnable)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant',
+            dest='tenants',
+            action='append',
+            help='Tenant database alias (repeatable, default: every tenant)',
+        )
+        parser.add_argument(
+            '--allow-copy',
+            action='store_true',
+            help="Store blobs as copies where they cannot be linked (doubles the tree's disk usage)",
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=WORKERS,
+            help=f'Files hashed in parallel (default: {WORKERS})',
+        )
+
+    def handle(self, *args, **options):
+        self.allow_copy = options['allow_copy']
+        if not self.allow_copy and not blobstore.link_supported():
+            raise CommandError(
+                f"BLOB_STORE LINK '{blobstore.LINK}' does not work between {settings.PATIENT_DATA} and "
+                f"{blobstore.ROOT}: every file would be copied. Use a filesystem with reflinks "
+                f"(btrfs, XFS) or run with --allow-copy."
+            )
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for alias in options['tenants'] or tenant_aliases():
+                try:
+                    ensure_tenant_database(alias)
+                except LookupError as exc:
+                    raise CommandError(str(exc))
+                with tenant(alias):
+                    stats = self.import_documents(pool)
+                self.stdout.write(
+                    f"{alias}: {stats['documents']} documents, {stats['blobs']} new blobs, "
+                    f"{stats['duplicates']} duplicates ({stats['saved'] / 2**20:.1f} MiB saved), "
+                    f"{stats['unlinked']} not linkable, {stats['skipped']} missing or changed"
+                )
+
+    def import_documents(self, pool):
+        stats   = {'documents': 0, 'blobs': 0, 'duplicates': 0, 'saved': 0, 'unlinked': 0, 'skipped': 0}
+        pending = (
+            Document.objects
+            .exclude(Exists(DocumentVersion.objects.filter(document=OuterRef('pk'), revision=OuterRef('revision'))))
+            .values_list('pk', 'relative_path')
+            .order_by('pk')
+        )
+        last_pk = None
+        while True:
+            # keyset over pk: rows imported meanwhile drop out of `pending`
+            chunk = list((pending.filter(pk__gt=last_pk) if last_pk else pending)[:CHUNK_SIZE])
+            if not chunk:
+                return stats
+            last_pk = chunk[-1][0]
+
+            # (1) hash in parallel (hashlib releases the GIL on large reads)
+            hashed = pool.map(_hash, [relative_path for _, relative_path in chunk])
+
+            # (2) store / link, one transaction per chunk
+            with transaction.atomic():
+                for (pk, relative_path), result in zip(chunk, hashed):
+                    if result is None:
+                        stats['skipped'] += 1
+                        continue
+                    sha256, size, st = result
+                    full_path = os.path.join(settings.PATIENT_DATA, relative_path)
+                    stored = blobstore.put(full_path, sha256, copy=self.allow_copy)
+                    if stored is None:
+                        stats['unlinked'] += 1          # left as it is, imported by a later run
+                        continue
+                    if stored:
+                        # the patient file is the blob's source: linked already, or a copy
+                        stats['blobs'] += 1
+                    else:
+                        stats['duplicates'] += 1
+                        # re-point the file at the stored blob, but never replace it with a copy
+                        linked = blobstore.checkout(sha256, relative_path, copy=False)
+                        if linked is not None:
+                            if not (blobstore.LINK == 'hardlink' and linked.st_ino == st.st_ino):
+                                stats['saved'] += size
+                            st = linked
+                    # new inode / mtime: keep the indexer from bumping the revision
+                    Document.objects.filter(pk=pk).update(
+                        file_size=st.st_size, file_mtime_ns=st.st_mtime_ns, file_inode=st.st_ino,
+                    )
+                    blobstore.add_version(pk, sha256, size, 'import')
+                    stats['documents'] += 1
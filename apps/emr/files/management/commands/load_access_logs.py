@@ -0,0 +1,62 @@
+# apps/emr/files/management/commands/load_access_logs.py
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.db_routers import tenant
+from core.tenant_tasks import ensure_tenant_database
+from apps.emr.files import audit
+
+CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Load spooled document access events (AUDIT_LOG MODE 'spool') into DocumentAccessLog"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant',
+            dest='tenants',
+            action='append',
+            help='Tenant database alias to load (repeatable, default: every spooled tenant)',
+        )
+
+    def handle(self, *args, **options):
+        tenants = options['tenants']
+        if not tenants:
+            tenants = sorted(os.listdir(audit.SPOOL_DIR)) if os.path.isdir(audit.SPOOL_DIR) else []
+
+        failed = 0
+        for alias in tenants:
+            try:
+                ensure_tenant_database(alias)
+            except LookupError as exc:
+                raise CommandError(str(exc))
+
+            loaded = 0
+            with tenant(alias):
+                for path in audit.claim_spool_files(alias):
+                    try:
+                        loaded += self.load(path, alias)
+                    except Exception as exc:
+                        # set it aside: the next files and tenants still load
+                        failed += 1
+                        target = f'{path[:-len(".loading")]}.failed'
+                        os.rename(path, target)
+                        self.stderr.write(f"{alias}: cannot load {os.path.basename(path)} ({exc}), "
+                                          f"kept as {os.path.basename(target)}")
+            self.stdout.write(f"{alias}: {loaded} access events loaded")
+        if failed:
+            raise CommandError(f"{failed} spool files could not be loaded (*.failed)")
+
+    @staticmethod
+    def load(path, alias):
+        events  = audit.read_spool_file(path)
+        written = 0
+        # one transaction per file: it is removed only once all of it is in
+        with transaction.atomic(using=alias):
+            for i in range(0, len(events), CHUNK_SIZE):
+                written += audit.write(events[i:i + CHUNK_SIZE])
+        os.remove(path)
+        return written
@@ -0,0 +1,40 @@
+# apps/emr/files/management/commands/update_document_index.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.db_routers import tenant
+from core.tenant_tasks import ensure_tenant_database
+from apps.emr.files.indexer import DocumentIndexer
+
+
+class Command(BaseCommand):
+    help = 'Index the patient data folder of one tenant into Document rows (only changed files are written)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant',
+            dest='tenant',
+            default='default',
+            help='Tenant database alias (DatabaseConfig.name, default: default)',
+        )
+        parser.add_argument(
+            '--path',
+            dest='path',
+            help='Patient data folder (default: settings.PATIENT_DATA)',
+        )
+
+    def handle(self, *args, **options):
+        alias = options['tenant']
+        try:
+            ensure_tenant_database(alias)
+        except LookupError as exc:
+            raise CommandError(str(exc))
+
+        base_path = options.get('path') or settings.PATIENT_DATA
+        self.stdout.write(f"Indexing {base_path} into '{alias}'...")
+        with tenant(alias):
+            stats = DocumentIndexer(base_path).run()
+
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f"{value} {name.replace('_', ' ')}" for name, value in stats.items())
+        ))
@@ -0,0 +1,41 @@
+# apps/emr/files/management/commands/update_search_index.py
+from django.core.management.base import BaseCommand, CommandError
+
+from core.db_routers import tenant
+from core.tenant_tasks import ensure_tenant_database, tenant_aliases
+from apps.emr.files import search_index
+from apps.emr.files.models import Document
+
+
+class Command(BaseCommand):
+    help = ('Extract the text of new or changed documents into the full-text index '
+            'and drop deleted ones (re-runnable)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant',
+            dest='tenants',
+            action='append',
+            help='Tenant database alias (repeatable, default: every tenant)',
+        )
+
+    def handle(self, *args, **options):
+        for alias in options['tenants'] or tenant_aliases():
+            try:
+                ensure_tenant_database(alias)
+            except LookupError as exc:
+                raise CommandError(str(exc))
+            indexed = failed = 0
+            with tenant(alias), search_index.connect(alias) as conn:
+                pks = (Document.objects.filter(file_extension__code__in=search_index.EXTRACTABLE)
+                       .values_list('pk', flat=True))
+                for i, pk in enumerate(pks.iterator(chunk_size=2000), 1):
+                    try:
+                        indexed += search_index.index_document(pk, conn)
+                    except Exception as exc:
+                        failed += 1
+                        self.stderr.write(f"{pk}: {exc}")
+                    if i % search_index.BATCH_SIZE == 0:
+                        conn.commit()     # keep progress, let the workers write in between
+                pruned = search_index.prune(conn)
+            self.stdout.write(f"{alias}: {indexed} documents (re-)indexed, {pruned} removed, {failed} failed")
@@ -0,0 +1,122 @@
+# apps/emr/files/management/commands/watch_documents.py
+import time
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from core.db_routers import tenant
+from core.tenant_tasks import ensure_tenant_database
+from apps.emr.files.indexer import DocumentIndexer
+from apps.emr.files.watcher import Debouncer, InotifyWatcher, PollingWatcher, is_network_mount
+
+logger = logging.getLogger(__name__)
+
+RULES_TTL = 60      # seconds before patients / types / protocol rules are reloaded
+
+
+class Command(BaseCommand):
+    help = 'Watch the patient data folder of one tenant and keep Document rows up to date'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant',
+            dest='tenant',
+            default='default',
+            help='Tenant database alias (DatabaseConfig.name, default: default)',
+        )
+        parser.add_argument(
+            '--path',
+            dest='path',
+            help='Patient data folder (default: settings.PATIENT_DATA)',
+        )
+        parser.add_argument(
+            '--poll',
+            action='store_true',
+            dest='poll',
+            help='Poll instead of using inotify (automatic on network mounts)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=30,
+            dest='interval',
+            help='Seconds between polls (default: 30)',
+        )
+        parser.add_argument(
+            '--debounce',
+            type=float,
+            default=2,
+            dest='debounce',
+            help='Quiet seconds before a burst of changes is applied (default: 2)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            dest='batch_size',
+            help='Paths per transaction (default: 200)',
+        )
+
+    def handle(self, *args, **options):
+        alias = options['tenant']
+        try:
+            ensure_tenant_database(alias)
+        except LookupError as exc:
+            raise CommandError(str(exc))
+        base_path = options.get('path') or settings.PATIENT_DATA
+
+        # 1) change source
+        if options['poll'] or is_network_mount(base_path):
+            source = PollingWatcher(base_path, options['interval'])
+            self.stdout.write(f"Polling {base_path} every {options['interval']:g}s for '{alias}'")
+        else:
+            try:
+                source = InotifyWatcher(base_path)
+                self.stdout.write(f"Watching {base_path} (inotify) for '{alias}'")
+            except (OSError, AttributeError) as exc:
+                source = PollingWatcher(base_path, options['interval'])
+                self.stdout.write(f"inotify unavailable ({exc}); polling {base_path} for '{alias}'")
+
+        debouncer  = Debouncer(quiet=options['debounce'], max_wait=options['debounce'] * 5)
+        indexer    = DocumentIndexer(base_path)
+        batch_size = options['batch_size']
+        rules_at   = 0
+
+        # 2) event loop: collect, debounce, apply in small transactions
+        try:
+            with tenant(alias):
+                while True:
+                    for change in source.read(timeout=options['debounce'] / 2):
+                        debouncer.add(change)
+                    batch = debouncer.ready()
+                    if batch is None:
+                        continue
+
+                    close_old_connections()
+                    if time.monotonic() - rules_at > RULES_TTL:
+                        indexer.refresh_rules()
+                        rules_at = time.monotonic()
+                    try:
+                        if batch.rescan:
+                            self._report('rescan', indexer.run())
+                            continue
+                        paths = sorted(batch.paths)
+                        for i in range(0, max(len(paths), 1), batch_size):
+                            moves = batch.moves if i == 0 else ()
+                            self._report(f"{len(paths[i:i + batch_size]) + len(moves)} path(s)",
+                                         indexer.apply(paths[i:i + batch_size], moves))
+                    except Exception:
+                        # keep watching; the next full index run repairs what was missed
+                        logger.exception("watch_documents: batch failed")
+                        self.stderr.write(self.style.ERROR("Batch failed, see log"))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            source.close()
+
+    def _report(self, what, stats):
+        changed = {name: value for name, value in stats.items() if value and name != 'unchanged'}
+        if changed:
+            self.stdout.write(f"{what}: " + ', '.join(f"{value} {name}" for name, value in changed.items()))
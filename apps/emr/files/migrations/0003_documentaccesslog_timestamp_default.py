@@ -0,0 +1,19 @@
+# Generated by Django 4.2.8 on 2026-10-18 21:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0002_document_index_manifest'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='documentaccesslog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.8 on 2026-10-18 21:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('files', '0003_documentaccesslog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentAccessDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('action', models.CharField(choices=[('view', 'Viewed'), ('edit', 'Edited'), ('save', 'Saved'), ('comment', 'Annotated'), ('download', 'Downloaded'), ('print', 'Printed'), ('fill', 'Filled')], max_length=16)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('first_at', models.DateTimeField()),
+                ('last_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Document Access (daily)',
+                'verbose_name_plural': 'Document Access (daily)',
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='documentaccesslog',
+            index=models.Index(fields=['document', 'timestamp'], name='files_access_doc_time'),
+        ),
+        migrations.AddIndex(
+            model_name='documentaccesslog',
+            index=models.Index(fields=['timestamp'], name='files_access_time'),
+        ),
+        migrations.AddField(
+            model_name='documentaccessdaily',
+            name='document',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_access', to='files.document'),
+        ),
+        migrations.AddField(
+            model_name='documentaccessdaily',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='documentaccessdaily',
+            index=models.Index(fields=['document', 'day'], name='files_daily_doc_day'),
+        ),
+        migrations.AddIndex(
+            model_name='documentaccessdaily',
+            index=models.Index(fields=['day'], name='files_daily_day'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-18 21:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0007_documentversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='thumbnail_sha256',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.8 on 2026-10-18 21:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('files', '0008_document_thumbnail_sha256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentAccessLogArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('view', 'Viewed'), ('edit', 'Edited'), ('save', 'Saved'), ('comment', 'Annotated'), ('download', 'Downloaded'), ('print', 'Printed'), ('fill', 'Filled')], max_length=16)),
+                ('timestamp', models.DateTimeField(editable=False)),
+                ('info', models.JSONField(blank=True, null=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_access_logs', to='files.document')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Document Access (archived)',
+                'verbose_name_plural': 'Document Access (archived)',
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['document', 'timestamp'], name='files_archive_doc_time'), models.Index(fields=['timestamp'], name='files_archive_time')],
+            },
+        ),
+    ]
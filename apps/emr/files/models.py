@@ -33,6 +33,7 @@ from django.contrib.auth.models import Group
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.conf import settings
+from django.utils import timezone
 
 
 class FileExtension(models.Model):
@@ -104,18 +105,9 @@ class PermissionProtocol(models.Model):
         Return a dict mapping each PermissionFlag.code to a boolean
         indicating if the user has that permission under this protocol.
         """
-        # Initialize all flags to False
-        flags = {pf.code: False for pf in PermissionFlag.objects.all()}
-        # Fetch all ProtocolGroupPermission entries for user's groups
-        qs = ProtocolGroupPermission.objects.filter(
-            protocol=self,
-            group__in=user.groups.all()
-        ).prefetch_related('flags')
-        # OR-merge each flag
-        for pgp in qs:
-            for flag in pgp.flags.all():
-                flags[flag.code] = True
-        return flags
+        # OR-merge over the user's groups, from the cached permission matrix
+        from apps.emr.files.permissions import resolver_for
+        return resolver_for(user).for_protocol(self.pk)
 
     def __str__(self):
         return self.name
@@ -206,6 +198,19 @@ class Document(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # index manifest (see apps/emr/files/indexer.py): the file as last seen on disk
+    file_size       = models.BigIntegerField(null=True, blank=True, editable=False)
+    file_mtime_ns   = models.BigIntegerField(null=True, blank=True, editable=False)
+    file_inode      = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    scan_generation = models.PositiveIntegerField(default=0, db_index=True, editable=False)
+    # bumped whenever the file's content changes; part of the OnlyOffice document key
+    revision        = models.PositiveIntegerField(default=1, editable=False)
+    # SHA-256 of the current content, i.e. the blob relative_path resolves to
+    # (see apps/emr/files/blobstore.py); empty until the file has been hashed
+    sha256          = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    # content hash the preview was rendered from (apps/emr/files/thumbnails.py)
+    thumbnail_sha256 = models.CharField(max_length=64, blank=True, editable=False)
+
     class Meta:
         unique_together = ('patient', 'relative_path')
         indexes = [
@@ -220,6 +225,69 @@ class Document(models.Model):
         return f"{self.patient} – {self.relative_path}"
 
 
+class DocumentVersion(models.Model):
+    """
+    One immutable state of a document's content: the blob (by SHA-256) that
+    relative_path resolved to at `revision`. Blobs are never overwritten, so
+    every version stays readable (blobstore.open_version).
+    """
+    SOURCE_CHOICES = [
+        ('import', 'Import'),
+        ('save', 'Editor save'),
+    ]
+
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='versions'
+    )
+    revision = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    source = models.CharField(max_length=8, choices=SOURCE_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('document', 'revision')
+        ordering = ['document', '-revision']
+
+    def __str__(self):
+        return f"{self.document_id} r{self.revision} ({self.sha256[:12]})"
+
+
+class DocumentSaveJob(models.Model):
+    """
+    One Document Server save callback (status 2 / 6), carried out by the
+    files.save_document task (apps/emr/files/saving.py). Keyed by the DS
+    document key, so repeated callbacks for the same version are no-ops.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    key = models.CharField(max_length=128, unique=True)
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='save_jobs'
+    )
+    url = models.URLField(max_length=2000)
+    ds_status = models.PositiveSmallIntegerField()
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default='pending', db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.status})"
+
+
 class DocumentAccessLog(models.Model):
     """
     Logs each time a document is viewed, edited, or saved for auditing.
@@ -246,11 +314,87 @@ class DocumentAccessLog(models.Model):
         on_delete=models.SET_NULL
     )
     action = models.CharField(max_length=16, choices=ACTION_CHOICES)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # not auto_now_add: batched / spooled events keep the time they happened
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     info = models.JSONField(blank=True, null=True)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['document', 'timestamp'], name='files_access_doc_time'),
+            models.Index(fields=['timestamp'], name='files_access_time'),
+        ]
 
     def __str__(self):
         return f"{self.document} {self.action} by {self.user} at {self.timestamp}"
+
+
+class DocumentAccessLogArchive(models.Model):
+    """
+    DocumentAccessLog rows older than AUDIT_LOG['ARCHIVE_DAYS'], moved out of
+    the live table by compaction (apps/emr/files/access_retention.py). Kept
+    until AUDIT_LOG['RETENTION_DAYS'], i.e. forever by default.
+    """
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='archived_access_logs'
+    )
+    user = models.ForeignKey(
+        get_user_model(),
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL
+    )
+    action = models.CharField(max_length=16, choices=DocumentAccessLog.ACTION_CHOICES)
+    timestamp = models.DateTimeField(editable=False)
+    info = models.JSONField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['document', 'timestamp'], name='files_archive_doc_time'),
+            models.Index(fields=['timestamp'], name='files_archive_time'),
+        ]
+        verbose_name = 'Document Access (archived)'
+        verbose_name_plural = 'Document Access (archived)'
+
+    def __str__(self):
+        return f"{self.document} {self.action} by {self.user} at {self.timestamp}"
+
+
+class DocumentAccessDaily(models.Model):
+    """
+    Daily access counts per document, user and action of the archived
+    DocumentAccessLog rows, written by compaction alongside the archive
+    (apps/emr/files/access_retention.py); all that is left of a day once its
+    archived rows are purged (AUDIT_LOG['RETENTION_DAYS']).
+    """
+    day = models.DateField()
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='daily_access'
+    )
+    user = models.ForeignKey(
+        get_user_model(),
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL
+    )
+    action = models.CharField(max_length=16, choices=DocumentAccessLog.ACTION_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    first_at = models.DateTimeField()
+    last_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-day']
+        indexes = [
+            models.Index(fields=['document', 'day'], name='files_daily_doc_day'),
+            models.Index(fields=['day'], name='files_daily_day'),
+        ]
+        verbose_name = 'Document Access (daily)'
+        verbose_name_plural = 'Document Access (daily)'
+
+    def __str__(self):
+        return f"{self.document} {self.action} by {self.user} on {self.day}: {self.count}"
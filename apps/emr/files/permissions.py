@@ -0,0 +1,87 @@
+# apps/emr/files/permissions.py
+# OnlyOffice permission flags per (user, document), resolved in bulk.
+#
+# A user's flags under a protocol are the OR of the flags of all their
+# groups (PermissionProtocol.get_perms_for_user). Instead of two queries per
+# document, the whole (group set × protocol) → flags matrix is loaded with
+# one query, memoised on the user object for the rest of the request and in
+# the tenant cache for every user with the same groups. The cache entry is
+# dropped when a protocol, a group permission (or its flags) or a flag
+# changes; see install().
+
+from django.db.models.signals import m2m_changed
+
+from core.db_replicas import primary_of
+from core.tenant_cache import invalidate_on, invalidate_tags, tenant_cached
+from apps.emr.files.models import PermissionFlag, PermissionProtocol, ProtocolGroupPermission
+
+TAGS = [model._meta.label_lower for model in (PermissionFlag, PermissionProtocol, ProtocolGroupPermission)]
+
+
+@tenant_cached(timeout=3600, tags=TAGS, key=lambda group_ids: group_ids)
+def permission_matrix(group_ids):
+    """
+    (all flag codes, {protocol_id: granted flag codes}) for the groups in
+    `group_ids` (a sorted tuple), from a single query.
+    """
+    wanted  = set(group_ids)
+    codes   = []
+    granted = {}
+    rows = PermissionFlag.objects.order_by('code').values_list(
+        'code', 'group_permissions__protocol_id', 'group_permissions__group_id',
+    )
+    for code, protocol_id, group_id in rows:
+        if not codes or codes[-1] != code:
+            codes.append(code)
+        if group_id in wanted:
+            granted.setdefault(protocol_id, set()).add(code)
+    return codes, {protocol_id: sorted(flags) for protocol_id, flags in granted.items()}
+
+
+class PermissionResolver:
+    """The permission matrix of one user, loaded on first use."""
+
+    def __init__(self, user):
+        self.user    = user
+        self._matrix = None
+
+    @property
+    def group_ids(self):
+        if not self.user.is_authenticated:
+            return ()
+        return tuple(sorted(self.user.groups.values_list('pk', flat=True)))
+
+    def matrix(self):
+        if self._matrix is None:
+            codes, granted = permission_matrix(self.group_ids)
+            self._matrix = (codes, {protocol_id: set(flags) for protocol_id, flags in granted.items()})
+        return self._matrix
+
+    def for_protocol(self, protocol_id):
+        """{flag code: bool} for every PermissionFlag under `protocol_id`."""
+        codes, granted = self.matrix()
+        flags = granted.get(protocol_id, ())
+        return {code: code in flags for code in codes}
+
+
+def resolver_for(user):
+    """The user's PermissionResolver, kept on the user object (one per request)."""
+    resolver = getattr(user, '_permission_resolver', None)
+    if resolver is None:
+        resolver = user._permission_resolver = PermissionResolver(user)
+    return resolver
+
+
+def _flags_changed(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        db = instance._state.db
+        invalidate_tags(*TAGS, tenant=primary_of(db) if db else None)
+
+
+def install():
+    """Called from FilesConfig.ready()."""
+    for model in (PermissionFlag, PermissionProtocol, ProtocolGroupPermission):
+        invalidate_on(model, *TAGS)
+    # flags are added to a group permission after it is saved
+    m2m_changed.connect(_flags_changed, sender=ProtocolGroupPermission.flags.through,
+                        dispatch_uid='files.permissions')
@@ -0,0 +1,128 @@
+# apps/emr/files/protocol_matcher.py
+# Which PermissionProtocol a document gets, from its relative path.
+#
+# The ProtocolAssignment globs of a tenant are compiled once and indexed by
+# their literal prefix (the part before the first wildcard): a lookup only
+# tries the rules whose prefix the path starts with, still in rule order
+# (path_pattern, as the indexer has always used), so the first matching rule
+# wins as before while the cost no longer grows with the number of rules.
+#
+# Compiled matchers are cached per process and tenant. Saving or deleting a
+# ProtocolAssignment drops this process' copy at once and bumps the
+# 'files.protocolassignment' cache tag (core.tenant_cache.invalidate_on);
+# other processes compare that tag at most every CHECK_INTERVAL seconds.
+# QuerySet.update()/bulk_* changes must call invalidate() themselves.
+
+import re
+import heapq
+import time
+import fnmatch
+import logging
+import threading
+
+from django.db.models.signals import post_delete, post_save
+
+from core.db_replicas import primary_of
+from core.tenant_cache import current_alias, invalidate_on, invalidate_tags, tag_versions
+from apps.emr.files.models import ProtocolAssignment
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL = 30      # seconds between checks of the shared invalidation tag
+
+TAG = ProtocolAssignment._meta.label_lower
+
+_WILDCARD = re.compile(r'[*?\[]')
+
+
+class ProtocolMatcher:
+    """Ordered (path_pattern, protocol_id) rules, indexed by literal prefix."""
+
+    def __init__(self, assignments):
+        self.assignments = list(assignments)
+        self._rules = {}        # literal prefix → [(rule index, compiled glob, protocol_id), …]
+        for index, (pattern, protocol_id) in enumerate(self.assignments):
+            prefix = _WILDCARD.split(pattern, 1)[0]
+            regex  = re.compile(fnmatch.translate(pattern))
+            self._rules.setdefault(prefix, []).append((index, regex, protocol_id))
+        self._lengths = sorted({len(prefix) for prefix in self._rules})
+
+    def __len__(self):
+        return len(self.assignments)
+
+    def match(self, relative_path):
+        """protocol_id of the first rule whose glob matches, or None."""
+        candidates = [
+            self._rules[relative_path[:length]]
+            for length in self._lengths
+            if length <= len(relative_path) and relative_path[:length] in self._rules
+        ]
+        for _, regex, protocol_id in (candidates[0] if len(candidates) == 1 else heapq.merge(*candidates)):
+            if regex.match(relative_path):
+                return protocol_id
+        return None
+
+
+_lock     = threading.Lock()
+_matchers = {}        # tenant alias → (tag version, checked at, ProtocolMatcher)
+
+
+def get_matcher(tenant=None):
+    """The compiled matcher of `tenant` (default: the current one)."""
+    alias = tenant or current_alias()
+    now   = time.monotonic()
+    cached = _matchers.get(alias)
+    if cached is not None and now - cached[1] < CHECK_INTERVAL:
+        return cached[2]
+
+    try:
+        version = tag_versions([TAG], tenant=alias)[0]
+    except Exception:
+        logger.exception("Protocol matcher: could not read the invalidation tag for %s", alias)
+        version = None
+    if cached is not None and version is not None and version == cached[0]:
+        _matchers[alias] = (version, now, cached[2])
+        return cached[2]
+
+    matcher = ProtocolMatcher(
+        ProtocolAssignment.objects.using(alias).order_by('path_pattern').values_list('path_pattern', 'protocol_id')
+    )
+    with _lock:
+        _matchers[alias] = (version, now, matcher)
+    return matcher
+
+
+def match(relative_path, default=None, tenant=None):
+    """
+    protocol_id for a new Document at `relative_path`. When no rule matches,
+    `default` is returned (with a warning, so the missing rule gets added).
+    """
+    protocol_id = get_matcher(tenant).match(relative_path)
+    if protocol_id is None and default is not None:
+        logger.warning("No ProtocolAssignment matches %s, using protocol %s", relative_path, default)
+        return default
+    return protocol_id
+
+
+def invalidate(tenant=None):
+    """Forget the compiled matcher of `tenant` here and in every other process."""
+    alias = tenant or current_alias()
+    with _lock:
+        _matchers.pop(alias, None)
+    invalidate_tags(TAG, tenant=alias)
+
+
+def _forget(sender, instance, **kwargs):
+    db = instance._state.db
+    with _lock:
+        if db:
+            _matchers.pop(primary_of(db), None)
+        else:
+            _matchers.clear()
+
+
+def install():
+    """Called from FilesConfig.ready()."""
+    invalidate_on(ProtocolAssignment)
+    post_save.connect(_forget, sender=ProtocolAssignment, dispatch_uid='files.protocol_matcher')
+    post_delete.connect(_forget, sender=ProtocolAssignment, dispatch_uid='files.protocol_matcher')
@@ -0,0 +1,181 @@
+# apps/emr/files/saving.py
+# Document Server saves, off the request path.
+#
+# onlyoffice_callback only records a DocumentSaveJob (one per DS key) and
+# returns {error: 0}; the files.save_document task then
+#   1) streams the edited file in chunks to PATIENT_DATA/.incoming/ (same
+#      filesystem, outside every patient folder, so the indexer ignores it),
+#      hashing it on the way,
+#   2) checks the size against Content-Length and what landed on disk,
+#      fsyncs, stores it as a blob and renames a link to it over the patient
+#      file (readers see the old or the new file, never half of one; see
+#      apps/emr/files/blobstore.py),
+#   3) updates the stat manifest and queues a new thumbnail and text
+#      extraction. Only the final save (status 2, editing session closed)
+#      bumps Document.revision, i.e. changes the document key, and records
+#      the DocumentVersion; a force-save (status 6) arrives while the
+#      session is still open under the current key, so it only stores the
+#      content.
+# A callback repeated for the same key, URL and status is a no-op; a new URL
+# for the same key (another force-save, then the final save) re-queues the
+# job. Failed downloads are retried with backoff, then the job is marked
+# 'failed'.
+
+import os
+import time
+import uuid
+import hashlib
+import logging
+
+import jwt
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.emr.files import audit, blobstore, search_index, thumbnails
+from apps.emr.files.models import Document, DocumentSaveJob
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE       = 256 * 1024
+DOWNLOAD_TIMEOUT = (10, 60)      # connect, and between two chunks
+
+# ONLYOFFICE callback statuses
+FINAL_SAVE = 2       # editing session closed, changes saved
+FORCE_SAVE = 6       # saved while the session is still open
+
+
+class SaveError(Exception):
+    """A save attempt failed and may be retried."""
+
+
+def incoming_dir():
+    return os.path.join(settings.PATIENT_DATA, '.incoming')
+
+
+def enqueue(document, key, url, ds_status):
+    """Record the save job for `key` and start it once the transaction commits."""
+    with transaction.atomic():
+        job, created = DocumentSaveJob.objects.select_for_update().get_or_create(
+            key=key, defaults={'document': document, 'url': url, 'ds_status': ds_status},
+        )
+        if not created:
+            if job.url == url and job.ds_status == ds_status and job.status != 'failed':
+                logger.info("Save callback for %s repeated (%s), ignored", key, job.status)
+                return job
+            job.url, job.ds_status = url, ds_status
+            job.status, job.attempts, job.last_error = 'pending', 0, ''
+            job.save()
+    transaction.on_commit(lambda: _dispatch(job.pk))
+    return job
+
+
+def _dispatch(job_id):
+    from apps.emr.files.tasks import save_document
+    try:
+        save_document.delay(job_id)
+    except Exception:
+        # no broker: do it here rather than lose the edit
+        logger.exception("Save job %s: could not queue, running it inline", job_id)
+        try:
+            run(job_id, final=True)
+        except SaveError:
+            pass
+
+
+def run(job_id, final=False):
+    """
+    Carry out one attempt of a save job. Raises SaveError when it failed and
+    `final` is false (the caller retries); otherwise the job ends 'failed'.
+    """
+    with transaction.atomic():
+        job = DocumentSaveJob.objects.select_for_update().get(pk=job_id)
+        if job.status == 'done':
+            return job
+        job.status    = 'running'
+        job.attempts += 1
+        job.save(update_fields=['status', 'attempts', 'updated_at'])
+    url, ds_status = job.url, job.ds_status
+
+    tmp_path = None
+    try:
+        tmp_path, size, digest = download(url, job.key)
+        with transaction.atomic():
+            job = DocumentSaveJob.objects.select_for_update().select_related('document').get(pk=job_id)
+            if (job.url, job.ds_status) != (url, ds_status):
+                # a newer callback arrived meanwhile; its own run writes the file
+                os.remove(tmp_path)
+                return job
+            doc = job.document
+            blobstore.put(tmp_path, digest, move=True)
+            tmp_path = None
+            st = blobstore.checkout(digest, doc.relative_path)
+            # the new stat keeps the indexer from bumping the revision itself
+            Document.objects.filter(pk=doc.pk).update(
+                file_size     = st.st_size,
+                file_mtime_ns = st.st_mtime_ns,
+                file_inode    = st.st_ino,
+                updated_at    = timezone.now(),
+            )
+            if ds_status == FINAL_SAVE:
+                Document.objects.filter(pk=doc.pk).update(revision=F('revision') + 1)
+                blobstore.add_version(doc.pk, digest, size, 'save')
+            else:
+                # same key, same revision: its DocumentVersion keeps the opened content
+                Document.objects.filter(pk=doc.pk).update(sha256=digest)
+            transaction.on_commit(lambda: thumbnails.schedule([doc.pk]))
+            transaction.on_commit(lambda: search_index.schedule([doc.pk]))
+            job.status, job.size, job.sha256, job.last_error = 'done', size, digest, ''
+            job.save(update_fields=['status', 'size', 'sha256', 'last_error', 'updated_at'])
+        audit.record(doc, None, 'save' if ds_status == FORCE_SAVE else 'edit',
+                     info={'status': ds_status, 'sha256': digest})
+        logger.info("Saved %s (%d bytes, sha256 %s)", doc.relative_path, size, digest)
+        return job
+    except Exception as exc:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        DocumentSaveJob.objects.filter(pk=job_id).update(
+            status='failed' if final else 'pending', last_error=str(exc)[:2000], updated_at=timezone.now(),
+        )
+        logger.warning("Save job %s attempt %d failed: %s", job.key, job.attempts, exc)
+        if final:
+            return None
+        raise SaveError(str(exc)) from exc
+
+
+def download(url, key):
+    """Stream `url` to a temp file under incoming_dir(); returns (path, size, sha256)."""
+    token = jwt.encode({'url': url, 'exp': int(time.time()) + 300}, settings.ONLYOFFICE_JWT_SECRET, algorithm='HS256')
+    if isinstance(token, bytes):
+        token = token.decode()
+
+    os.makedirs(incoming_dir(), exist_ok=True)
+    path   = os.path.join(incoming_dir(), f'{key}.{uuid.uuid4().hex}.part')
+    digest = hashlib.sha256()
+    size   = 0
+    try:
+        with requests.get(url, headers={'Authorization': f'Bearer {token}'},
+                          stream=True, timeout=DOWNLOAD_TIMEOUT) as resp:
+            resp.raise_for_status()
+            expected = resp.headers.get('Content-Length')
+            with open(path, 'wb') as fh:
+                for chunk in resp.iter_content(CHUNK_SIZE):
+                    fh.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                fh.flush()
+                os.fsync(fh.fileno())
+        if expected is not None and int(expected) != size:
+            raise SaveError(f"truncated download: {size} of {expected} bytes")
+        if os.path.getsize(path) != size:
+            raise SaveError(f"short write: {os.path.getsize(path)} of {size} bytes")
+        if size == 0:
+            raise SaveError("empty download")
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return path, size, digest.hexdigest()
+
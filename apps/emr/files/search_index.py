@@ -0,0 +1,234 @@
+# apps/emr/files/search_index.py
+# Full-text search over document contents.
+#
+# Text is extracted from PDFs (poppler's pdftotext), .docx files and plain
+# text files, normalised (Persian / Arabic letter forms, diacritics, ZWNJ,
+# digits) and stored in a SQLite FTS5 sidecar per tenant database:
+# SEARCH_INDEX['DIR']/<DatabaseConfig.name>.sqlite3, whichever alias the
+# database is reached under (see core.tenant_cache.tenant_id()). Each row keeps
+# the content hash it was extracted from, so a document is extracted again
+# only when it changes.
+#
+# The files.index_document_text task is scheduled with the thumbnails (new or
+# changed documents, editor saves); `manage.py update_search_index` fills in
+# the rest and prunes deleted documents. search() ranks with bm25 (title
+# weighs more than body) and returns snippets; scanned PDFs without a text
+# layer have only their title indexed.
+
+import os
+import re
+import html
+import zipfile
+import logging
+import sqlite3
+import subprocess
+import contextlib
+
+from django.conf import settings
+from django.utils import timezone
+
+from apps.emr.files import blobstore
+from apps.emr.files.models import Document
+from core.tenant_cache import tenant_id
+
+logger = logging.getLogger(__name__)
+
+_config   = getattr(settings, 'SEARCH_INDEX', {})
+DIR       = _config.get('DIR') or os.path.join(settings.PATIENT_DATA, '.search')
+PDFTOTEXT = _config.get('PDFTOTEXT', 'pdftotext')
+TIMEOUT   = _config.get('TIMEOUT', 60)           # seconds per document
+
+MAX_CHARS  = 2_000_000      # text kept per document
+BATCH_SIZE = 100            # documents per files.index_document_text task
+MAX_IDS    = 1000           # matches considered by search_ids()
+
+TEXT_EXTENSIONS = {'txt', 'md', 'csv', 'tex', 'html', 'htm', 'xml', 'json'}
+EXTRACTABLE     = TEXT_EXTENSIONS | {'pdf', 'docx'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS document (
+    rowid       INTEGER PRIMARY KEY,
+    document_id TEXT NOT NULL UNIQUE,
+    patient_id  INTEGER NOT NULL,
+    sha256      TEXT NOT NULL,
+    indexed_at  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS document_patient ON document (patient_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS document_text USING fts5(
+    title, body, tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# snippet() markers, replaced by <mark> once the snippet is HTML-escaped
+_MARK_START, _MARK_END = '\ue000', '\ue001'
+
+
+# ----------------------------------------------------------- normalisation
+
+_CHAR_MAP = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی',          # Arabic yeh forms → Persian yeh
+    'ك': 'ک',                              # Arabic kaf → keheh
+    'ة': 'ه', 'ۀ': 'ه',                     # teh marbuta, heh with yeh
+    'أ': 'ا', 'إ': 'ا', 'ٱ': 'ا',
+    'ؤ': 'و',
+    '\u200c': None, '\u200d': None,      # ZWNJ / ZWJ: "می‌شود" = "میشود"
+    '\u0640': None,                      # tatweel
+    **{chr(0x06F0 + i): str(i) for i in range(10)},     # Persian digits
+    **{chr(0x0660 + i): str(i) for i in range(10)},     # Arabic-Indic digits
+})
+_HARAKAT = re.compile('[\u064b-\u065f\u0670]')   # short vowels, tanwin, shadda, …
+
+
+def normalize(text):
+    """Fold the letter variants a Persian query and a document may disagree on."""
+    return _HARAKAT.sub('', text.translate(_CHAR_MAP))
+
+
+def match_query(query):
+    """FTS5 query for free text: every word must match, the last one as a prefix."""
+    words = re.findall(r'\w+', normalize(query))
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+# ------------------------------------------------------------------ sidecar
+
+def index_path(alias=None):
+    """Sidecar of the tenant database behind `alias` (default: the current one)."""
+    return os.path.join(DIR, f'{tenant_id(alias)}.sqlite3')
+
+
+@contextlib.contextmanager
+def connect(alias=None):
+    """Connection to the tenant's index (created on first use), committed on exit."""
+    os.makedirs(DIR, exist_ok=True)
+    conn = sqlite3.connect(index_path(alias), timeout=30)
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def schedule(document_ids):
+    """Queue text extraction for documents (no-op without a broker)."""
+    ids = [str(pk) for pk in document_ids]
+    from apps.emr.files.tasks import index_document_text
+    for i in range(0, len(ids), BATCH_SIZE):
+        try:
+            index_document_text.delay(ids[i:i + BATCH_SIZE])
+        except Exception as exc:
+            logger.warning("Search index: cannot queue %d documents (%s); run update_search_index", len(ids) - i, exc)
+            return
+
+
+def index_document(document_id, conn):
+    """
+    Bring the document's row up to date with its content; returns True if
+    text was (re-)extracted, False if it was current or is not extractable.
+    """
+    doc = Document.objects.select_related('file_extension').get(pk=document_id)
+    extension = doc.file_extension.code.lower()
+    if extension not in EXTRACTABLE:
+        return False
+
+    sha256 = blobstore.content_sha256(doc)
+    row = conn.execute('SELECT rowid, sha256 FROM document WHERE document_id = ?', (str(doc.pk),)).fetchone()
+    if row is not None and row[1] == sha256:
+        return False
+
+    body  = normalize(extract_text(os.path.join(settings.PATIENT_DATA, doc.relative_path), extension))
+    title = normalize(os.path.splitext(doc.file_name)[0])
+    now   = timezone.now().isoformat()
+    if row is None:
+        rowid = conn.execute(
+            'INSERT INTO document (document_id, patient_id, sha256, indexed_at) VALUES (?, ?, ?, ?)',
+            (str(doc.pk), doc.patient_id, sha256, now),
+        ).lastrowid
+    else:
+        rowid = row[0]
+        conn.execute('UPDATE document SET patient_id = ?, sha256 = ?, indexed_at = ? WHERE rowid = ?',
+                     (doc.patient_id, sha256, now, rowid))
+        conn.execute('DELETE FROM document_text WHERE rowid = ?', (rowid,))
+    conn.execute('INSERT INTO document_text (rowid, title, body) VALUES (?, ?, ?)', (rowid, title, body))
+    return True
+
+
+def prune(conn):
+    """Drop the rows of documents that no longer exist; returns how many."""
+    indexed = [row[0] for row in conn.execute('SELECT document_id FROM document')]
+    existing = set()
+    for i in range(0, len(indexed), 1000):
+        existing.update(str(pk) for pk in Document.objects.filter(pk__in=indexed[i:i + 1000]).values_list('pk', flat=True))
+    gone = [document_id for document_id in indexed if document_id not in existing]
+    for document_id in gone:
+        conn.execute('DELETE FROM document_text WHERE rowid = (SELECT rowid FROM document WHERE document_id = ?)',
+                     (document_id,))
+        conn.execute('DELETE FROM document WHERE document_id = ?', (document_id,))
+    return len(gone)
+
+
+# -------------------------------------------------------------- extraction
+
+def extract_text(path, extension):
+    if extension == 'pdf':
+        result = subprocess.run(
+            [PDFTOTEXT, '-q', '-enc', 'UTF-8', path, '-'],
+            check=True, timeout=TIMEOUT, capture_output=True,
+        )
+        text = result.stdout.decode('utf-8', 'replace')
+    elif extension == 'docx':
+        with zipfile.ZipFile(path) as archive:
+            xml = archive.read('word/document.xml').decode('utf-8', 'replace')
+        # paragraphs and tabs become whitespace; runs inside a word join up
+        xml  = re.sub(r'</w:p>|<w:br/>', '\n', re.sub(r'<w:tab/>', ' ', xml))
+        text = html.unescape(re.sub(r'<[^>]+>', '', xml))
+    else:
+        with open(path, encoding='utf-8', errors='replace') as fh:
+            text = fh.read(MAX_CHARS)
+    return text[:MAX_CHARS]
+
+
+# ------------------------------------------------------------------- search
+
+def search(query, patient_id=None, limit=20, alias=None):
+    """
+    Best matches first: [{'document_id', 'rank', 'snippet'}, …], the snippet
+    HTML-escaped with the matched words in <mark>.
+    """
+    fts_query = match_query(query)
+    if fts_query is None or not os.path.exists(index_path(alias)):
+        return []
+    sql = (
+        "SELECT d.document_id, bm25(document_text, 5.0, 1.0) AS rank, "
+        f"       snippet(document_text, -1, '{_MARK_START}', '{_MARK_END}', '…', 16) "
+        "FROM document_text JOIN document d ON d.rowid = document_text.rowid "
+        "WHERE document_text MATCH ?"
+    )
+    params = [fts_query]
+    if patient_id is not None:
+        sql += " AND d.patient_id = ?"
+        params.append(patient_id)
+    sql += " ORDER BY rank LIMIT ?"
+    params.append(limit)
+
+    with connect(alias) as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [
+        {
+            'document_id': document_id,
+            'rank':        round(-rank, 4),
+            'snippet':     html.escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>'),
+        }
+        for document_id, rank, snippet in rows
+    ]
+
+
+def search_ids(query, patient_id=None, alias=None):
+    """Ids of the documents matching `query` (at most MAX_IDS), for queryset filters."""
+    return [hit['document_id'] for hit in search(query, patient_id, MAX_IDS, alias)]
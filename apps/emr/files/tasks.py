@@ -0,0 +1,72 @@
+# apps/emr/files/tasks.py
+import logging
+
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, name='files.write_access_logs', acks_late=True, max_retries=5)
+def write_access_logs(self, events):
+    """Bulk-insert the access events of one request (AUDIT_LOG MODE 'celery')."""
+    from apps.emr.files.audit import flush, write
+
+    try:
+        write(events)
+    except Exception as exc:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=exc, countdown=2 ** self.request.retries)
+        flush(events, mode='spool')     # on this host, for load_access_logs
+
+
+@shared_task(name='files.compact_access_logs')
+def compact_access_logs():
+    """Daily, per tenant through core.for_each_tenant (see core/celery.py)."""
+    from apps.emr.files.access_retention import compact
+    return compact()
+
+
+@shared_task(bind=True, name='files.save_document', acks_late=True, max_retries=5)
+def save_document(self, job_id):
+    """Fetch and store one Document Server save (see apps/emr/files/saving.py)."""
+    from apps.emr.files.saving import SaveError, run
+
+    try:
+        run(job_id, final=self.request.retries >= self.max_retries)
+    except SaveError as exc:
+        raise self.retry(exc=exc, countdown=min(300, 10 * 2 ** self.request.retries))
+
+
+@shared_task(name='files.render_thumbnails', acks_late=True)
+def render_thumbnails(document_ids):
+    """First-page previews for a batch of documents (see apps/emr/files/thumbnails.py)."""
+    from apps.emr.files.models import Document
+    from apps.emr.files.thumbnails import render
+
+    rendered = 0
+    for document_id in document_ids:
+        try:
+            rendered += render(document_id) is not None
+        except Document.DoesNotExist:
+            pass
+        except Exception:
+            logger.exception("Thumbnail for document %s failed", document_id)
+    return rendered
+
+
+@shared_task(name='files.index_document_text', acks_late=True)
+def index_document_text(document_ids):
+    """Extract and index the text of a batch of documents (see apps/emr/files/search_index.py)."""
+    from apps.emr.files.models import Document
+    from apps.emr.files.search_index import connect, index_document
+
+    indexed = 0
+    with connect() as conn:
+        for document_id in document_ids:
+            try:
+                indexed += index_document(document_id, conn)
+            except Document.DoesNotExist:
+                pass
+            except Exception:
+                logger.exception("Text extraction for document %s failed", document_id)
+    return indexed
@@ -1,3 +1,559 @@
-from django.test import TestCase
+import io
+import os
+import datetime
+import json
+import fnmatch
+import itertools
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.core.handlers.base import BaseHandler
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+
+from core.db_pool import connection_pool
+from core.db_routers import tenant
+from core.dynamic_domain import DynamicDomainMiddleware
+from core.tenant_cache import invalidate_tags, tag_versions, tenant_id, tenant_key
+from core.tenant_db import register_tenant_database
+from core.tenant_registry import TenantEntry, TenantRegistry, tenant_registry
+from apps.emr.identity.models import Patient
+from apps.emr.files import access_retention, audit, blobstore, delivery, protocol_matcher, saving, search_index, views
+from apps.emr.files.indexer import DEFAULT_DOCUMENT_TYPE, DocumentIndexer
+from apps.emr.files.tasks import index_document_text
+from apps.emr.files.utils import get_document_key
+from apps.emr.files.watcher import InotifyWatcher, PollingWatcher
+from apps.emr.files.models import (
+    Document, DocumentAccessLog, DocumentAccessLogArchive, DocumentSaveJob, DocumentType, DocumentVersion, FileExtension,
+    PermissionProtocol, ProtocolAssignment,
+)
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'emr-files-tests'}}
+
+# one tenant database (DatabaseConfig.name) and its read replica
+TENANT_ALIASES = {
+    'clinic':           {'TENANT': 'clinic', 'REPLICAS': ['clinic__replica0']},
+    'clinic__replica0': {'TENANT': 'clinic', 'PRIMARY': 'clinic'},
+}
+
+
+@override_settings(CACHES=LOCMEM)
+class TenantCacheNamespaceTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.dict(settings.DATABASES, TENANT_ALIASES)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_every_alias_of_a_database_has_one_id(self):
+        for alias in TENANT_ALIASES:
+            self.assertEqual(tenant_id(alias), 'clinic')
+        self.assertEqual(tenant_id('default'), 'default')
+        with tenant('clinic__replica0'):
+            self.assertEqual(tenant_key('x'), tenant_key('x', tenant='clinic'))
+
+    def test_bump_invalidates_replica_reads(self):
+        with tenant('clinic__replica0'):
+            before = tag_versions(['patient:1'])
+        invalidate_tags('patient:1', tenant='clinic')
+        self.assertNotEqual(tag_versions(['patient:1'], tenant='clinic__replica0'), before)
+
+
+class TenantRegistryTests(SimpleTestCase):
+
+    def test_every_domain_of_a_database_uses_its_name(self):
+        database = mock.Mock()
+        database.name = 'clinic'
+        for domain in ('clinic.example.com', 'portal.example.org'):
+            conn = mock.Mock(default_database=database)
+            conn.branding.domain_name = domain
+            self.assertEqual(TenantRegistry._entry(conn).alias, 'clinic')
+
+
+class AtomicRequestsTests(SimpleTestCase):
+
+    def test_a_request_opens_one_transaction_whatever_the_number_of_tenants(self):
+        patcher = mock.patch.dict(settings.DATABASES)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # more tenants than the pool could serve at once, one connection each
+        aliases = [f'tenant{index}' for index in range(connection_pool.max_total // 2 + 1)]
+        for alias in aliases:
+            cfg = mock.Mock(db_engine='django.db.backends.mysql', replicas=[])
+            cfg.name = alias
+            register_tenant_database(alias, cfg)
+
+        active     = aliases[-1]
+        entry      = TenantEntry(active, branding=None, connection=None, database=cfg, onlyoffice=None)
+        atomic     = mock.Mock(side_effect=lambda using: (lambda view: view))
+        middleware = DynamicDomainMiddleware(
+            lambda request: BaseHandler().make_view_atomic(lambda request: HttpResponse())(request)
+        )
+        with mock.patch.object(tenant_registry, 'get', return_value=entry), \
+             mock.patch('django.core.handlers.base.transaction.atomic', atomic):
+            middleware(RequestFactory().get('/'))
+
+        used = [call.kwargs['using'] for call in atomic.call_args_list]
+        self.assertEqual([alias for alias in used if alias in aliases], [active])
+
+
+@override_settings(CACHES=LOCMEM)
+class PatientDataTestCase(TestCase):
+    """
+    A PATIENT_DATA tree in a temporary folder, with the default DocumentType
+    and a catch-all protocol. The test database is also reachable as the
+    tenant 'clinic'.
+    """
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base, ignore_errors=True)
+        data = override_settings(PATIENT_DATA=self.base)
+        data.enable()
+        self.addCleanup(data.disable)
+        for patcher in (
+            mock.patch.object(blobstore, 'ROOT', os.path.join(self.base, '.blobs')),
+            mock.patch.object(blobstore, 'LINK', 'copy'),
+            mock.patch.object(search_index, 'DIR', os.path.join(self.base, '.search')),
+            mock.patch('apps.emr.files.tasks.render_thumbnails.delay'),
+            mock.patch('apps.emr.files.tasks.index_document_text.delay'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        default = connections['default']
+        aliases = {'clinic': {**default.settings_dict, 'TENANT': 'clinic'}}
+        patcher = mock.patch.dict(settings.DATABASES, aliases)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for alias in aliases:
+            connections[alias] = default
+            self.addCleanup(connections.__delitem__, alias)
+        protocol_matcher._matchers.clear()
+
+        DocumentType.objects.create(pk=DEFAULT_DOCUMENT_TYPE, name='General', representative_relative_path='')
+        self.protocol = PermissionProtocol.objects.create(name='all')
+        ProtocolAssignment.objects.create(path_pattern='*', protocol=self.protocol)
+
+    def write(self, relative_path, content):
+        path = os.path.join(self.base, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write(content)
+        return path
+
+
+class SearchIndexTests(PatientDataTestCase):
+
+    def test_indexed_by_the_command_found_by_the_view(self):
+        patient = Patient.objects.create(patient_id=7)
+        self.write('7/report.txt', 'Plan: rTMS over the left DLPFC, 20 sessions')
+        with tenant('clinic'):
+            DocumentIndexer().run()
+        call_command('update_search_index', tenants=['clinic'], stdout=io.StringIO())
+        self.assertTrue(os.path.exists(os.path.join(search_index.DIR, 'clinic.sqlite3')))
+
+        request = RequestFactory().get('/files/search/', {'q': 'dlpfc', 'patient': patient.pk})
+        request.user = get_user_model().objects.create_user(username='doctor', password='x')
+        with tenant('clinic'):
+            response = views.document_search(request)
+        results = json.loads(response.content)['results']
+        self.assertEqual([result['id'] for result in results], [str(Document.objects.get().pk)])
+
+
+class AccessLogSpoolTests(PatientDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(audit, 'SPOOL_DIR', os.path.join(self.base, '.spool'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patient = Patient.objects.create(patient_id=1)
+        pdf = FileExtension.objects.create(code='pdf', name='PDF')
+        self.documents = [
+            Document.objects.create(patient=patient, relative_path=f'1/{i}.pdf', file_name=f'{i}.pdf',
+                                    file_extension=pdf, document_type_id=DEFAULT_DOCUMENT_TYPE,
+                                    protocol=self.protocol)
+            for i in range(3)
+        ]
+
+    def event(self, document, at=None):
+        return {'document': str(document.pk), 'user': None, 'action': 'view', 'info': {},
+                'at': at or timezone.now().isoformat()}
+
+    def test_events_of_deleted_documents_are_dropped(self):
+        kept, deleted = self.documents[0], self.documents[1]
+        events = [self.event(kept), self.event(deleted)]
+        deleted.delete()
+        with self.assertLogs('apps.emr.files.audit', 'WARNING'):
+            self.assertEqual(audit.write(events), 1)
+        self.assertEqual(list(DocumentAccessLog.objects.values_list('document_id', flat=True)), [kept.pk])
+
+    def test_a_failing_spool_file_does_not_block_the_others(self):
+        audit.spool([self.event(self.documents[0], at='not a date')], 'clinic')
+        os.rename(audit.spool_path('clinic'), os.path.join(audit.SPOOL_DIR, 'clinic', '0.jsonl'))
+        audit.spool([self.event(self.documents[1]), self.event(self.documents[2])], 'clinic')
+
+        with self.assertRaises(CommandError):
+            call_command('load_access_logs', tenants=['clinic'], stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(DocumentAccessLog.objects.count(), 2)
+        left = os.listdir(os.path.join(audit.SPOOL_DIR, 'clinic'))
+        self.assertEqual(len(left), 1)
+        self.assertTrue(left[0].startswith('0.jsonl.') and left[0].endswith('.failed'))
+
+
+class AccessRetentionTests(PatientDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patient = Patient.objects.create(patient_id=1)
+        self.document = Document.objects.create(
+            patient=patient, relative_path='1/a.pdf', file_name='a.pdf',
+            file_extension=FileExtension.objects.create(code='pdf', name='PDF'),
+            document_type_id=DEFAULT_DOCUMENT_TYPE, protocol=self.protocol,
+        )
+        now = timezone.now()
+        DocumentAccessLog.objects.bulk_create(
+            DocumentAccessLog(document=self.document, action='view', timestamp=now - datetime.timedelta(days=days))
+            for days in (1, 200, 200, 400)
+        )
+
+    def history(self):
+        return sorted(row['count'] for row in access_retention.access_history(document=self.document))
+
+    def test_compaction_archives_and_keeps_the_history(self):
+        before = self.history()
+        stats  = access_retention.compact(180, 'default', retention_days=None)
+        self.assertEqual((stats['rows'], stats['purged']), (3, 0))
+        self.assertEqual(DocumentAccessLog.objects.count(), 1)
+        self.assertEqual(DocumentAccessLogArchive.objects.count(), 3)
+        self.assertEqual(self.history(), before)
+
+    def test_purging_leaves_the_daily_counts(self):
+        before = self.history()
+        access_retention.compact(180, 'default', retention_days=300)
+        self.assertEqual(DocumentAccessLogArchive.objects.count(), 2)
+        self.assertEqual(self.history(), before)
+
+
+class DownloadStub:
+    """What requests.get(..., stream=True) returns for a Document Server file URL."""
+
+    def __init__(self, body):
+        self.body    = body
+        self.headers = {'Content-Length': str(len(body))}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield self.body
+
+
+class SaveTests(PatientDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write('1/letter.docx', 'opened')
+        Patient.objects.create(patient_id=1)
+        with tenant('clinic'):
+            DocumentIndexer().run()
+        self.document = Document.objects.get()
+
+    def save(self, ds_status, url, body):
+        key = get_document_key(self.document)['version_key']
+        job, _ = DocumentSaveJob.objects.update_or_create(
+            key=key, defaults={'document': self.document, 'url': url, 'ds_status': ds_status, 'status': 'pending'},
+        )
+        with mock.patch('apps.emr.files.saving.requests.get', return_value=DownloadStub(body)):
+            saving.run(job.pk)
+        self.document.refresh_from_db()
+        with open(os.path.join(self.base, '1', 'letter.docx'), 'rb') as fh:
+            self.assertEqual(fh.read(), body)
+
+    def test_force_save_keeps_the_key_final_save_changes_it(self):
+        key = get_document_key(self.document)['version_key']
+        self.save(saving.FORCE_SAVE, 'http://ds/cache/1', b'draft')
+        self.assertEqual(get_document_key(self.document)['version_key'], key)
+        self.assertFalse(DocumentVersion.objects.exists())
+
+        self.save(saving.FINAL_SAVE, 'http://ds/cache/2', b'final')
+        self.assertNotEqual(get_document_key(self.document)['version_key'], key)
+        version = DocumentVersion.objects.get()
+        self.assertEqual((version.revision, version.source), (self.document.revision, 'save'))
+        self.assertEqual(self.document.sha256, version.sha256)
+
+
+class ImportBlobstoreTests(PatientDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for patient_id in (1, 2):
+            self.write(f'{patient_id}/scan.pdf', 'same scan')
+            Patient.objects.create(patient_id=patient_id)
+        with tenant('clinic'):
+            DocumentIndexer().run()
+
+    def run_import(self, *args):
+        out = io.StringIO()
+        call_command('import_blobstore', '--tenant', 'clinic', *args, stdout=out)
+        return out.getvalue()
+
+    def stat(self, relative_path):
+        return os.stat(os.path.join(self.base, relative_path))
+
+    @mock.patch.object(blobstore, 'LINK', 'reflink')
+    def test_refuses_to_copy_unless_allowed(self):
+        with mock.patch.object(blobstore, 'link_supported', return_value=False):
+            with self.assertRaises(CommandError):
+                self.run_import()
+            self.assertFalse(DocumentVersion.objects.exists())
+
+            # a failed reflink stores a copy but leaves the duplicate alone
+            with mock.patch.object(blobstore, '_reflink', side_effect=OSError(95, 'Operation not supported')):
+                out = self.run_import('--allow-copy')
+        self.assertIn('1 duplicates (0.0 MiB saved)', out)
+        self.assertEqual(DocumentVersion.objects.count(), 2)
+        self.assertNotEqual(self.stat('1/scan.pdf').st_ino, self.stat('2/scan.pdf').st_ino)
+
+    @mock.patch.object(blobstore, 'LINK', 'hardlink')
+    def test_links_duplicates(self):
+        out = self.run_import()
+        self.assertIn('1 new blobs, 1 duplicates', out)
+        self.assertEqual(self.stat('1/scan.pdf').st_ino, self.stat('2/scan.pdf').st_ino)
+        self.assertIn('0 documents', self.run_import())
+
+
+class RangeTests(SimpleTestCase):
+
+    def test_parse_range(self):
+        cases = [
+            ('bytes=0-3',        [(0, 3)]),
+            ('bytes=4-',         [(4, 9)]),
+            ('bytes=-3',         [(7, 9)]),
+            ('bytes=-20',        [(0, 9)]),          # suffix longer than the file
+            ('bytes=5-100',      [(5, 9)]),
+            ('bytes=0-1, 4-5,8-', [(0, 1), (4, 5), (8, 9)]),
+            ('bytes=-0',         []),                # empty suffix: unsatisfiable
+            ('bytes=10-',        []),
+            ('bytes=10-12,20-',  []),
+            ('bytes=3-1',        None),              # invalid: ignored, whole file
+            ('bytes=0-1,3-1',    None),
+            ('bytes=a-b',        None),
+            ('bytes=-',          None),
+            ('items=0-1',        None),
+            ('',                 None),
+        ]
+        for header, expected in cases:
+            with self.subTest(header=header):
+                self.assertEqual(delivery.parse_range(header, 10), expected)
+        self.assertEqual(delivery.parse_range('bytes=-1', 0), [])
+        self.assertIsNone(delivery.parse_range('bytes=' + ','.join(['0-0'] * (delivery.MAX_RANGES + 1)), 10))
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base)
+        with open(os.path.join(self.base, 'a.txt'), 'wb') as fh:
+            fh.write(b'0123456789')
+        self.st = os.stat(os.path.join(self.base, 'a.txt'))
+
+    def serve(self, **headers):
+        request = RequestFactory().get('/', **{f'HTTP_{name.upper()}': value for name, value in headers.items()})
+        with override_settings(PATIENT_DATA=self.base):
+            response = delivery.PythonDelivery().serve(request, 'a.txt', self.st)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_single_and_unsatisfiable_range(self):
+        response, body = self.serve(range='bytes=2-4')
+        self.assertEqual((response.status_code, body, response['Content-Range']), (206, b'234', 'bytes 2-4/10'))
+        response, _ = self.serve(range='bytes=-0')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */10'))
+        response, body = self.serve(range='bytes=3-1')
+        self.assertEqual((response.status_code, body), (200, b'0123456789'))
+
+    def test_multiple_ranges(self):
+        response, body = self.serve(range='bytes=0-1,8-')
+        self.assertEqual(response.status_code, 206)
+        boundary = response['Content-Type'].split('boundary=')[1]
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertIn(b'Content-Range: bytes 0-1/10\r\n\r\n01\r\n', body)
+        self.assertIn(b'Content-Range: bytes 8-9/10\r\n\r\n89\r\n', body)
+        self.assertTrue(body.endswith(f'--{boundary}--\r\n'.encode()))
+
+    def test_if_range(self):
+        etag, last_modified = delivery.validators(self.st)
+        for if_range, status in ((etag, 206), ('"stale"', 200), (http_date(last_modified), 206),
+                                 (http_date(last_modified - 60), 200)):
+            with self.subTest(if_range=if_range):
+                response, _ = self.serve(range='bytes=0-1', if_range=if_range)
+                self.assertEqual(response.status_code, status)
+
+
+class ProtocolMatcherTests(SimpleTestCase):
+
+    RULES = [
+        ('1/*', 10),
+        ('1/lab/*', 11),            # never reached: '1/*' comes first
+        ('12/*.pdf', 12),
+        ('1?/*', 13),
+        ('2/mri/[ab]*', 20),
+        ('2/mri/a.dcm', 21),        # literal, after a glob that matches it
+        ('2/*', 22),
+        ('3/notes/report.docx', 30),
+        ('*.txt', 90),
+    ]
+    PATHS = [
+        '1/a.pdf', '1/lab/cbc.pdf', '12/x.pdf', '12/x.docx', '13/x.pdf', '123/x.pdf',
+        '2/mri/a.dcm', '2/mri/b.dcm', '2/mri/c.dcm', '2/ct/x', '3/notes/report.docx',
+        '3/notes/report.docx.bak', '3/notes/a.txt', '4/a.TXT', '', 'x',
+    ]
+
+    @staticmethod
+    def first_fnmatch(rules, path):
+        return next((protocol_id for pattern, protocol_id in rules if fnmatch.fnmatchcase(path, pattern)), None)
+
+    def test_first_match_wins_like_fnmatch(self):
+        matcher = protocol_matcher.ProtocolMatcher(self.RULES)
+        for path in self.PATHS:
+            with self.subTest(path=path):
+                self.assertEqual(matcher.match(path), self.first_fnmatch(self.RULES, path))
+
+    def test_rule_order_decides_in_every_permutation(self):
+        rules = [('2/mri/[ab]*', 20), ('2/mri/a.dcm', 21), ('2/*', 22), ('*', 99)]
+        for order in itertools.permutations(rules):
+            matcher = protocol_matcher.ProtocolMatcher(order)
+            for path in ('2/mri/a.dcm', '2/mri/b.dcm', '2/x', '3/x'):
+                with self.subTest(order=order, path=path):
+                    self.assertEqual(matcher.match(path), self.first_fnmatch(order, path))
+
+
+class ProtocolMatcherCacheTests(PatientDataTestCase):
+
+    def test_web_edit_reaches_the_watcher_matcher(self):
+        self.assertEqual(protocol_matcher.get_matcher('clinic').match('1/a.pdf'), self.protocol.pk)
+        with tenant('clinic'):
+            other = PermissionProtocol.objects.create(name='restricted')
+            assignment = ProtocolAssignment.objects.get()
+            assignment.protocol = other
+            assignment.save()
+        # the watcher's cached matcher is only told by the tag
+        with mock.patch.object(protocol_matcher, 'CHECK_INTERVAL', 0):
+            self.assertEqual(protocol_matcher.get_matcher('clinic').match('1/a.pdf'), other.pk)
+
+
+class DocumentIndexerTests(PatientDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.patients = {number: Patient.objects.create(patient_id=number) for number in (1, 2)}
+        self.labs = DocumentType.objects.create(name='Lab', representative_relative_path='lab')
+
+    def run_indexer(self):
+        with tenant('clinic'):
+            return DocumentIndexer(chunk_size=2).run()
+
+    def test_first_run_creates_then_nothing_changes(self):
+        for path in ('1/a.pdf', '1/lab/cbc.pdf', '1/lab/old/lipids.PDF', '2/b.docx', '2/c.txt'):
+            self.write(path, path)
+        self.write('999/orphan.pdf', 'no such patient')
+        self.write('.incoming/x.part', 'not a patient folder')
+
+        stats = self.run_indexer()
+        self.assertEqual((stats['created'], stats['skipped_no_patient'], stats['deleted']), (5, 1, 0))
+        documents = {doc.relative_path: doc for doc in Document.objects.select_related('file_extension')}
+        self.assertEqual(set(documents), {'1/a.pdf', '1/lab/cbc.pdf', '1/lab/old/lipids.PDF', '2/b.docx', '2/c.txt'})
+        self.assertEqual(documents['1/lab/old/lipids.PDF'].document_type_id, self.labs.pk)
+        self.assertEqual(documents['1/a.pdf'].document_type_id, DEFAULT_DOCUMENT_TYPE)
+        self.assertEqual(documents['1/lab/old/lipids.PDF'].file_extension.code, 'pdf')
+        self.assertEqual(documents['2/b.docx'].patient_id, self.patients[2].pk)
+        queued = [pk for call in index_document_text.delay.call_args_list for pk in call.args[0]]
+        self.assertEqual(sorted(queued), sorted(str(doc.pk) for doc in documents.values()))
+
+        stats = self.run_indexer()
+        self.assertEqual((stats['created'], stats['updated'], stats['unchanged']), (0, 0, 5))
+
+    def test_changed_content_bumps_the_revision_deleted_files_go(self):
+        self.write('1/a.pdf', 'v1')
+        self.write('1/b.pdf', 'b')
+        self.run_indexer()
+        before = dict(Document.objects.values_list('relative_path', 'revision'))
+        ids    = dict(Document.objects.values_list('relative_path', 'pk'))
+
+        path = self.write('1/a.pdf', 'version 2')
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+        os.remove(os.path.join(self.base, '1', 'b.pdf'))
+        stats = self.run_indexer()
+
+        self.assertEqual((stats['updated'], stats['deleted']), (1, 1))
+        doc = Document.objects.get()
+        self.assertEqual((doc.pk, doc.revision), (ids['1/a.pdf'], before['1/a.pdf'] + 1))
+
+    def test_new_rules_alone_keep_the_revision(self):
+        self.write('1/a.pdf', 'a')
+        self.run_indexer()
+        restricted = PermissionProtocol.objects.create(name='restricted')
+        ProtocolAssignment.objects.update(protocol=restricted)
+        protocol_matcher.invalidate('clinic')
+
+        self.assertEqual(self.run_indexer()['updated'], 1)
+        doc = Document.objects.get()
+        self.assertEqual((doc.protocol_id, doc.revision), (restricted.pk, 1))
+
+    def test_empty_tree_deletes_nothing(self):
+        self.write('1/a.pdf', 'a')
+        self.run_indexer()
+        shutil.rmtree(os.path.join(self.base, '1'))
+        with self.assertLogs('apps.emr.files.indexer', 'ERROR'):
+            stats = self.run_indexer()
+        self.assertEqual(stats['deleted'], 0)
+        self.assertTrue(Document.objects.exists())
+
+
+
+class WatcherTests(SimpleTestCase):
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base)
+        for folder in ('1/lab', '.blobs/ab', '.thumbnails', '.incoming'):
+            os.makedirs(os.path.join(self.base, folder))
+
+    def touch(self, *relative_paths):
+        for relative_path in relative_paths:
+            os.makedirs(os.path.dirname(os.path.join(self.base, relative_path)), exist_ok=True)
+            with open(os.path.join(self.base, relative_path), 'w') as fh:
+                fh.write('x')
+
+    def changed_paths(self, watcher, timeout):
+        return {change.path for change in watcher.read(timeout)}
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'inotify is Linux only')
+    def test_inotify_skips_top_level_dot_folders(self):
+        watcher = InotifyWatcher(self.base)
+        self.addCleanup(watcher.close)
+        self.assertEqual(sorted(watcher._dirs.values()), ['', '1', os.path.join('1', 'lab')])
+
+        self.touch('.blobs/ab/blob', '.thumbnails/t.jpg', '.search/clinic.sqlite3', '1/lab/.a.pdf.tmp', '1/lab/a.pdf')
+        self.assertEqual(self.changed_paths(watcher, 1), {'1/lab/.a.pdf.tmp', '1/lab/a.pdf'})
+        self.assertNotIn('.search', watcher._dirs.values())
+
+    def test_polling_skips_top_level_dot_folders(self):
+        watcher = PollingWatcher(self.base, interval=0)
+        self.touch('.blobs/ab/blob', '.incoming/x.part', '1/lab/a.pdf')
+        self.assertEqual(self.changed_paths(watcher, 1), {'1/lab/a.pdf'})
@@ -0,0 +1,113 @@
+# apps/emr/files/thumbnails.py
+# First-page previews for document lists.
+#
+# A thumbnail is a small JPEG of the first page (PDF, through poppler's
+# pdftoppm) or of the image itself (Pillow), stored by content hash:
+# PATIENT_DATA/.thumbnails/ab/<sha256>-<size>.jpg. Document.thumbnail_sha256
+# names the one of its current content, so a file is rendered again only
+# when it changes, and identical scans share one thumbnail.
+#
+# Rendering runs in the files.render_thumbnails task, scheduled after the
+# indexer creates or changes documents and after editor saves; `manage.py
+# generate_thumbnails` fills in the rest. The URL contains the hash, so
+# document_thumbnail serves it (through the delivery backend) as immutable.
+
+import os
+import uuid
+import logging
+import subprocess
+
+from django.conf import settings
+
+from apps.emr.files import blobstore
+from apps.emr.files.models import Document
+
+logger = logging.getLogger(__name__)
+
+_config  = getattr(settings, 'THUMBNAILS', {})
+SIZE     = _config.get('SIZE', 256)                 # longest side, in pixels
+PDFTOPPM = _config.get('PDFTOPPM', 'pdftoppm')
+TIMEOUT  = _config.get('TIMEOUT', 30)               # seconds per document
+
+FOLDER        = '.thumbnails'     # under PATIENT_DATA: a dot folder, never indexed
+BATCH_SIZE    = 100               # documents per files.render_thumbnails task
+JPEG_QUALITY  = 80
+
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'bmp', 'tif', 'tiff', 'webp'}
+PREVIEWABLE      = IMAGE_EXTENSIONS | {'pdf'}
+
+
+def relative_path(sha256):
+    """Thumbnail path relative to PATIENT_DATA (what the delivery backend serves)."""
+    return os.path.join(FOLDER, sha256[:2], f'{sha256}-{SIZE}.jpg')
+
+
+def full_path(sha256):
+    return os.path.join(settings.PATIENT_DATA, relative_path(sha256))
+
+
+def schedule(document_ids):
+    """Queue thumbnail rendering for documents (no-op without a broker)."""
+    ids = [str(pk) for pk in document_ids]
+    from apps.emr.files.tasks import render_thumbnails
+    for i in range(0, len(ids), BATCH_SIZE):
+        try:
+            render_thumbnails.delay(ids[i:i + BATCH_SIZE])
+        except Exception as exc:
+            logger.warning("Thumbnails: cannot queue %d documents (%s); run generate_thumbnails", len(ids) - i, exc)
+            return
+
+
+def render(document_id):
+    """
+    Bring the document's thumbnail up to date with its content; returns the
+    content hash it was rendered from, or None when there is no preview.
+    """
+    doc = Document.objects.select_related('file_extension').get(pk=document_id)
+    extension = doc.file_extension.code.lower()
+    if extension not in PREVIEWABLE:
+        return None
+
+    source = os.path.join(settings.PATIENT_DATA, doc.relative_path)
+    sha256 = blobstore.content_sha256(doc)
+    target = full_path(sha256)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f'{target}.{uuid.uuid4().hex}.tmp'
+        try:
+            if extension == 'pdf':
+                _render_pdf(source, tmp)
+            else:
+                _render_image(source, tmp)
+            os.replace(tmp, target)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    if doc.thumbnail_sha256 != sha256:
+        Document.objects.filter(pk=doc.pk).update(thumbnail_sha256=sha256)
+    return sha256
+
+
+def _render_pdf(source, target):
+    # pdftoppm appends '.jpg' to the output root with -singlefile
+    root = target[:-len('.tmp')] + '.page'
+    try:
+        subprocess.run(
+            [PDFTOPPM, '-f', '1', '-l', '1', '-singlefile', '-jpeg',
+             '-jpegopt', f'quality={JPEG_QUALITY}', '-scale-to', str(SIZE), source, root],
+            check=True, timeout=TIMEOUT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        os.replace(root + '.jpg', target)
+    finally:
+        if os.path.exists(root + '.jpg'):
+            os.remove(root + '.jpg')
+
+
+def _render_image(source, target):
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as img:
+        img.draft('RGB', (SIZE, SIZE))        # JPEG: decode at a reduced scale
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((SIZE, SIZE))
+        img.convert('RGB').save(target, 'JPEG', quality=JPEG_QUALITY, optimize=True)
@@ -10,6 +10,18 @@ urlpatterns = [
     #     serve_patient_file,
     #     name='serve_patient_file',
     # ),
+    path("<uuid:key>/editor/", document_editor_config, name="document_editor_config"),
+    path(
+        "<uuid:key>/thumbnail/<str:sha256>.jpg",
+        document_thumbnail,
+        name="document_thumbnail",
+    ),
+    path(
+        "patients/<int:patient_id>/documents/",
+        patient_document_list,
+        name="patient_document_list",
+    ),
+    path("search/", document_search, name="document_search"),
     path(
         "oocallback/",
         onlyoffice_callback,
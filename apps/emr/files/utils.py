@@ -136,6 +136,7 @@
 import os
 import time
 import uuid
+import base64
 import logging
 import json
 import requests
@@ -147,15 +148,22 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.clickjacking import xframe_options_sameorigin
 from django.conf import settings
 from django.utils.dateparse import parse_datetime
+from django.urls import reverse
 
 
 from .models import *
+from . import audit, search_index
+from .permissions import resolver_for
 
 logger = logging.getLogger(__name__)
 
 callbackUrl = settings.ONLYOFFICE_CALLBACK
 
-def patient_documents(
+PAGE_SIZE     = 50      # documents per page of page_documents()
+MAX_PAGE_SIZE = 200
+
+
+def filter_patient_documents(
     request,
     patient,
     *,
@@ -168,11 +176,10 @@ def patient_documents(
     created_to: str = None,
     updated_from: str = None,
     updated_to: str = None,
+    text: str = None,
 ):
     """
-    Old name = document_box_generator()
-    Returns a LIST of OnlyOffice payload dicts for all Documents
-    belonging to `patient`, optionally filtered by any of:
+    Documents of `patient` ordered by relative_path, optionally filtered by any of:
       • file_name (substring)
       • document_type (FK id)
       • protocol (FK id)
@@ -180,6 +187,7 @@ def patient_documents(
       • exclude (comma-separated file_name values)
       • created_from / created_to (ISO datetimes)
       • updated_from / updated_to (ISO datetimes)
+      • text (words in the content, see search_index)
 
     You can pass filters here as kwargs, or omit them and rely on request.GET.
     """
@@ -196,6 +204,7 @@ def patient_documents(
         'created_to':     created_to,
         'updated_from':   updated_from,
         'updated_to':     updated_to,
+        'text':           text,
     }
 
     def _param(name):
@@ -256,17 +265,47 @@ def patient_documents(
         if dt:
             qs = qs.filter(updated_at__lte=dt)
 
-    # 8) final ordering
-    qs = qs.order_by('relative_path')
+    # 8) full text (the tenant's search index)
+    tx = _param('text')
+    if tx:
+        qs = qs.filter(pk__in=search_index.search_ids(tx, patient_id=patient.pk))
 
-    # 9) build payloads & log view access
-    documents = []
-    for doc in qs:
-        payload = generate_document_payload(doc, request.user, request)
-        documents.append(payload)
-        record_access(doc, request.user, action='view')
+    # 9) final ordering (relative_path is unique per patient: the keyset of page_documents)
+    return qs.select_related('file_extension', 'document_type').order_by('relative_path')
 
-    return documents
+
+def document_metadata(document):
+    """What a document list shows: no token, file URL or permissions (see document_editor_config)."""
+    return {
+        'id':           str(document.id),
+        'title':        document.file_name,
+        'documentType': document.document_type.name,
+        'extension':    document.file_extension.code,
+        'updated_at':   document.updated_at.isoformat(),
+        'thumbnail':    reverse('files:document_thumbnail', kwargs={
+                            'key': document.id, 'sha256': document.thumbnail_sha256,
+                        }) if document.thumbnail_sha256 else None,
+    }
+
+
+def page_documents(qs, after=None, limit=PAGE_SIZE):
+    """
+    One keyset page of an ordered-by-relative_path queryset: (metadata list,
+    cursor of the next page or None). The cost does not grow with the offset.
+    """
+    if after:
+        try:
+            qs = qs.filter(relative_path__gt=base64.urlsafe_b64decode(after.encode()).decode())
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError('bad cursor')
+    qs   = qs.only('id', 'relative_path', 'file_name', 'updated_at', 'thumbnail_sha256',
+                   'document_type__name', 'file_extension__code')
+    rows = list(qs[:limit + 1])
+    cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        cursor = base64.urlsafe_b64encode(rows[-1].relative_path.encode()).decode()
+    return [document_metadata(doc) for doc in rows], cursor
 
 
 
@@ -277,13 +316,16 @@ def get_effective_permissions(user, document):
     Return a dict of OnlyOffice permission flags for this user-document pair,
     OR-merging all the user's groups under the document's protocol.
     """
-    return document.protocol.get_perms_for_user(user)
+    return resolver_for(user).for_protocol(document.protocol_id)
 
 
 def get_document_key(document):
-    """Use the Document's UUID as the DS key"""
+    """
+    Use the Document's UUID + revision as the DS key: it only changes when the
+    file does (callback save, re-index), so DS can reuse its converted copy.
+    """
     constant_key = str(document.id) # UUID
-    version  = int(time.time() * 1000)
+    version  = document.revision
     version_key = f"{constant_key}_{version}" # needed for OnlyOffice
     return {
         'constant_key' : constant_key,
@@ -350,11 +392,6 @@ def generate_document_payload(document, user, request):
 
 
 def record_access(document, user, action, info=None):
-    """Log every view/edit/save action in DocumentAccessLog"""
-    DocumentAccessLog.objects.create(
-        document=document,
-        user=user if user.is_authenticated else None,
-        action=action,
-        info=info or {}
-    )
+    """Log every view/edit/save action in DocumentAccessLog (batched per request, see audit.py)"""
+    audit.record(document, user, action, info)
 
@@ -1,30 +1,45 @@
 import os
 import json
-import time
 import uuid
 import logging
 import ipaddress
 import jwt
-import mimetypes
-import requests
 
 from django.conf       import settings
 from django.http       import (
-    FileResponse, Http404, HttpResponseForbidden,
+    Http404, HttpResponseForbidden,
     HttpResponseServerError, JsonResponse
 )
+from django.shortcuts  import get_object_or_404
 from django.urls       import reverse
-from django.utils.timezone import now
+from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_GET
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.clickjacking import xframe_options_sameorigin
 
+from apps.emr.files        import saving, search_index, thumbnails
 from apps.emr.files.models import Document
-from apps.emr.files.utils  import record_access
+from apps.emr.files.utils  import (
+    MAX_PAGE_SIZE, PAGE_SIZE, document_metadata, filter_patient_documents,
+    generate_document_payload, page_documents, record_access,
+)
+from apps.emr.identity.models import Patient
+from apps.emr.files.delivery import get_backend as get_delivery_backend
 
 
 
 logger = logging.getLogger(__name__)
 
+
+def _ip_allowed(client_ip):
+    """Whether `client_ip` is in ONLYOFFICE_ALLOWED_IPS (ValueError if it is no IP)."""
+    addr = ipaddress.ip_address(client_ip)
+    return any(
+        addr in ipaddress.ip_network(net)
+        for net in settings.ONLYOFFICE_ALLOWED_IPS
+    )
+
+
 @csrf_exempt
 @xframe_options_sameorigin
 def serve_patient_file(request, key):
@@ -46,15 +61,10 @@ def serve_patient_file(request, key):
 
         # (1) IP allow list
         try:
-            addr = ipaddress.ip_address(client_ip)
+            allowed = _ip_allowed(client_ip)
         except ValueError:
             return HttpResponseForbidden("Forbidden: invalid IP")
 
-        allowed = any(
-            addr in ipaddress.ip_network(net)
-            for net in settings.ONLYOFFICE_ALLOWED_IPS
-        )
-
         # (2) JWT fallback
         if not allowed:
             auth = request.headers.get("Authorization", "")
@@ -80,9 +90,11 @@ def serve_patient_file(request, key):
         except Document.DoesNotExist:
             raise Http404("No such document")
 
-        # (4) File on disk?
+        # (4) File on disk? (its stat gives the ETag / Last-Modified)
         path = os.path.join(settings.PATIENT_DATA, doc.relative_path)
-        if not os.path.exists(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
             raise Http404("File not found on disk")
 
         # (5) Audit
@@ -93,13 +105,11 @@ def serve_patient_file(request, key):
         #     info={"ip": client_ip, "time": now().isoformat(), "by_ip": allowed}
         # )
 
-        # (6) Stream it
-        content_type, _ = mimetypes.guess_type(path)
-        resp = FileResponse(open(path, "rb"),
-                             content_type=content_type or "application/octet-stream")
-        resp["Accept-Ranges"] = "bytes"
-        return resp
+        # (6) 304 / 206 / hand it to the delivery backend (nginx / X-Sendfile / Python stream)
+        return get_delivery_backend().serve(request, doc.relative_path, st)
 
+    except Http404:
+        raise
     except Exception as e:
         # catch any unexpected error, log the stack trace, return 500
         logger.exception("Error serving patient file %r from %s", key, client_ip)
@@ -113,13 +123,35 @@ def serve_patient_file(request, key):
 @csrf_exempt
 def onlyoffice_callback(request):
     """
-    Handles DS save callbacks. Records edits and saves updated files back to disk.
+    Handles DS save callbacks: records a save job and acknowledges at once.
+    The file itself is fetched and written by the files.save_document task.
     """
     try:
         data = json.loads(request.body.decode())
-    except json.JSONDecodeError:
+    except (json.JSONDecodeError, UnicodeDecodeError):
         return JsonResponse({'error':1,'message':'Invalid JSON'}, status=400)
 
+    # (1) DS signs callbacks (body 'token' or Authorization header); the
+    #     signed payload is the one we trust. Unsigned only from allowed IPs.
+    token = data.get('token')
+    auth  = request.headers.get('Authorization', '')
+    if not token and auth.startswith('Bearer '):
+        token = auth.split(' ', 1)[1]
+    if token:
+        try:
+            payload = jwt.decode(token, settings.ONLYOFFICE_JWT_SECRET, algorithms=['HS256'])
+        except jwt.PyJWTError as exc:
+            logger.warning("Callback JWT decode failed: %s", exc)
+            return JsonResponse({'error':1,'message':'Bad token'}, status=403)
+        data = payload.get('payload', payload)
+    else:
+        try:
+            allowed = _ip_allowed(request.META.get('REMOTE_ADDR', '').split(':')[0])
+        except ValueError:
+            allowed = False
+        if not allowed:
+            return JsonResponse({'error':1,'message':'Token missing'}, status=403)
+
     status = data.get('status')
     # statuses with updated URL payload
     if status in (2, 6):
@@ -133,27 +165,92 @@ def onlyoffice_callback(request):
             doc = Document.objects.get(id=doc_id)
         except (Document.DoesNotExist, ValueError):
             return JsonResponse({'error':1,'message':'Bad document key'}, status=400)
+        if not file_url:
+            return JsonResponse({'error':1,'message':'Missing url'}, status=400)
 
-        # fetch the updated file
-        token_payload = {'url': file_url, 'exp': int(time.time())+300}
-        download_token = jwt.encode(token_payload, settings.ONLYOFFICE_JWT_SECRET, algorithm='HS256')
-        if isinstance(download_token, bytes):
-            download_token = download_token.decode()
-        headers = {'Authorization': f'Bearer {download_token}'}
-
-        try:
-            resp = requests.get(file_url, headers=headers, timeout=60)
-            resp.raise_for_status()
-        except Exception as e:
-            logger.error('Callback download failed: %s', e)
-            return JsonResponse({'error':1,'message':'Fetch failed'}, status=502)
-
-        # write to host disk
-        local_path = os.path.join(settings.PATIENT_DATA, doc.relative_path)
-        os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        with open(local_path, 'wb') as f:
-            f.write(resp.content)
-        record_access(doc, request.user, 'save' if status==6 else 'edit', info={'status':status})
+        # (2) download and atomic replace happen in the task, the revision
+        #     (document key) only changes on the final save (status 2)
+        saving.enqueue(doc, raw_key, file_url, status)
 
     # always acknowledge
     return JsonResponse({'error':0})
+
+
+
+# -- Document listing for the browser: metadata first, editor config on open --
+@login_required
+@require_GET
+def patient_document_list(request, patient_id):
+    """
+    One keyset page of a patient's documents, metadata only:
+    ?after=<cursor>&limit=<n> plus the filters of filter_patient_documents.
+    """
+    patient = get_object_or_404(Patient, id=patient_id)
+    try:
+        limit = min(max(int(request.GET.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        documents, cursor = page_documents(
+            filter_patient_documents(request, patient), request.GET.get('after'), limit,
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Bad limit or cursor'}, status=400)
+    return JsonResponse({'documents': documents, 'next': cursor})
+
+
+@login_required
+@require_GET
+def document_editor_config(request, key):
+    """Signed OnlyOffice payload for the one document being opened (logged as a view)."""
+    doc = get_object_or_404(Document.objects.select_related('file_extension', 'document_type'), id=key)
+    payload = generate_document_payload(doc, request.user, request)
+    record_access(doc, request.user, action='view')
+    return JsonResponse(payload)
+
+
+@login_required
+@require_GET
+def document_search(request):
+    """
+    Full-text search, best match first: ?q=<words>[&patient=<id>][&limit=<n>].
+    Without `patient` the whole tenant is searched.
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'Missing q'}, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        patient_id = int(request.GET['patient']) if request.GET.get('patient') else None
+    except ValueError:
+        return JsonResponse({'error': 'Bad limit or patient'}, status=400)
+
+    hits = search_index.search(query, patient_id=patient_id, limit=limit)
+    documents = Document.objects.select_related('file_extension', 'document_type').in_bulk(
+        [hit['document_id'] for hit in hits]
+    )
+    results = []
+    for hit in hits:
+        doc = documents.get(uuid.UUID(hit['document_id']))
+        if doc is None:            # deleted since it was indexed
+            continue
+        results.append({
+            **document_metadata(doc),
+            'patient_id': doc.patient_id,
+            'rank':       hit['rank'],
+            'snippet':    hit['snippet'],
+        })
+    return JsonResponse({'results': results})
+
+
+@login_required
+@require_GET
+def document_thumbnail(request, key, sha256):
+    """First-page preview; the URL names the content hash, so it never changes."""
+    doc = get_object_or_404(Document.objects.only('id', 'thumbnail_sha256'), id=key)
+    if not doc.thumbnail_sha256 or doc.thumbnail_sha256 != sha256:
+        raise Http404("No such thumbnail")
+    try:
+        st = os.stat(thumbnails.full_path(sha256))
+    except FileNotFoundError:
+        raise Http404("Thumbnail not rendered")
+    resp = get_delivery_backend().serve(request, thumbnails.relative_path(sha256), st)
+    resp['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return resp
@@ -0,0 +1,123 @@
+# apps/emr/files/walker.py
+# Parallel os.scandir tree walker for the patient data volume.
+#
+# The data lives on network storage where every directory listing costs a
+# round-trip, so a single-threaded os.walk spends most of its time waiting.
+# Here each top-level folder (one per patient) is walked by a bounded thread
+# pool and the entries are streamed back through a bounded queue, each with
+# its stat result, so callers never stat a file a second time.
+#
+# No Django imports: also used by standalone scripts
+# (data_base_input_output/physician_notes_organizer.py).
+
+import os
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+WORKERS    = 8        # concurrent directory walks
+QUEUE_SIZE = 64       # batches buffered between the walkers and the consumer
+BATCH_SIZE = 256      # entries per batch (one queue hand-off each)
+
+# one file below the walked folder; `top` is the first path component
+WalkEntry = namedtuple('WalkEntry', ['top', 'relative_path', 'name', 'path', 'stat'])
+
+_DONE = object()
+
+
+def scan_tree(base_path, rel_dir, onerror=None, max_depth=None):
+    """
+    Single-threaded scandir walk of <base_path>/<rel_dir>, yielding WalkEntry
+    for files (like os.walk, symlinked folders are not descended into).
+    `max_depth` = 1 lists only the files directly inside rel_dir.
+    """
+    top = rel_dir.split(os.sep)[0]
+    stack = [(os.path.join(base_path, rel_dir), rel_dir, 1)]
+    while stack:
+        path, rel, depth = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError as exc:
+            if onerror is not None:
+                onerror(top, exc)
+            continue
+        for entry in entries:
+            entry_rel = os.path.join(rel, entry.name) if rel else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if max_depth is None or depth < max_depth:
+                        stack.append((entry.path, entry_rel, depth + 1))
+                elif entry.is_file():
+                    yield WalkEntry(top, entry_rel, entry.name, entry.path, entry.stat())
+            except OSError as exc:
+                if onerror is not None:
+                    onerror(top, exc)
+
+
+def parallel_walk(base_path, accept=None, onerror=None, workers=WORKERS, max_depth=None):
+    """
+    Walk every folder directly under `base_path` on a thread pool and yield
+    WalkEntry objects as they are found (in no particular order).
+
+    - accept(name) → bool: which top-level folders to walk; called in the
+      consuming thread, so it may use the database.
+    - onerror(top, exc): called from the walker threads for unreadable
+      folders or entries.
+    - max_depth: see scan_tree().
+
+    Files directly in `base_path` are not returned. Closing the generator
+    early stops the walkers.
+    """
+    with os.scandir(base_path) as it:
+        tops = sorted(entry.name for entry in it if entry.is_dir(follow_symlinks=False))
+    if accept is not None:
+        tops = [name for name in tops if accept(name)]
+    if not tops:
+        return
+
+    results = queue.Queue(QUEUE_SIZE)
+    stop    = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def walk(top):
+        try:
+            batch = []
+            for entry in scan_tree(base_path, top, onerror, max_depth):
+                batch.append(entry)
+                if len(batch) >= BATCH_SIZE:
+                    if not put(batch):
+                        return
+                    batch = []
+            if batch:
+                put(batch)
+        except BaseException as exc:             # surfaced in the consuming thread
+            put(exc)
+        finally:
+            put(_DONE)
+
+    pool = ThreadPoolExecutor(max_workers=min(workers, len(tops)), thread_name_prefix='walker')
+    try:
+        for top in tops:
+            pool.submit(walk, top)
+        remaining = len(tops)
+        while remaining:
+            item = results.get()
+            if item is _DONE:
+                remaining -= 1
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                yield from item
+    finally:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
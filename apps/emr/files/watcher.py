@@ -0,0 +1,252 @@
+# apps/emr/files/watcher.py
+# Change sources for the watch_documents command.
+#
+# - InotifyWatcher: Linux inotify through ctypes (no extra dependency), one
+#   watch per folder, new folders are watched as they appear.
+# - PollingWatcher: periodic stat walk, for network mounts (NFS/SMB) where
+#   inotify does not see changes made by other machines.
+# Both feed a Debouncer, which turns bursts of events into batches of
+# touched paths and (old, new) moves for DocumentIndexer.apply().
+# Top-level dot folders (.blobs, .incoming, .thumbnails, .search) are not
+# patient folders: they are neither watched nor reported.
+
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+from collections import namedtuple
+
+from apps.emr.files.indexer import walk_patient_files
+
+logger = logging.getLogger(__name__)
+
+# one change, relative to the watched folder: kind is 'changed', 'moved_from',
+# 'moved_to' or 'rescan' (events were lost); cookie pairs the two halves of a move
+Change = namedtuple('Change', ['kind', 'path', 'cookie'])
+
+# what the indexer should look at: touched paths, (old, new) moves, full rescan
+Batch = namedtuple('Batch', ['paths', 'moves', 'rescan'])
+
+
+def is_internal(relative_path):
+    """True for paths under a top-level dot folder (blob store, incoming saves, …)."""
+    return relative_path.startswith('.')
+
+NETWORK_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'fuse.sshfs', 'fuse.rclone', '9p'}
+
+
+def is_network_mount(path):
+    """True when `path` lives on a network filesystem (per /proc/self/mounts)."""
+    path = os.path.realpath(path)
+    best, fstype = '', None
+    try:
+        with open('/proc/self/mounts') as mounts:
+            for line in mounts:
+                fields = line.split()
+                mountpoint = fields[1].replace('\\040', ' ')
+                if (path == mountpoint or path.startswith(mountpoint.rstrip('/') + '/')) and len(mountpoint) > len(best):
+                    best, fstype = mountpoint, fields[2]
+    except OSError:
+        return False
+    return fstype in NETWORK_FILESYSTEMS
+
+
+class Debouncer:
+    """
+    Collects changes until nothing happened for `quiet` seconds (or the first
+    pending change is `max_wait` seconds old), then hands them out as one Batch.
+    A move whose second half never arrived counts as a plain change of the
+    path (moved out of / into the tree).
+    """
+
+    def __init__(self, quiet=2.0, max_wait=10.0):
+        self.quiet    = quiet
+        self.max_wait = max_wait
+        self._reset()
+
+    def _reset(self):
+        self._paths  = set()
+        self._moves  = []
+        self._from   = {}       # cookie → old path
+        self._rescan = False
+        self._first  = None
+        self._last   = None
+
+    def add(self, change):
+        now = time.monotonic()
+        self._first = self._first or now
+        self._last  = now
+        if change.kind == 'rescan':
+            self._rescan = True
+        elif change.kind == 'moved_from':
+            self._from[change.cookie] = change.path
+        elif change.kind == 'moved_to' and change.cookie in self._from:
+            self._moves.append((self._from.pop(change.cookie), change.path))
+        else:
+            self._paths.add(change.path)
+
+    def ready(self):
+        """The pending Batch if it is due, else None."""
+        if self._first is None:
+            return None
+        now = time.monotonic()
+        if now - self._last < self.quiet and now - self._first < self.max_wait:
+            return None
+        batch = Batch(self._paths | set(self._from.values()), self._moves, self._rescan)
+        self._reset()
+        return batch
+
+
+class InotifyWatcher:
+    IN_ATTRIB      = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM  = 0x00000040
+    IN_MOVED_TO    = 0x00000080
+    IN_CREATE      = 0x00000100
+    IN_DELETE      = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW  = 0x00004000
+    IN_IGNORED     = 0x00008000
+    IN_ISDIR       = 0x40000000
+    IN_NONBLOCK    = 0o4000
+    IN_CLOEXEC     = 0o2000000
+
+    MASK   = IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+    HEADER = struct.Struct('iIII')     # wd, mask, cookie, len
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._dirs = {}            # watch descriptor → folder relative to base_path ('' = base)
+        self._watch_tree('')
+
+    def close(self):
+        os.close(self.fd)
+
+    def read(self, timeout):
+        """Changes that arrived within `timeout` seconds (possibly none)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+
+        changes, offset = [], 0
+        while offset < len(data):
+            wd, mask, cookie, length = self.HEADER.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + self.HEADER.size:offset + self.HEADER.size + length].rstrip(b'\0'))
+            offset += self.HEADER.size + length
+
+            if mask & self.IN_Q_OVERFLOW:
+                logger.warning("inotify queue overflow: scheduling a full rescan")
+                changes.append(Change('rescan', '', 0))
+                continue
+            if mask & self.IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            folder = self._dirs.get(wd)
+            if folder is None or not name:
+                continue
+
+            path = os.path.join(folder, name) if folder else name
+            if is_internal(path):
+                continue
+            is_dir = mask & self.IN_ISDIR
+            if mask & self.IN_MOVED_FROM:
+                changes.append(Change('moved_from', path, cookie))
+                if is_dir:
+                    self._forget_tree(path)
+            elif mask & self.IN_MOVED_TO:
+                changes.append(Change('moved_to', path, cookie))
+                if is_dir:
+                    self._watch_tree(path)
+            else:
+                if is_dir and mask & self.IN_CREATE:
+                    self._watch_tree(path)
+                changes.append(Change('changed', path, 0))
+        return changes
+
+    def _watch_tree(self, rel_dir):
+        for root, dirs, _ in os.walk(os.path.join(self.base_path, rel_dir)):
+            rel = os.path.relpath(root, self.base_path)
+            if rel == '.':
+                rel = ''
+                dirs[:] = [name for name in dirs if not is_internal(name)]
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(root), self.MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    logger.error("inotify watch limit reached (fs.inotify.max_user_watches): %s is not watched", root)
+                elif err != errno.ENOENT:
+                    logger.warning("Cannot watch %s: %s", root, os.strerror(err))
+                continue
+            self._dirs[wd] = rel
+
+    def _forget_tree(self, rel_dir):
+        # the kernel keeps the watches of a moved folder; re-added under the new name on IN_MOVED_TO
+        prefix = rel_dir + os.sep
+        for wd, folder in list(self._dirs.items()):
+            if folder == rel_dir or folder.startswith(prefix):
+                self._libc.inotify_rm_watch(self.fd, wd)
+                del self._dirs[wd]
+
+
+class PollingWatcher:
+    """Stat-walks the tree every `interval` seconds and reports the difference."""
+
+    def __init__(self, base_path, interval=30):
+        self.base_path = base_path
+        self.interval  = interval
+        self._snapshot = self._scan({})
+        self._next     = time.monotonic() + interval
+
+    def close(self):
+        pass
+
+    def read(self, timeout):
+        wait = self._next - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0, wait))
+        self._next = time.monotonic() + self.interval
+
+        previous, current = self._snapshot, self._scan(self._snapshot)
+        self._snapshot = current
+
+        added   = {path for path in current if path not in previous}
+        removed = {path for path in previous if path not in current}
+        changes = [Change('changed', path, 0)
+                   for path in current if path in previous and current[path] != previous[path]]
+
+        # same inode under a new name: a move, so the Document row can follow the file
+        by_inode = {current[path][2]: path for path in added}
+        for cookie, old in enumerate(sorted(removed), start=1):
+            new = by_inode.pop(previous[old][2], None)
+            if new is not None:
+                added.discard(new)
+                changes += [Change('moved_from', old, cookie), Change('moved_to', new, cookie)]
+            else:
+                changes.append(Change('changed', old, 0))
+        changes += [Change('changed', path, 0) for path in added]
+        return changes
+
+    def _scan(self, previous):
+        errors, snapshot = set(), {}
+        for entry in walk_patient_files(self.base_path, errors, accept=lambda patient_dir: not is_internal(patient_dir)):
+            snapshot[entry.relative_path] = (entry.size, entry.mtime_ns, entry.inode)
+        # an unreadable patient folder keeps its previous state instead of looking deleted
+        for path, state in previous.items():
+            if path.split(os.sep)[0] in errors:
+                snapshot.setdefault(path, state)
+        return snapshot
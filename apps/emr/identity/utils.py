@@ -10,6 +10,7 @@ from jdatetime import datetime as jdatetime
 from django.utils.translation import gettext as _
 
 from apps.emr.files.models import Document
+from apps.emr.files import protocol_matcher
 
 logger = logging.getLogger(__name__)
 
@@ -150,13 +151,14 @@ def agreement_generator(patient_id):
 
         if process.returncode == 0:
             base_name = f"commitment_letter-{version_number}.pdf"
+            rel_path  = f"{target_folder_rel_path}/{base_name}"
             new_doc = Document.objects.create(
                 patient        = patient,
-                relative_path  = f"{target_folder_rel_path}/{base_name}",
+                relative_path  = rel_path,
                 file_name      = base_name,
                 file_extension_id = 1,     # 1 → PDF
                 document_type_id = 101,      # 101 → Agreements
-                protocol_id = 4,             # read-only legal and payment
+                protocol_id = protocol_matcher.match(rel_path, default=4),   # 4 → read-only legal and payment
             )
             return "Successful", new_doc
 
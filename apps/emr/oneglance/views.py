@@ -30,12 +30,15 @@ from django.views.decorators.clickjacking import xframe_options_sameorigin
 
 from apps.emr.identity.models import *
 from apps.emr.rtms.utils import get_rtms_protcols
-from apps.emr.files.utils import patient_documents
+from apps.emr.files.utils import (
+    document_metadata, filter_patient_documents, generate_document_payload, record_access,
+)
 from apps.common.decorators import group_required
 
 
 
 from apps.emr.files.models import Document
+from apps.emr.files import protocol_matcher
 
 logger = logging.getLogger(__name__)
 
@@ -50,11 +53,11 @@ def oneglance_page(request):
 
     patient = get_object_or_404(Patient, id=patient_db_id)
 
-    documents = patient_documents(
-        request=request,
-        patient=patient,
-        document_type=1,
-    )
+    # metadata only: the editor config is fetched when a document is opened
+    documents = [
+        document_metadata(doc)
+        for doc in filter_patient_documents(request, patient, document_type=1)
+    ]
 
     # ─── custom sort ────────────────────────────────────────────────────────────
     # 1) split into scan* vs. everything else
@@ -232,7 +235,7 @@ def generate_pdf(request):
             file_name      = f"{file_name}.pdf",
             file_extension_id = 1,     # 1 → PDF
             document_type_id = 1,      # 1 → physician note
-            protocol_id = 1,
+            protocol_id = protocol_matcher.match(rel_path, default=1),
         )
 
         for ext in ["tex", "aux", "log"]:
@@ -241,24 +244,9 @@ def generate_pdf(request):
                 os.remove(aux_file)
 
 
-        # Return the generated PDF details to the client
-        documents = patient_documents(
-            request=request,
-            patient=patient,
-            document_type=1,
-        )
-
-        if documents is None or len(documents) == 0:
-            return JsonResponse({"error": "Failed to generate the document list."}, status=500)
-
-        # Find the newly generated document in the list and return it
-        expected = f"{file_name}.pdf"
-        new_document = next((doc for doc in documents if doc['title'] == expected), None)
-
-        if new_document:
-            return JsonResponse(new_document)
-        else:
-            return JsonResponse({"error": "Failed to generate the document."}, status=500)
+        # Return the generated PDF's editor config to the client (it is opened right away)
+        record_access(new_doc, request.user, action='view')
+        return JsonResponse(generate_document_payload(new_doc, request.user, request))
 
     except Exception as e:
         return JsonResponse({"error": f"An error occurred: {str(e)}"}, status=500)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+bench_tree_walk.py
+
+Compare the document index walk before and after apps/emr/files/walker.py:
+
+  - listdir+walk: os.listdir over the patient folders, os.walk below each
+    and an os.stat per file (the previous walk_patient_files);
+  - scandir:      the same walk with os.scandir on one thread;
+  - parallel:     parallel_walk() with `--workers` threads.
+
+By default a synthetic tree of `--patients` x `--folders` x `--files` files
+(1000 x 4 x 25 = 100k) is built in a temporary directory and removed
+afterwards. Point `--root` at an existing tree (e.g. the network share) to
+measure real latency; nothing is written there.
+
+    python benchmarks/bench_tree_walk.py --repeat 3
+    python benchmarks/bench_tree_walk.py --root /mnt/patient_data --workers 4 8 16
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apps.emr.files.walker import parallel_walk, scan_tree
+
+
+def build_tree(root, patients, folders, files):
+    for p in range(patients):
+        for f in range(folders):
+            folder = os.path.join(root, str(1000 + p), f'folder{f}')
+            os.makedirs(folder)
+            for n in range(files):
+                with open(os.path.join(folder, f'{n}.pdf'), 'wb') as fh:
+                    fh.write(b'%PDF-1.4\n')
+
+
+def walk_listdir(root, workers):
+    count = 0
+    for patient_dir in sorted(os.listdir(root)):
+        patient_path = os.path.join(root, patient_dir)
+        if not os.path.isdir(patient_path):
+            continue
+        for folder, _, files in os.walk(patient_path):
+            for name in files:
+                os.stat(os.path.join(folder, name))
+                count += 1
+    return count
+
+
+def walk_scandir(root, workers):
+    count = 0
+    with os.scandir(root) as it:
+        tops = sorted(entry.name for entry in it if entry.is_dir(follow_symlinks=False))
+    for top in tops:
+        for _ in scan_tree(root, top):
+            count += 1
+    return count
+
+
+def walk_parallel(root, workers):
+    return sum(1 for _ in parallel_walk(root, workers=workers))
+
+
+def measure(walk, root, workers, repeat):
+    timings, count = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = walk(root, workers)
+        timings.append(time.perf_counter() - started)
+    return count, statistics.median(timings), min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the document index tree walk.")
+    parser.add_argument('--root', help="Existing tree to walk instead of a synthetic one")
+    parser.add_argument('--patients', type=int, default=1000)
+    parser.add_argument('--folders', type=int, default=4)
+    parser.add_argument('--files', type=int, default=25)
+    parser.add_argument('--workers', type=int, nargs='+', default=[4, 8, 16])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help="Print raw results as JSON")
+    args = parser.parse_args()
+
+    root = args.root
+    if root is None:
+        root = tempfile.mkdtemp(prefix='bench_tree_walk_')
+        started = time.perf_counter()
+        build_tree(root, args.patients, args.folders, args.files)
+        print(f"Built {args.patients * args.folders * args.files} files in {root} "
+              f"({time.perf_counter() - started:.1f}s)", file=sys.stderr)
+    elif not os.path.isdir(root):
+        print(f"Error: {root!r} is not a directory.", file=sys.stderr)
+        sys.exit(1)
+
+    runs = [('listdir+walk', walk_listdir, 1), ('scandir', walk_scandir, 1)]
+    runs += [(f'parallel x{n}', walk_parallel, n) for n in args.workers]
+
+    try:
+        rows, raw = [], {}
+        baseline = None
+        for name, walk, workers in runs:
+            count, median, best = measure(walk, root, workers, args.repeat)
+            baseline = baseline or median
+            raw[name] = {'files': count, 'median_s': median, 'min_s': best}
+            rows.append([name, count, f'{median:.3f}', f'{best:.3f}', f'{baseline / median:.2f}x'])
+    finally:
+        if args.root is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(raw, indent=2))
+    else:
+        print(tabulate(rows, ['walk', 'files', 'median s', 'min s', 'speed-up']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+bench_wsgi_vs_asgi.py
+
+Compare the gunicorn sync deployment (gunicorn-cfg.py, core.wsgi) with the
+uvicorn-worker deployment (gunicorn-asgi-cfg.py, core.asgi) on the I/O-heavy
+endpoints. Start both servers first, e.g.
+
+    gunicorn -c gunicorn-cfg.py core.wsgi:application
+    gunicorn -c gunicorn-asgi-cfg.py core.asgi:application
+
+then run
+
+    python benchmarks/bench_wsgi_vs_asgi.py \
+        --sync-url http://127.0.0.1:5005 --asgi-url http://127.0.0.1:5006 \
+        --host emr.ghavimehr.com --document-id <uuid> --token <jwt> \
+        --jwt-secret "$ONLYOFFICE_JWT_SECRET"
+
+Each endpoint is hit `--requests` times with `--concurrency` parallel clients
+(one HTTP session each); latency percentiles and throughput are printed per
+server and endpoint. The OnlyOffice callback body is signed with
+--jwt-secret, as Document Server does; without a secret the callback would
+be rejected (403), so it is skipped.
+
+The endpoints are sync views, which the ASGI server runs one at a time per
+worker; expect it to lose at higher concurrency until they are made async.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import jwt
+import requests
+from tabulate import tabulate
+
+
+def build_endpoints(args):
+    endpoints = {
+        'chat': ('POST', '/api/chat/', {'json': {'prompt': 'help'}}),
+    }
+    if args.jwt_secret:
+        # status 1 = "document is being edited": verified and acknowledged, nothing saved
+        token = jwt.encode({'status': 1, 'key': 'bench'}, args.jwt_secret, algorithm='HS256')
+        endpoints['oocallback'] = ('POST', '/f/oocallback/', {'json': {'token': token}})
+    elif 'oocallback' in args.endpoints:
+        print("Skipping oocallback: no --jwt-secret (an unsigned callback gets a 403).", file=sys.stderr)
+    if args.document_id:
+        headers = {'Authorization': f'Bearer {args.token}'} if args.token else {}
+        endpoints['file'] = ('GET', f'/f/{args.document_id}/', {'headers': headers})
+    return {name: ep for name, ep in endpoints.items() if name in args.endpoints}
+
+
+def run(base_url, host, method, path, kwargs, total, concurrency, timeout):
+    local   = threading.local()       # requests.Session is not thread-safe: one per client thread
+    headers = dict(kwargs.get('headers', {}), Host=host) if host else kwargs.get('headers', {})
+    call_kwargs = dict(kwargs, headers=headers, timeout=timeout)
+
+    def one(_):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            resp = session.request(method, base_url + path, **call_kwargs)
+            resp.content  # read the full body
+            ok = resp.status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(r[0] for r in results)
+    errors = sum(1 for r in results if not r[1])
+    q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'p50_ms': q[49] * 1000,
+        'p95_ms': q[94] * 1000,
+        'p99_ms': q[98] * 1000,
+        'rps':    total / elapsed,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gunicorn sync vs ASGI workers.")
+    parser.add_argument('--sync-url', default='http://127.0.0.1:5005')
+    parser.add_argument('--asgi-url', default='http://127.0.0.1:5006')
+    parser.add_argument('--host', help="Host header (tenant domain) to send")
+    parser.add_argument('--document-id', help="Document UUID for the file-serving endpoint")
+    parser.add_argument('--token', help="OnlyOffice JWT for the file-serving endpoint")
+    parser.add_argument('--jwt-secret', default=os.environ.get('ONLYOFFICE_JWT_SECRET'),
+                        help="ONLYOFFICE_JWT_SECRET, to sign the callback body (default: from the environment)")
+    parser.add_argument('--endpoints', nargs='+', default=['oocallback', 'file', 'chat'])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--json', action='store_true', help="Print raw results as JSON")
+    args = parser.parse_args()
+
+    endpoints = build_endpoints(args)
+    if not endpoints:
+        print("Error: no endpoints selected.", file=sys.stderr)
+        sys.exit(1)
+
+    rows, raw = [], {}
+    for name, (method, path, kwargs) in endpoints.items():
+        for server, base_url in (('gunicorn sync', args.sync_url), ('asgi', args.asgi_url)):
+            res = run(base_url, args.host, method, path, kwargs,
+                      args.requests, args.concurrency, args.timeout)
+            raw.setdefault(name, {})[server] = res
+            rows.append([name, server, f"{res['p50_ms']:.1f}", f"{res['p95_ms']:.1f}",
+                         f"{res['p99_ms']:.1f}", f"{res['rps']:.1f}", res['errors']])
+
+    if args.json:
+        print(json.dumps(raw, indent=2))
+    else:
+        print(tabulate(rows, ['endpoint', 'server', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'errors']))
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,12 @@ class CoreConfig(AppConfig):
         Preload tenant DB connections. If Django is running under an async event loop (ASGI),
         offload the synchronous ORM calls to a background thread to avoid SynchronousOnlyOperation.
         """
+        import core.signals  # tenant registry invalidation
+
+        from core import instrumentation, slow_queries
+        instrumentation.install()  # SQL / template timing for InstrumentationMiddleware
+        slow_queries.install()     # sampled slow-query log
+
         try:
             loop = asyncio.get_event_loop()
         except RuntimeError:
@@ -29,23 +35,8 @@ class CoreConfig(AppConfig):
             self._preload_tenants()
 
     def _preload_tenants(self):
-        from django.conf import settings
         from core.models import DatabaseConfig
+        from core.tenant_db import register_tenant_database
 
         for cfg in DatabaseConfig.using_customer_config().all():
-            alias = cfg.name
-            if alias not in settings.DATABASES:
-                settings.DATABASES[alias] = {
-                    'ENGINE':            cfg.db_engine,
-                    'NAME':              cfg.db_name,
-                    'USER':              cfg.db_user,
-                    'PASSWORD':          cfg.db_password,
-                    'HOST':              cfg.db_host,
-                    'PORT':              cfg.db_port,
-                    'OPTIONS':           cfg.db_options,
-                    'TIME_ZONE':         cfg.db_timezone,
-                    'CONN_MAX_AGE':      60,
-                    'ATOMIC_REQUESTS':   True,
-                    'CONN_HEALTH_CHECKS':True,
-                    'AUTOCOMMIT':        True,
-                }
+            register_tenant_database(cfg.name, cfg)
@@ -10,6 +10,9 @@ celery_app = Celery('celery_app')
 celery_app.config_from_object('django.conf:settings', namespace='CELERY')
 celery_app.autodiscover_tasks()
 
+# tenant alias in task headers + router context in workers
+import core.tenant_tasks  # noqa: E402,F401
+
 celery_app.conf.beat_schedule = {
     'run-critical-task': {
         'task': 'apps.tasks.tasks.run_critical_task',
@@ -31,4 +34,10 @@ celery_app.conf.beat_schedule = {
         'task': 'apps.tasks.tasks.run_monthly_task',
         'schedule': crontab(minute=0, hour=0, day_of_month='1'),
     },
+    # moves old access rows to the archive; deletes only with AUDIT_LOG['RETENTION_DAYS']
+    'compact-access-logs': {
+        'task': 'core.for_each_tenant',
+        'args': ('files.compact_access_logs',),
+        'schedule': crontab(minute=30, hour=3),
+    },
 }
@@ -0,0 +1,30 @@
+# core/db_backends/mysql_pool/base.py
+"""
+MySQL backend that borrows connections from core.db_pool instead of opening
+a new one for every request.
+
+Django still "closes" the connection at the end of each request
+(CONN_MAX_AGE = 0); closing only hands it back to the pool.
+"""
+
+from django.db.backends.mysql import base as mysql_base
+
+from core.db_pool import connection_pool
+
+
+class DatabaseWrapper(mysql_base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        return connection_pool.checkout(
+            self.alias,
+            self.settings_dict,
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+        )
+
+    def _close(self):
+        if self.connection is not None:
+            # a connection closed inside atomic() stays referenced by this
+            # wrapper until the block exits, so it must not be shared
+            discard = self.in_atomic_block or self.errors_occurred
+            with self.wrap_database_errors:
+                connection_pool.release(self.alias, self.connection, discard=discard)
@@ -0,0 +1,258 @@
+# core/db_pool.py
+# In-process pool of raw DB-API connections for tenant databases.
+# Used by the core.db_backends.mysql_pool engine (see core/tenant_db.py).
+
+import os
+import time
+import logging
+import threading
+from collections import Counter, defaultdict, deque
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """No connection became available within WAIT_TIMEOUT seconds."""
+
+
+class TenantConnectionPool:
+    """
+    Keeps idle connections per tenant alias so that a request does not pay
+    for a new TCP/TLS/auth handshake.
+
+    - per tenant: at most `max_size` open connections (idle + checked out),
+      idle connections are dropped after `max_idle` seconds.
+    - all tenants: at most `max_total` open connections. When the cap is hit,
+      the least recently used idle connection of another tenant is evicted,
+      otherwise the caller waits up to `wait_timeout` seconds.
+    - a connection is pinged before it is handed out again and is never
+      reused after `max_lifetime` seconds.
+
+    Per-tenant limits come from settings_dict['POOL'] ({'MAX_SIZE', 'MAX_IDLE'}).
+    """
+
+    def __init__(self, max_size=4, max_idle=300, max_total=12, wait_timeout=5, max_lifetime=3600):
+        self.max_size     = max_size
+        self.max_idle     = max_idle
+        self.max_total    = max_total
+        self.wait_timeout = wait_timeout
+        self.max_lifetime = max_lifetime
+
+        self._cond     = threading.Condition()
+        self._idle     = defaultdict(deque)    # alias → deque[(conn, released_at)]
+        self._in_use   = Counter()             # alias → checked-out connections
+        self._born     = {}                    # id(conn) → created_at
+        self._max_idle = {}                    # alias → per-tenant max_idle
+        self._total    = 0
+        self.counters  = Counter()
+
+    # ------------------------------------------------------------------ public
+
+    def checkout(self, alias, settings_dict, connect):
+        """
+        Return a usable connection for `alias`. `connect()` opens a new one
+        when nothing idle is available.
+        """
+        limits   = settings_dict.get('POOL') or {}
+        max_size = limits.get('MAX_SIZE') or self.max_size
+        deadline = time.monotonic() + self.wait_timeout
+        waited   = False
+        to_close = []
+
+        with self._cond:
+            self.counters['checkouts'] += 1
+            self._max_idle[alias] = limits.get('MAX_IDLE') or self.max_idle
+            while True:
+                now = time.monotonic()
+                to_close += self._evict_expired(now)
+                idle = self._idle[alias]
+                if idle:
+                    conn, _ = idle.pop()        # LIFO: warmest connection first
+                    self._in_use[alias] += 1
+                    break
+                if self._open(alias) < max_size:
+                    if self._total >= self.max_total:
+                        victim = self._evict_lru_idle(exclude=alias)
+                        if victim is not None:
+                            to_close.append(victim)
+                    if self._total < self.max_total:
+                        # reserve the slot, connect outside the lock
+                        self._in_use[alias] += 1
+                        self._total += 1
+                        conn = None
+                        break
+                if not waited:
+                    self.counters['waits'] += 1
+                    waited = True
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.counters['wait_timeouts'] += 1
+                    self._close_all(to_close)
+                    raise PoolTimeout(
+                        f"No connection for '{alias}' within {self.wait_timeout}s "
+                        f"({self._open(alias)} open for tenant, {self._total} in total)"
+                    )
+                self._cond.wait(remaining)
+
+        self._close_all(to_close)
+
+        if conn is not None:
+            if self._is_healthy(conn):
+                self.counters['reused'] += 1
+                return conn
+            self.counters['health_check_failures'] += 1
+            self._forget(conn)
+            self._close_all([conn])
+
+        # the slot is reserved either way; open a fresh connection for it
+        try:
+            conn = connect()
+        except Exception:
+            with self._cond:
+                self._in_use[alias] -= 1
+                self._total -= 1
+                self._cond.notify()
+            raise
+        self.counters['created'] += 1
+        self._born[id(conn)] = time.monotonic()
+        return conn
+
+    def release(self, alias, conn, discard=False):
+        """Give `conn` back to the pool, or close it when `discard` is set."""
+        if not discard:
+            try:
+                # never hand out a connection with an open transaction
+                if not conn.get_autocommit():
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        now = time.monotonic()
+        born = self._born.get(id(conn), now)
+        if now - born >= self.max_lifetime:
+            discard = True
+
+        with self._cond:
+            self._in_use[alias] -= 1
+            if discard:
+                self._total -= 1
+                self.counters['discarded'] += 1
+            else:
+                self._idle[alias].append((conn, now))
+            self._cond.notify()
+
+        if discard:
+            self._forget(conn)
+            self._close_all([conn])
+
+    def stats(self):
+        """Counters plus the current idle / checked-out split per tenant."""
+        with self._cond:
+            tenants = {
+                alias: {'idle': len(self._idle[alias]), 'in_use': self._in_use[alias]}
+                for alias in set(self._idle) | set(self._in_use)
+            }
+            return {
+                'total':    self._total,
+                'max_total': self.max_total,
+                'counters': dict(self.counters),
+                'tenants':  tenants,
+            }
+
+    def close_idle(self):
+        """Close every idle connection (checked-out ones are left alone); returns how many."""
+        with self._cond:
+            idle = [conn for conns in self._idle.values() for conn, _ in conns]
+            self._idle.clear()
+            self._total -= len(idle)
+            for conn in idle:
+                self._forget(conn)
+        self._close_all(idle)
+        return len(idle)
+
+    def reset_after_fork(self):
+        # connections inherited from the parent belong to its sockets: forget
+        # them without closing (closing would send COM_QUIT on the parent's behalf)
+        self._cond     = threading.Condition()
+        self._idle     = defaultdict(deque)
+        self._in_use   = Counter()
+        self._born     = {}
+        self._total    = 0
+        self.counters  = Counter()
+
+    # ----------------------------------------------------------------- helpers
+
+    def _open(self, alias):
+        return len(self._idle[alias]) + self._in_use[alias]
+
+    def _evict_expired(self, now):
+        """Drop idle connections past their tenant's max_idle. Caller holds the lock."""
+        expired = []
+        for alias, idle in self._idle.items():
+            max_idle = self._max_idle.get(alias, self.max_idle)
+            # oldest releases are on the left
+            while idle and now - idle[0][1] >= max_idle:
+                conn, _ = idle.popleft()
+                expired.append(conn)
+        if expired:
+            self._total -= len(expired)
+            self.counters['evictions'] += len(expired)
+            for conn in expired:
+                self._born.pop(id(conn), None)
+        return expired
+
+    def _evict_lru_idle(self, exclude):
+        """Evict the longest-idle connection of any other tenant. Caller holds the lock."""
+        victim_alias, oldest = None, None
+        for alias, idle in self._idle.items():
+            if alias != exclude and idle and (oldest is None or idle[0][1] < oldest):
+                victim_alias, oldest = alias, idle[0][1]
+        if victim_alias is None:
+            return None
+        conn, _ = self._idle[victim_alias].popleft()
+        self._total -= 1
+        self.counters['evictions'] += 1
+        self._born.pop(id(conn), None)
+        return conn
+
+    def _forget(self, conn):
+        self._born.pop(id(conn), None)
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.ping()
+        except Exception:
+            return False
+        return True
+
+    @staticmethod
+    def _close_all(conns):
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                logger.debug("Error closing pooled connection", exc_info=True)
+
+
+def _build_pool():
+    config = getattr(settings, 'TENANT_DB_POOL', {})
+    pool = TenantConnectionPool(
+        max_size     = config.get('MAX_SIZE', 4),
+        max_idle     = config.get('MAX_IDLE', 300),
+        max_total    = config.get('MAX_TOTAL', 12),
+        wait_timeout = config.get('WAIT_TIMEOUT', 5),
+        max_lifetime = config.get('MAX_LIFETIME', 3600),
+    )
+    if pool.max_size > pool.max_total:
+        raise ImproperlyConfigured("TENANT_DB_POOL['MAX_SIZE'] cannot exceed MAX_TOTAL")
+    return pool
+
+
+connection_pool = _build_pool()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=connection_pool.reset_after_fork)
@@ -0,0 +1,109 @@
+# core/db_replicas.py
+# Read-replica selection for tenant databases, used by core.db_routers.TenantRouter.
+#
+# Replicas are declared on DatabaseConfig.replicas and registered next to the
+# primary by core/tenant_db.py as "<alias>__replica<N>". The primary's
+# DATABASES entry lists them under 'REPLICAS'; each replica entry points back
+# with 'PRIMARY'.
+
+import time
+import random
+import logging
+import threading
+import itertools
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def replicas_of(alias):
+    return settings.DATABASES.get(alias, {}).get('REPLICAS', [])
+
+
+def primary_of(alias):
+    """The primary alias for a replica alias (or the alias itself)."""
+    return settings.DATABASES.get(alias, {}).get('PRIMARY', alias)
+
+
+class ReplicaMonitor:
+    """
+    Tracks replica health per worker.
+
+    A replica is checked at most every `check_interval` seconds (lazily, when
+    a read is routed). It is dropped from the rotation when it cannot be
+    reached, when replication is stopped, or when its lag is above the
+    tenant's REPLICA_MAX_LAG; it comes back after a later check passes.
+    """
+
+    def __init__(self, check_interval=10):
+        self.check_interval = check_interval
+        self._status  = {}             # replica alias → (checked_at, healthy, lag)
+        self._cycles  = {}             # primary alias → round-robin counter
+        self._lock    = threading.Lock()
+
+    def choose(self, alias):
+        """A healthy replica of `alias`, or None to read from the primary."""
+        healthy = [r for r in replicas_of(alias) if self.is_healthy(r)]
+        if not healthy:
+            return None
+        with self._lock:
+            cycle = self._cycles.setdefault(alias, itertools.count(random.randrange(1000)))
+            index = next(cycle)
+        return healthy[index % len(healthy)]
+
+    def is_healthy(self, replica):
+        now = time.monotonic()
+        with self._lock:
+            status = self._status.get(replica)
+        if status is not None and now - status[0] < self.check_interval:
+            return status[1]
+
+        # mark as checked first so concurrent requests do not all probe it
+        with self._lock:
+            self._status[replica] = (now, status[1] if status else False, status[2] if status else None)
+
+        max_lag = settings.DATABASES[primary_of(replica)].get('REPLICA_MAX_LAG', 30)
+        lag = self._lag(replica)
+        healthy = lag is not None and lag <= max_lag
+        if status is not None and status[1] != healthy:
+            logger.warning("Replica %s %s rotation (lag=%s, max=%s)",
+                           replica, "back in" if healthy else "dropped from", lag, max_lag)
+        with self._lock:
+            self._status[replica] = (time.monotonic(), healthy, lag)
+        return healthy
+
+    def stats(self):
+        with self._lock:
+            return {alias: {'healthy': healthy, 'lag': lag}
+                    for alias, (_, healthy, lag) in self._status.items()}
+
+    @staticmethod
+    def _lag(replica):
+        """Replication lag in seconds; None when unreachable or not replicating."""
+        conn = connections[replica]
+        try:
+            if conn.vendor != 'mysql':
+                conn.ensure_connection()
+                return 0
+            with conn.cursor() as cursor:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")     # MySQL ≥ 8.0.22
+                except Exception:
+                    cursor.execute("SHOW SLAVE STATUS")
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                columns = [col[0] for col in cursor.description]
+            status = dict(zip(columns, row))
+            lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+            return None if lag is None else int(lag)
+        except Exception:
+            logger.warning("Replica %s is unreachable", replica, exc_info=True)
+            return None
+
+
+replica_monitor = ReplicaMonitor(
+    check_interval=getattr(settings, 'TENANT_REPLICAS', {}).get('CHECK_INTERVAL', 10),
+)
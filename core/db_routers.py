@@ -1,41 +1,143 @@
 # core/db_routers.py
 
-import threading
+import contextvars
+import functools
 
-_thread_locals = threading.local()
+from asgiref.sync import iscoroutinefunction
+
+from core.db_replicas import primary_of, replica_monitor, replicas_of
+
+# contextvars (not threading.local) so the value follows the request across
+# sync_to_async/async_to_sync hops under ASGI and never outlives it
+_current_tenant = contextvars.ContextVar('tenant_alias', default=None)
 
 def set_current_tenant(alias: str):
-    _thread_locals.tenant_alias = alias
+    """Set the tenant for the current context; returns a token for reset_current_tenant()."""
+    return _current_tenant.set(alias)
+
+def reset_current_tenant(token):
+    _current_tenant.reset(token)
 
 def get_current_tenant() -> str:
-    return getattr(_thread_locals, 'tenant_alias', None)
+    return _current_tenant.get()
+
+
+class ReadRouting:
+    """
+    Per-request replica state. Reads go to a replica until something is
+    written (or `pinned` is set by the middleware's sticky-primary cookie);
+    from then on they go to the primary so the user sees their own write.
+    """
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote  = False
+
+# unset (None) → no replica reads: Celery tasks, shell and commands read from
+# the primary unless they opt in with tenant(alias, read_replicas=True)
+_read_routing = contextvars.ContextVar('tenant_read_routing', default=None)
+
+def begin_read_routing(pinned=False):
+    """Allow replica reads in the current context; returns a token for end_read_routing()."""
+    return _read_routing.set(ReadRouting(pinned))
+
+def end_read_routing(token):
+    """Reset the context and return its ReadRouting (to check `.wrote`)."""
+    state = _read_routing.get()
+    _read_routing.reset(token)
+    return state
+
+def pin_to_primary():
+    """Send the remaining reads of the current context to the primary."""
+    state = _read_routing.get()
+    if state is not None:
+        state.pinned = True
+
+
+class tenant:
+    """
+    Route ORM queries to `alias` for a block of code or a function:
+
+        with tenant("emr_drarzaghi_com"):
+            Patient.objects.count()
+
+        @tenant("emr_drarzaghi_com", read_replicas=True)
+        def nightly_report(): ...
+
+    With read_replicas=True reads go to the tenant's replicas (until the
+    first write). Works for sync and async functions and restores the
+    previous tenant on exit.
+    """
+
+    def __init__(self, alias: str, read_replicas: bool = False):
+        self.alias         = alias
+        self.read_replicas = read_replicas
+        self._tokens       = []
+
+    def __enter__(self):
+        routing = begin_read_routing() if self.read_replicas else _read_routing.set(None)
+        self._tokens.append((_current_tenant.set(self.alias), routing))
+        return self.alias
+
+    def __exit__(self, exc_type, exc, tb):
+        tenant_token, routing_token = self._tokens.pop()
+        _read_routing.reset(routing_token)
+        _current_tenant.reset(tenant_token)
+        return False
+
+    def __call__(self, func):
+        if iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def _async_wrapped(*args, **kwargs):
+                with tenant(self.alias, self.read_replicas):
+                    return await func(*args, **kwargs)
+            return _async_wrapped
+
+        @functools.wraps(func)
+        def _wrapped(*args, **kwargs):
+            with tenant(self.alias, self.read_replicas):
+                return func(*args, **kwargs)
+        return _wrapped
 
 
 class TenantRouter:
     """
     - core app models (branding, db, onlyoffice, connection) → customer_config
     - all other models → current tenant DB (set in middleware)
+    - reads → a healthy replica of the tenant DB when it has any and the
+      context allows it (see ReadRouting); writes always → the primary
     """
 
     def db_for_read(self, model, **hints):
         if model._meta.app_label == 'core':
             return 'customer_config'
-        return get_current_tenant() or 'default'
+        alias = get_current_tenant() or 'default'
+        state = _read_routing.get()
+        if state is None or state.pinned or not replicas_of(alias):
+            return alias
+        return replica_monitor.choose(alias) or alias
 
     def db_for_write(self, model, **hints):
         if model._meta.app_label == 'core':
             return 'customer_config'
+        state = _read_routing.get()
+        if state is not None:
+            state.wrote = state.pinned = True
         return get_current_tenant() or 'default'
 
     def allow_relation(self, obj1, obj2, **hints):
-        # allow relations only within same DB
-        db1 = obj1._state.db
-        db2 = obj2._state.db
+        # allow relations only within same DB (a replica counts as its primary)
+        db1 = primary_of(obj1._state.db)
+        db2 = primary_of(obj2._state.db)
         if db1 == db2:
             return True
         return False
 
     def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema through replication
+        if primary_of(db) != db:
+            return False
         # core app → only on customer_config
         if app_label == 'core':
             return db == 'customer_config'
@@ -1,59 +1,116 @@
 # core/dynamic_domain.py
 
-from django.utils.deprecation import MiddlewareMixin
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.conf import settings
 
-from core.models import Branding, Connection
-from core.db_routers import set_current_tenant
+from core.db_replicas import replicas_of
+from core.db_routers import (
+    begin_read_routing, end_read_routing, reset_current_tenant, set_current_tenant,
+)
+from core.tenant_db import register_tenant_database
+from core.tenant_registry import tenant_registry
+
 
+_replica_config = getattr(settings, 'TENANT_REPLICAS', {})
+STICKY_COOKIE   = _replica_config.get('STICKY_COOKIE', 'tenant_primary')
+STICKY_SECONDS  = _replica_config.get('STICKY_SECONDS', 10)
 
-class DynamicDomainMiddleware(MiddlewareMixin):
+
+class DynamicDomainMiddleware:
     """
     On each request:
-    1. Look up Branding by request domain from customer_config.
-    2. Pull Connection → DatabaseConfig + OnlyOfficeConfig.
-    3. Dynamically register tenant DB under alias.
-    4. Set thread‐local for router.
-    5. Attach branding & onlyoffice to request.
+    1. Resolve the request domain through the per-worker tenant registry
+       (Branding → Connection → DatabaseConfig + OnlyOfficeConfig, cached).
+    2. Dynamically register tenant DB under alias.
+    3. Set the tenant context (a contextvar) for the router.
+    4. Attach branding & onlyoffice to request.
+    5. Reset the tenant context once the response is built.
+    6. Tenants with read replicas: after a request that wrote, set a short
+       sticky-primary cookie so the next requests of that browser read
+       from the primary until the replicas have caught up.
+
+    Works under WSGI and ASGI: in an async stack only a registry miss is
+    pushed to a thread, a cache hit never leaves the event loop. That only
+    pays off for async views: under ASGI Django runs sync views one at a time
+    per worker (thread_sensitive), so WSGI (gunicorn-cfg.py) stays the
+    default deployment, see gunicorn-asgi-cfg.py.
     """
 
-    def process_request(self, request):
-        host = request.get_host().split(':')[0]
-        branding_qs = Branding.using_customer_config().filter(domain_name=host)
-        branding = branding_qs.first()
-        if not branding:
+    sync_capable  = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        tenant = tenant_registry.get(self._host(request))
+        if tenant is None:
             # let it 404 or fall back
-            return
-
-        conn = Connection.using_customer_config() \
-                  .select_related('default_database', 'onlyoffice') \
-                  .get(branding=branding)
-
-        db = conn.default_database
-        # create a safe alias (no dots)
-        alias = host.replace('.', '_')
-
-        # register this tenant if not already
-        if alias not in settings.DATABASES:
-            settings.DATABASES[alias] = {
-                'ENGINE':   db.db_engine,
-                'NAME':     db.db_name,
-                'USER':     db.db_user,
-                'PASSWORD': db.db_password,
-                'HOST':     db.db_host,
-                'PORT':     db.db_port,
-                'OPTIONS':  db.db_options,
-                'CONN_MAX_AGE':   0,      #How many seconds the Django-database connection can be kept open for reuses.
-                'CONN_HEALTH_CHECKS': True,
-                'TIME_ZONE': db.db_timezone,
-                'ATOMIC_REQUESTS': True,
-                'CONN_HEALTH_CHECKS': True,
-                'AUTOCOMMIT':        True,
-            }
-
-        # tell the router to use this alias
-        set_current_tenant(alias)
+            return self.get_response(request)
+
+        tokens = self._activate(request, tenant)
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            self._deactivate(tenant, tokens, response)
+
+    async def __acall__(self, request):
+        tenant = tenant_registry.peek(self._host(request))
+        if tenant is tenant_registry.MISS:
+            tenant = await sync_to_async(tenant_registry.get)(self._host(request))
+        if tenant is None:
+            return await self.get_response(request)
+
+        tokens = self._activate(request, tenant)
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            self._deactivate(tenant, tokens, response)
+
+    @staticmethod
+    def _host(request):
+        return request.get_host().split(':')[0]
+
+    @staticmethod
+    def _activate(request, tenant):
+        # register this tenant if not already (pooled connections, see core/tenant_db.py)
+        register_tenant_database(tenant.alias, tenant.database)
 
         # attach to request for later use
-        request.branding         = branding
-        request.onlyoffice_config= conn.onlyoffice
+        request.branding          = tenant.branding
+        request.onlyoffice_config = tenant.onlyoffice
+
+        # tell the router to use this alias, and whether reads may use its replicas
+        pinned = False
+        if replicas_of(tenant.alias):
+            try:
+                pinned = float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+            except ValueError:
+                pass
+        return set_current_tenant(tenant.alias), begin_read_routing(pinned)
+
+    @staticmethod
+    def _deactivate(tenant, tokens, response):
+        tenant_token, routing_token = tokens
+        routing = end_read_routing(routing_token)
+        reset_current_tenant(tenant_token)
+
+        if response is not None and routing.wrote and replicas_of(tenant.alias):
+            response.set_cookie(
+                STICKY_COOKIE,
+                f"{time.time() + STICKY_SECONDS:.0f}",
+                max_age  = STICKY_SECONDS,
+                httponly = True,
+                samesite = 'Lax',
+            )
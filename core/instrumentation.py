@@ -0,0 +1,317 @@
+# core/instrumentation.py
+# Per-tenant, per-view request metrics exported in Prometheus text format.
+#
+# InstrumentationMiddleware (right after DynamicDomainMiddleware) records for
+# every request, labelled by (tenant alias, resolved view name):
+#   - wall time, SQL time and query count (execute wrapper installed on every
+#     new DB connection), and template render time.
+# Each worker keeps its histograms in memory and writes a snapshot to
+# INSTRUMENTATION['DIR'] every few seconds; /metrics/ merges the snapshots
+# of all workers, so any worker can answer the scrape. gunicorn-cfg.py
+# removes a worker's snapshot when it exits (child_exit) and those of dead
+# workers at start-up (on_starting).
+
+import os
+import json
+import time
+import glob
+import bisect
+import logging
+import threading
+import contextvars
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+from core.db_routers import get_current_tenant
+
+logger = logging.getLogger(__name__)
+
+_config        = getattr(settings, 'INSTRUMENTATION', {})
+ENABLED        = _config.get('ENABLED', True)
+METRICS_DIR    = _config.get('DIR', os.path.join(settings.BASE_DIR, 'logs', 'metrics'))
+FLUSH_INTERVAL = _config.get('FLUSH_INTERVAL', 5)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS   = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+HISTOGRAMS = {
+    # name                          (buckets,         help)
+    'emr_request_seconds':          (SECONDS_BUCKETS, 'Wall time per request'),
+    'emr_request_db_seconds':       (SECONDS_BUCKETS, 'Time spent in SQL per request'),
+    'emr_request_db_queries':       (QUERY_BUCKETS,   'SQL queries per request'),
+    'emr_request_template_seconds': (SECONDS_BUCKETS, 'Template render time per request'),
+}
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'template_time', 'view')
+
+    def __init__(self):
+        self.queries       = 0
+        self.db_time       = 0.0
+        self.template_time = 0.0
+        self.view          = None
+
+
+_request_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+def current_view():
+    """Resolved view name of the request being handled (None outside a request)."""
+    stats = _request_stats.get()
+    return stats.view if stats is not None else None
+
+
+class Metrics:
+    """
+    In-memory histograms keyed by (name, tenant, view), plus the worker's
+    snapshot file. Observations are a lock + a few additions.
+    """
+
+    def __init__(self):
+        self._lock       = threading.Lock()
+        self._series     = {}             # (name, tenant, view) → [bucket counts…, sum, count]
+        self._last_flush = time.monotonic()
+
+    def observe(self, name, tenant, view, value):
+        buckets = HISTOGRAMS[name][0]
+        key = (name, tenant, view)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+            series[bisect.bisect_left(buckets, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        from core.db_pool import connection_pool
+        from core.slow_queries import slow_query_log
+        from core.tenant_cache import cache_stats
+
+        with self._lock:
+            histograms = [[*key, list(series)] for key, series in self._series.items()]
+        pool = connection_pool.stats()
+        return {
+            'histograms': histograms,
+            # [name, labels, value]; summed over workers by render_prometheus()
+            'counters': [
+                *[[f'emr_db_pool_{event}_total', {}, value] for event, value in pool['counters'].items()],
+                *[[f'emr_tenant_cache_{kind}_total', {'function': name}, value]
+                  for name, stats in cache_stats.snapshot().items() for kind, value in stats.items()],
+                *[[f'emr_slow_queries_{event}_total', {}, value]
+                  for event, value in slow_query_log.counters.items()],
+            ],
+            'gauges': [
+                ['emr_db_pool_connections', {}, pool['total']],
+                *[[f'emr_db_pool_{state}_connections', {'tenant': alias}, value]
+                  for alias, states in pool['tenants'].items() for state, value in states.items()],
+            ],
+        }
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Write this worker's snapshot atomically to METRICS_DIR/<pid>.json."""
+        self._last_flush = time.monotonic()
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            path = os.path.join(METRICS_DIR, f'{os.getpid()}.json')
+            with open(path + '.tmp', 'w') as fh:
+                json.dump(self.snapshot(), fh)
+            os.replace(path + '.tmp', path)
+        except Exception:
+            logger.exception("Instrumentation: could not write metrics snapshot")
+
+    def reset_after_fork(self):
+        self._lock       = threading.Lock()
+        self._series     = {}
+        self._last_flush = time.monotonic()
+
+
+metrics = Metrics()
+os.register_at_fork(after_in_child=metrics.reset_after_fork)
+
+
+# ----------------------------------------------------------------- collection
+
+def _record_query(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - started
+        stats.queries += 1
+
+
+def _install_execute_wrapper(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def instrument_templates():
+    """Time django.template.backends.django.Template.render (top-level renders only)."""
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, '_instrumented', False):
+        return
+    original = Template.render
+
+    def render(self, context=None, request=None):
+        stats = _request_stats.get()
+        if stats is None:
+            return original(self, context, request)
+        started = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+
+    render._instrumented = True
+    Template.render = render
+
+
+def install():
+    """Called from CoreConfig.ready()."""
+    if ENABLED:
+        connection_created.connect(_install_execute_wrapper, dispatch_uid='core.instrumentation')
+        instrument_templates()
+
+
+class InstrumentationMiddleware:
+    """
+    Records wall / SQL / template time and query count per (tenant, view).
+    Must come after DynamicDomainMiddleware so the tenant context is set.
+    """
+
+    sync_capable  = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not ENABLED:
+            return self.get_response(request)
+
+        token, started = _request_stats.set(RequestStats()), time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            self._record(request, token, started)
+
+    async def __acall__(self, request):
+        if not ENABLED:
+            return await self.get_response(request)
+
+        token, started = _request_stats.set(RequestStats()), time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            self._record(request, token, started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = _request_stats.get()
+        if stats is not None and request.resolver_match is not None:
+            stats.view = request.resolver_match.view_name
+
+    @staticmethod
+    def _record(request, token, started):
+        elapsed = time.perf_counter() - started
+        stats   = _request_stats.get()
+        _request_stats.reset(token)
+
+        match  = getattr(request, 'resolver_match', None)
+        view   = match.view_name if match else 'unresolved'
+        tenant = get_current_tenant() or 'default'
+
+        metrics.observe('emr_request_seconds',          tenant, view, elapsed)
+        metrics.observe('emr_request_db_seconds',       tenant, view, stats.db_time)
+        metrics.observe('emr_request_db_queries',       tenant, view, stats.queries)
+        metrics.observe('emr_request_template_seconds', tenant, view, stats.template_time)
+        metrics.maybe_flush()
+
+
+# ------------------------------------------------------------------- export
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def render_prometheus(snapshots):
+    """Merge worker snapshots (sums) and render them in Prometheus text format."""
+    histograms = {}
+    scalars    = {'counter': defaultdict(float), 'gauge': defaultdict(float)}
+    for snap in snapshots:
+        for name, tenant, view, series in snap.get('histograms', []):
+            merged = histograms.setdefault((name, tenant, view), [0] * len(series))
+            for i, value in enumerate(series):
+                merged[i] += value
+        for kind, key in (('counter', 'counters'), ('gauge', 'gauges')):
+            for name, labels, value in snap.get(key, []):
+                scalars[kind][(name, tuple(sorted(labels.items())))] += value
+
+    lines = []
+    for name, (buckets, help_text) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (metric, tenant, view), series in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), series):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(tenant=tenant, view=view, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(tenant=tenant, view=view)} {series[-2]:.6f}')
+            lines.append(f'{name}_count{_labels(tenant=tenant, view=view)} {series[-1]}')
+
+    for kind, values in scalars.items():
+        typed = set()
+        for (name, labels), value in sorted(values.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name}{_labels(**dict(labels)) if labels else ""} {value:g}')
+    return '\n'.join(lines) + '\n'
+
+
+def read_snapshots():
+    snapshots = []
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+        try:
+            with open(path) as fh:
+                snapshots.append(json.load(fh))
+        except (OSError, ValueError):
+            continue   # being replaced or removed by its worker
+    return snapshots
+
+
+def metrics_view(request):
+    """Staff-only Prometheus endpoint (or 'Authorization: Bearer <INSTRUMENTATION TOKEN>' for scrapers)."""
+    token = _config.get('TOKEN')
+    bearer = request.headers.get('Authorization', '')
+    if not (token and bearer == f'Bearer {token}') and not request.user.is_staff:
+        raise PermissionDenied
+
+    metrics.flush()   # include this worker's latest numbers
+    return HttpResponse(
+        render_prometheus(read_snapshots()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
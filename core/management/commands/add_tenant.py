@@ -2,9 +2,9 @@
 import os
 from django.core.management.base import BaseCommand, CommandError
 from django.core.management import call_command
-from django.conf import settings
 from django.contrib.sites.models import Site
 from core.models import DatabaseConfig
+from core.tenant_db import register_tenant_database
 from core.models import Branding  # if you also want to create a Branding row
 
 class Command(BaseCommand):
@@ -64,21 +64,7 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING(f"→ DatabaseConfig for '{alias}' updated."))
 
         # 4) Register the alias in settings.DATABASES
-        if alias not in settings.DATABASES:
-            settings.DATABASES[alias] = {
-                'ENGINE':            engine,
-                'NAME':              name,
-                'USER':              user,
-                'PASSWORD':          password,
-                'HOST':              host,
-                'PORT':              port,
-                'OPTIONS':           {"init_command":"SET sql_mode='STRICT_TRANS_TABLES'"},
-                'TIME_ZONE':         timezone,
-                'CONN_MAX_AGE':      0,     # close immediately by default
-                'ATOMIC_REQUESTS':   False, # or True if you prefer
-                'CONN_HEALTH_CHECKS':True,
-                'AUTOCOMMIT':        True,
-            }
+        register_tenant_database(alias, cfg)
 
         # 5) Run migrations on the new tenant
         self.stdout.write(self.style.MIGRATE_LABEL(f"--- Migrating tenant DB '{alias}' ---"))
@@ -1,9 +1,68 @@
 # core/management/commands/migrate_tenants.py
-from django.core.management.base import BaseCommand
-from django.core.management import call_command
+import os
+import time
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management import call_command
+from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
+from django.utils import timezone
+from tabulate import tabulate
 
+from core.db_pool import connection_pool
 from core.models import DatabaseConfig
+from core.tenant_db import tenant_database_settings
+
+
+def pending_migrations(alias):
+    """Migrations `migrate` would apply on `alias` (empty list = up to date)."""
+    executor = MigrationExecutor(connections[alias])
+    targets = executor.loader.graph.leaf_nodes()
+    return executor.migration_plan(targets)
+
+
+def migrate_tenant(alias, db_settings, fake, log_path):
+    """
+    Check the migration plan of one tenant and migrate it if needed.
+    Runs inside a worker process for --jobs > 1, so everything it needs is
+    passed in and the outcome is returned as a plain dict.
+    """
+    import django
+    django.setup()   # no-op when forked from the (already set up) parent
+
+    # Dynamically register tenant DB if missing
+    settings.DATABASES.setdefault(alias, db_settings)
+
+    result = {'tenant': alias, 'pending': 0, 'log': log_path}
+    started = time.monotonic()
+    with open(log_path, 'w') as log:
+        try:
+            plan = pending_migrations(alias)
+            result['pending'] = len(plan)
+            if not plan:
+                log.write("No migrations to apply.\n")
+                result['outcome'] = 'up to date'
+            else:
+                for migration, backwards in plan:
+                    log.write(f"pending: {migration.app_label}.{migration.name}\n")
+                cmd_opts = {'database': alias, 'interactive': False, 'stdout': log, 'stderr': log}
+                if fake:
+                    cmd_opts['fake'] = True
+                call_command('migrate', **cmd_opts)
+                result['outcome'] = 'faked' if fake else 'migrated'
+        except Exception as exc:
+            log.write(traceback.format_exc())
+            result['outcome'] = 'failed'
+            result['error'] = str(exc)
+        finally:
+            connections[alias].close()
+    result['duration'] = time.monotonic() - started
+    return result
+
 
 class Command(BaseCommand):
     help = 'Run migrations on all or a specific tenant database defined in customer_config'
@@ -20,10 +79,23 @@ class Command(BaseCommand):
             dest='tenant',
             help='Name of a single tenant to migrate (default: all tenants)',
         )
+        parser.add_argument(
+            '--jobs', '-j',
+            type=int,
+            default=1,
+            dest='jobs',
+            help='Number of tenants migrated in parallel, each in its own process (default: 1)',
+        )
+        parser.add_argument(
+            '--log-dir',
+            dest='log_dir',
+            help='Directory for the per-tenant log files (default: logs/migrate_tenants/<timestamp>)',
+        )
 
     def handle(self, *args, **options):
         fake = options.get('fake', False)
         tenant_name = options.get('tenant')
+        jobs = max(1, options.get('jobs') or 1)
 
         # Migrate metadata first
         self.stdout.write('Migrating customer_config metadata database...')
@@ -40,30 +112,56 @@ class Command(BaseCommand):
                 self.stderr.write(self.style.ERROR(f"No tenant named '{tenant_name}' found."))
                 return
 
+        log_dir = options.get('log_dir') or os.path.join(
+            settings.BASE_DIR, 'logs', 'migrate_tenants',
+            timezone.now().strftime('%Y%m%d-%H%M%S'),
+        )
+        os.makedirs(log_dir, exist_ok=True)
+
+        work = [
+            (cfg.name, settings.DATABASES.get(cfg.name) or tenant_database_settings(cfg),
+             fake, os.path.join(log_dir, f"{cfg.name}.log"))
+            for cfg in qs
+        ]
+
         # Migrate each tenant
-        for cfg in qs:
-            alias = cfg.name
-            # Dynamically register tenant DB if missing
-            if alias not in settings.DATABASES:
-                settings.DATABASES[alias] = {
-                    'ENGINE':            cfg.db_engine,
-                    'NAME':              cfg.db_name,
-                    'USER':              cfg.db_user,
-                    'PASSWORD':          cfg.db_password,
-                    'HOST':              cfg.db_host,
-                    'PORT':              cfg.db_port,
-                    'OPTIONS':           cfg.db_options,
-                    'TIME_ZONE':         cfg.db_timezone,
-                    'CONN_MAX_AGE':      60,
-                    'ATOMIC_REQUESTS':   True,
-                    'CONN_HEALTH_CHECKS':True,
-                    'AUTOCOMMIT':        True,
-                }
-
-            self.stdout.write(f"--- Migrating tenant: '{alias}' ---")
-            cmd_opts = {'database': alias, 'interactive': False}
-            if fake:
-                cmd_opts['fake'] = True
-            call_command('migrate', **cmd_opts)
+        results = []
+        jobs = min(jobs, len(work))
+        if jobs <= 1:
+            for item in work:
+                self.stdout.write(f"--- Migrating tenant: '{item[0]}' ---")
+                results.append(self._report(migrate_tenant(*item)))
+        else:
+            # close_all() only hands pooled connections back to the pool; a
+            # forked child forgets those (reset_after_fork) but would still
+            # hold copies of their sockets, so close the idle ones for real
+            connections.close_all()
+            connection_pool.close_idle()
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+            self.stdout.write(f"Migrating {len(work)} tenant(s) with {jobs} workers...")
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+                futures = [pool.submit(migrate_tenant, *item) for item in work]
+                for future in as_completed(futures):
+                    results.append(self._report(future.result()))
 
+        # Summary
+        results.sort(key=lambda r: r['tenant'])
+        self.stdout.write('')
+        self.stdout.write(tabulate(
+            [[r['tenant'], r['outcome'], r['pending'], f"{r['duration']:.1f}s", r['log']] for r in results],
+            ['tenant', 'outcome', 'pending', 'duration', 'log'],
+        ))
+
+        failed = [r['tenant'] for r in results if r['outcome'] == 'failed']
+        if failed:
+            raise CommandError(f"Migrations failed for: {', '.join(failed)} (see logs in {log_dir})")
         self.stdout.write(self.style.SUCCESS('Migrations complete.'))
+
+    def _report(self, result):
+        style = {
+            'failed':     self.style.ERROR,
+            'up to date': self.style.NOTICE,
+        }.get(result['outcome'], self.style.SUCCESS)
+        self.stdout.write(style(f"{result['tenant']}: {result['outcome']} ({result['duration']:.1f}s)"))
+        return result
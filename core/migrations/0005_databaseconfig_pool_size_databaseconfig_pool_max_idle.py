@@ -0,0 +1,31 @@
+# Generated by Django 4.2.8 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_alter_branding_slogan1_en_alter_branding_slogan1_fa_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="databaseconfig",
+            name="pool_size",
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                help_text="max pooled connections per worker (empty = TENANT_DB_POOL default)",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="databaseconfig",
+            name="pool_max_idle",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="seconds an idle pooled connection is kept (empty = TENANT_DB_POOL default)",
+                null=True,
+            ),
+        ),
+    ]
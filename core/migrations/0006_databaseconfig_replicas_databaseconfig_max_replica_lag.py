@@ -0,0 +1,30 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_databaseconfig_pool_size_databaseconfig_pool_max_idle"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="databaseconfig",
+            name="replicas",
+            field=models.JSONField(
+                blank=True,
+                default=list,
+                help_text='read replicas: [{"host": ..., "port": ...}], other keys default to the primary\'s',
+            ),
+        ),
+        migrations.AddField(
+            model_name="databaseconfig",
+            name="max_replica_lag",
+            field=models.PositiveIntegerField(
+                default=30,
+                help_text="seconds of replication lag after which a replica is taken out of rotation",
+            ),
+        ),
+    ]
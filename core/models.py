@@ -131,6 +131,10 @@ class DatabaseConfig(models.Model):
     db_port     = models.IntegerField(default=3307)
     db_options  = models.JSONField(default={"init_command": "SET sql_mode='STRICT_TRANS_TABLES'"})
     db_timezone = models.CharField(max_length=100, default="Asia/Tehran")
+    pool_size     = models.PositiveSmallIntegerField(null=True, blank=True, help_text="max pooled connections per worker (empty = TENANT_DB_POOL default)")
+    pool_max_idle = models.PositiveIntegerField(null=True, blank=True, help_text="seconds an idle pooled connection is kept (empty = TENANT_DB_POOL default)")
+    replicas        = models.JSONField(default=list, blank=True, help_text='read replicas: [{"host": ..., "port": ...}], other keys default to the primary\'s')
+    max_replica_lag = models.PositiveIntegerField(default=30, help_text="seconds of replication lag after which a replica is taken out of rotation")
 
     class Meta:
         db_table  = 'databaseconfig'
@@ -55,6 +55,40 @@ ONLYOFFICE_CALLBACK = "https://emr.ghavimehr.com/f/oocallback/"
 PATIENT_DATA = os.path.join(BASE_DIR, "data")
 ONLYOFFICE_JWT_EXPIRE = 7200
 
+# How serve_patient_file sends the bytes (apps/emr/files/delivery.py): 'python'
+# streams from the worker; 'nginx' (X-Accel-Redirect to INTERNAL_PREFIX, an
+# `internal` location aliasing PATIENT_DATA) or 'sendfile' (X-Sendfile) hand
+# the transfer to the front server.
+FILE_DELIVERY = {
+    'BACKEND':         os.environ.get('FILE_DELIVERY_BACKEND', 'python'),
+    'INTERNAL_PREFIX': '/protected/patient_data/',
+}
+
+# Content-addressed blobs behind the patient files (apps/emr/files/blobstore.py).
+# ROOT must be on the same filesystem as PATIENT_DATA for 'reflink' (btrfs, XFS;
+# copies elsewhere) and 'hardlink' (shares inodes across patients: see the
+# module before enabling it); 'copy' works anywhere but does not deduplicate.
+BLOB_STORE = {
+    'ROOT': os.environ.get('BLOB_STORE_ROOT', os.path.join(PATIENT_DATA, '.blobs')),
+    'LINK': os.environ.get('BLOB_STORE_LINK', 'reflink'),
+}
+
+# First-page document previews (apps/emr/files/thumbnails.py); PDFs need
+# poppler-utils (pdftoppm, pdftotext) on the Celery workers.
+THUMBNAILS = {
+    'SIZE':     int(os.environ.get('THUMBNAIL_SIZE', 256)),
+    'PDFTOPPM': os.environ.get('PDFTOPPM', 'pdftoppm'),
+    'TIMEOUT':  30,
+}
+
+# Full-text search over document contents (apps/emr/files/search_index.py):
+# one SQLite FTS5 file per tenant in DIR, filled by the Celery workers.
+SEARCH_INDEX = {
+    'DIR':       os.environ.get('SEARCH_INDEX_DIR', os.path.join(PATIENT_DATA, '.search')),
+    'PDFTOTEXT': os.environ.get('PDFTOTEXT', 'pdftotext'),
+    'TIMEOUT':   60,
+}
+
 
 # Hosts Settings
 ALLOWED_HOSTS = [ 'emr.ghavimehr.com', '.emr.ghavimehr.com','www.emr.ghavimehr.com', 
@@ -105,6 +139,10 @@ LOGGING = {
             'format': '{levelname} {asctime} {message}',
             'style': '{',
         },
+        'message': {
+            'format': '{message}',
+            'style': '{',
+        },
     },
     'handlers': {
         'db_file': {
@@ -119,15 +157,27 @@ LOGGING = {
             'filename': os.path.join(BASE_DIR, 'logs', 'main.log'),
             'formatter': 'simple',
         },
+        'slow_query_file': {
+            'level': 'WARNING',
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': os.path.join(BASE_DIR, 'logs', 'slow_queries.log'),
+            'formatter': 'message',
+        },
         'console': {
             'class': 'logging.StreamHandler',
             'formatter': 'simple',
         },
     },
     'loggers': {
+        # SQL errors only; slow statements go to core.slow_queries.log
         'django.db.backends': {
-            'handlers': ['db_file', 'console'],
-            'level': 'DEBUG',
+            'handlers': ['db_file'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'core.slow_queries.log': {
+            'handlers': ['slow_query_file'],
+            'level': 'WARNING',
             'propagate': False,
         },
         'django': {
@@ -150,6 +200,11 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': True,
         },
+        'core.warmup': {
+            'handlers': ['main_file', 'console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
@@ -237,6 +292,8 @@ MIDDLEWARE = [
     #my important middleware
     "apps.common.middlewares.RealIPMiddleware",
     "core.dynamic_domain.DynamicDomainMiddleware",
+    "core.instrumentation.InstrumentationMiddleware",
+    "apps.emr.files.audit.AuditMiddleware",
 
 
     "django.middleware.security.SecurityMiddleware",
@@ -335,6 +392,73 @@ DB_NAME     = os.environ.get('DB_NAME')
 
 DATABASE_ROUTERS = ['core.db_routers.TenantRouter']
 
+# Per-worker cache of host → tenant config used by DynamicDomainMiddleware
+TENANT_REGISTRY = {
+    'MAX_SIZE':     int(os.environ.get('TENANT_REGISTRY_MAX_SIZE', 256)),
+    'TTL':          int(os.environ.get('TENANT_REGISTRY_TTL', 300)),      # seconds, known hosts
+    'NEGATIVE_TTL': int(os.environ.get('TENANT_REGISTRY_NEGATIVE_TTL', 60)), # seconds, unknown hosts
+}
+
+# Per-worker connection pool for tenant databases (core/db_pool.py).
+# MAX_SIZE / MAX_IDLE can be overridden per tenant on DatabaseConfig.
+# A request holds one tenant connection (ATOMIC_REQUESTS only applies to the
+# request's tenant, see core/tenant_db.py); keep workers × MAX_TOTAL (10 × 12
+# with gunicorn-cfg.py) below the MySQL server's max_connections (151).
+TENANT_DB_POOL = {
+    'ENABLED':      str2bool(os.environ.get('TENANT_DB_POOL_ENABLED', 'True')),
+    'MAX_SIZE':     int(os.environ.get('TENANT_DB_POOL_MAX_SIZE', 4)),       # per tenant
+    'MAX_IDLE':     int(os.environ.get('TENANT_DB_POOL_MAX_IDLE', 300)),     # seconds
+    'MAX_TOTAL':    int(os.environ.get('TENANT_DB_POOL_MAX_TOTAL', 12)),     # all tenants
+    'WAIT_TIMEOUT': int(os.environ.get('TENANT_DB_POOL_WAIT_TIMEOUT', 5)),   # seconds
+    'MAX_LIFETIME': int(os.environ.get('TENANT_DB_POOL_MAX_LIFETIME', 3600)),# seconds
+}
+
+# Read replicas of tenant databases (DatabaseConfig.replicas, core/db_replicas.py)
+TENANT_REPLICAS = {
+    'CHECK_INTERVAL': int(os.environ.get('TENANT_REPLICAS_CHECK_INTERVAL', 10)), # seconds between lag checks
+    'STICKY_SECONDS': int(os.environ.get('TENANT_REPLICAS_STICKY_SECONDS', 10)), # reads on primary after a write
+    'STICKY_COOKIE':  'tenant_primary',
+}
+
+# Per-tenant / per-view request metrics, exported at /metrics/ (core/instrumentation.py)
+INSTRUMENTATION = {
+    'ENABLED':        str2bool(os.environ.get('INSTRUMENTATION_ENABLED', 'True')),
+    'DIR':            os.environ.get('INSTRUMENTATION_DIR', os.path.join(BASE_DIR, 'logs', 'metrics')),
+    'FLUSH_INTERVAL': 5,                                   # seconds between worker snapshots
+    'TOKEN':          os.environ.get('METRICS_TOKEN'),     # bearer token for Prometheus (else staff only)
+}
+
+# Slow-query log (core/slow_queries.py), written by a background thread
+SLOW_QUERY_LOG = {
+    'ENABLED':              str2bool(os.environ.get('SLOW_QUERY_LOG_ENABLED', 'True')),
+    'THRESHOLD_MS':         int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200)),
+    'SAMPLE_RATE':          float(os.environ.get('SLOW_QUERY_SAMPLE_RATE', 1.0)),  # of the slow ones
+    'EXPLAIN_THRESHOLD_MS': int(os.environ.get('SLOW_QUERY_EXPLAIN_MS', 1000)),    # 0 disables EXPLAIN
+    'EXPLAIN_INTERVAL':     300,                  # seconds between EXPLAINs of one fingerprint
+    'QUEUE_SIZE':           10000,
+}
+
+# Document access audit (apps/emr/files/audit.py): 'sync' writes each event
+# at once, 'bulk' one bulk_create per request, 'celery' hands the request's
+# events to a task, 'spool' appends them to an fsync'd local file loaded by
+# `manage.py load_access_logs`.
+AUDIT_LOG = {
+    'MODE':           os.environ.get('AUDIT_LOG_MODE', 'bulk'),
+    'SPOOL_DIR':      os.environ.get('AUDIT_LOG_SPOOL_DIR', os.path.join(BASE_DIR, 'logs', 'audit_spool')),
+    'ARCHIVE_DAYS':   int(os.environ.get('AUDIT_LOG_ARCHIVE_DAYS', 180)),    # then moved to the archive table
+    # archived rows are deleted after this many days (daily counts stay); None keeps them
+    'RETENTION_DAYS': int(os.environ['AUDIT_LOG_RETENTION_DAYS']) if os.environ.get('AUDIT_LOG_RETENTION_DAYS') else None,
+}
+
+# Worker warm-up run from gunicorn's post_fork hook (core/warmup.py)
+TENANT_WARMUP = {
+    'ENABLED':   str2bool(os.environ.get('TENANT_WARMUP_ENABLED', 'True')),
+    'TEMPLATES': [
+        'layouts/my-base-dashboard.html',
+        'emr/oneglance/oneglance.html',
+    ],
+}
+
 
 
 DATABASES = {
@@ -372,6 +496,31 @@ DATABASES = {
 }
 
 
+# Cache: Redis in production; CACHE_BACKEND=locmem for tests and local runs.
+# Tenant code goes through core/tenant_cache.py, which namespaces every key by
+# tenant alias and language.
+if os.environ.get('CACHE_BACKEND', 'redis') == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND':  'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'emr-default',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND':    'django.core.cache.backends.redis.RedisCache',
+            'LOCATION':   os.environ.get('CACHE_URL', 'redis://127.0.0.1:6379/1'),
+            'KEY_PREFIX': 'emr',
+            'TIMEOUT':    300,
+        },
+    }
+
+TENANT_CACHE = {
+    'ENABLED': str2bool(os.environ.get('TENANT_CACHE_ENABLED', 'True')),
+    'TIMEOUT': int(os.environ.get('TENANT_CACHE_TIMEOUT', 300)),   # seconds
+}
+
 
 
 
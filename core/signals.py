@@ -0,0 +1,21 @@
+# core/signals.py
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.models import Branding, Connection, DatabaseConfig, OnlyOfficeConfig
+from core.tenant_registry import tenant_registry
+
+
+@receiver(post_save,   sender=Branding)
+@receiver(post_delete, sender=Branding)
+@receiver(post_save,   sender=Connection)
+@receiver(post_delete, sender=Connection)
+@receiver(post_save,   sender=DatabaseConfig)
+@receiver(post_delete, sender=DatabaseConfig)
+@receiver(post_save,   sender=OnlyOfficeConfig)
+@receiver(post_delete, sender=OnlyOfficeConfig)
+def invalidate_tenant_registry(sender, instance, **kwargs):
+    # domains can be renamed and DatabaseConfig / OnlyOfficeConfig rows are
+    # shared between brandings, so drop the whole (small) cache
+    tenant_registry.invalidate()
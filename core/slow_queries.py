@@ -0,0 +1,169 @@
+# core/slow_queries.py
+# Sampled slow-query log, replacing DEBUG logging of every SQL statement.
+#
+# An execute wrapper (installed on every new DB connection) times each query.
+# Only queries above SLOW_QUERY_LOG['THRESHOLD_MS'] are considered, a
+# SAMPLE_RATE fraction of them is put on a bounded queue, and a background
+# thread formats them as JSON lines for the 'core.slow_queries.log' logger
+# (handler in settings.LOGGING). The request thread never formats or writes
+# anything itself; when the queue is full the record is dropped and counted.
+#
+# Parameters are never written (patient data); they are only kept in memory
+# so the writer can EXPLAIN the worst offenders, at most once per
+# fingerprint every EXPLAIN_INTERVAL seconds.
+
+import os
+import re
+import json
+import time
+import queue
+import random
+import hashlib
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+from core.db_routers import get_current_tenant
+from core.instrumentation import current_view
+
+logger       = logging.getLogger(__name__)
+query_logger = logging.getLogger('core.slow_queries.log')
+
+_config           = getattr(settings, 'SLOW_QUERY_LOG', {})
+ENABLED           = _config.get('ENABLED', True)
+THRESHOLD         = _config.get('THRESHOLD_MS', 200) / 1000
+SAMPLE_RATE       = _config.get('SAMPLE_RATE', 1.0)
+EXPLAIN_THRESHOLD = _config.get('EXPLAIN_THRESHOLD_MS', 1000) / 1000
+EXPLAIN_INTERVAL  = _config.get('EXPLAIN_INTERVAL', 300)
+QUEUE_SIZE        = _config.get('QUEUE_SIZE', 10000)
+
+_STRINGS    = re.compile(r"'(?:[^'\\]|\\.)*'")            # not "…": identifiers outside MySQL
+_NUMBERS    = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LISTS   = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """Normalised SQL (literals and parameters → ?, IN lists collapsed) and its short hash."""
+    normalised = sql.replace('%s', '?')
+    normalised = _STRINGS.sub('?', normalised)
+    normalised = _NUMBERS.sub('?', normalised)
+    normalised = _IN_LISTS.sub('(?+)', normalised)
+    normalised = _WHITESPACE.sub(' ', normalised).strip()
+    return normalised, hashlib.md5(normalised.encode()).hexdigest()[:12]
+
+
+class SlowQueryLog:
+    """Bounded queue + one writer thread per process (started lazily, fork-safe)."""
+
+    def __init__(self):
+        self.counters   = Counter()        # logged, dropped, explained, explain_failed
+        self._queue     = queue.Queue(QUEUE_SIZE)
+        self._explained = {}               # fingerprint hash → monotonic time of last EXPLAIN
+        self._thread    = None
+        self._lock      = threading.Lock()
+
+    def submit(self, alias, sql, params, many, duration):
+        record = (alias, get_current_tenant(), current_view(), sql, None if many else params,
+                  duration, timezone.now())
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.counters['dropped'] += 1
+
+    def reset_after_fork(self):
+        self.counters = Counter()
+        self._queue   = queue.Queue(QUEUE_SIZE)
+        self._thread  = None
+        self._lock    = threading.Lock()
+
+    # ------------------------------------------------------------ writer side
+
+    def _ensure_writer(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='slow-query-log', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                query_logger.warning(json.dumps(self._entry(*record), default=str))
+                self.counters['logged'] += 1
+            except Exception:
+                logger.exception("Slow query log: could not write record")
+
+    def _entry(self, alias, tenant, view, sql, params, duration, at):
+        normalised, digest = fingerprint(sql)
+        entry = {
+            'at':          at.isoformat(),
+            'tenant':      tenant or alias,
+            'database':    alias,
+            'view':        view,
+            'duration_ms': round(duration * 1000, 1),
+            'fingerprint': digest,
+            'sql':         normalised[:4000],
+        }
+        if EXPLAIN_THRESHOLD and duration >= EXPLAIN_THRESHOLD and params is not None and self._explain_due(digest):
+            entry['explain'] = self._explain(alias, sql, params)
+        return entry
+
+    def _explain_due(self, digest):
+        now = time.monotonic()
+        if now - self._explained.get(digest, -EXPLAIN_INTERVAL) < EXPLAIN_INTERVAL:
+            return False
+        self._explained[digest] = now
+        return True
+
+    def _explain(self, alias, sql, params):
+        if not sql.lstrip()[:6].upper() == 'SELECT':
+            return None
+        # this thread's own connection to `alias`, handed back right after
+        conn = connections[alias]
+        try:
+            with conn.cursor() as cursor:
+                prefix = conn.ops.explain_query_prefix()
+                cursor.execute(f"{prefix} {sql}", params)
+                columns = [col[0] for col in cursor.description or ()]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            self.counters['explained'] += 1
+            return rows
+        except Exception as exc:
+            self.counters['explain_failed'] += 1
+            return {'error': str(exc)}
+        finally:
+            conn.close()
+
+
+slow_query_log = SlowQueryLog()
+os.register_at_fork(after_in_child=slow_query_log.reset_after_fork)
+
+
+def _time_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        if duration >= THRESHOLD and random.random() < SAMPLE_RATE:
+            slow_query_log.submit(context['connection'].alias, sql, params, many, duration)
+
+
+def _install_execute_wrapper(sender, connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def install():
+    """Called from CoreConfig.ready()."""
+    if ENABLED:
+        connection_created.connect(_install_execute_wrapper, dispatch_uid='core.slow_queries')
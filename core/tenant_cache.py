@@ -0,0 +1,257 @@
+# core/tenant_cache.py
+# Tenant-scoped caching on top of the default Django cache.
+#
+# Several clinics share the same workers and the same Redis, so every key
+# carries the tenant (and the active language). Invalidation is by tag:
+# each (tenant, tag) has a version number stored in the cache and cached
+# values are keyed by the versions of their tags, so bumping a tag makes all
+# values that depend on it unreachable (they expire on their own).
+#
+# A tenant database is reached under its DatabaseConfig.name (web requests,
+# commands, the watcher, Celery tasks) and under "<alias>__replica<N>" for
+# reads. Keys use tenant_id(), the DatabaseConfig.name, so a replica shares
+# its primary's namespace.
+
+import time
+import hashlib
+import logging
+import functools
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpRequest
+from django.utils import translation
+
+from core.db_replicas import primary_of
+from core.db_routers import get_current_tenant
+
+logger = logging.getLogger(__name__)
+
+_config         = getattr(settings, 'TENANT_CACHE', {})
+ENABLED         = _config.get('ENABLED', True)
+DEFAULT_TIMEOUT = _config.get('TIMEOUT', 300)
+
+_MISSING = object()
+
+
+class CacheStats:
+    """Per-process hit/miss counters, by cached function name."""
+
+    def __init__(self):
+        self._hits   = Counter()
+        self._misses = Counter()
+        self._lock   = threading.Lock()
+
+    def record(self, name, hit):
+        with self._lock:
+            (self._hits if hit else self._misses)[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {'hits': self._hits[name], 'misses': self._misses[name]}
+                for name in set(self._hits) | set(self._misses)
+            }
+
+    def reset(self):
+        with self._lock:
+            self._hits.clear()
+            self._misses.clear()
+
+
+cache_stats = CacheStats()
+
+
+def current_alias():
+    """Router alias of the current tenant (same fallback as TenantRouter)."""
+    return get_current_tenant() or 'default'
+
+
+def tenant_id(alias=None):
+    """
+    DatabaseConfig.name of the tenant database behind a router alias (default:
+    the current one); aliases that are not tenant databases stand for themselves.
+    """
+    alias = alias or current_alias()
+    return settings.DATABASES.get(alias, {}).get('TENANT') or primary_of(alias)
+
+
+def tenant_key(*parts, tenant=None, language=True):
+    """'t:<tenant id>:<language>:<parts…>' — long or unsafe parts are hashed."""
+    alias = tenant_id(tenant)
+    lang  = (translation.get_language() or '-') if language else '-'
+    raw   = ':'.join(str(part) for part in parts)
+    if len(raw) > 200 or any(c.isspace() for c in raw):
+        raw = hashlib.md5(raw.encode()).hexdigest()
+    return f"t:{alias}:{lang}:{raw}"
+
+
+def _tag_key(alias, tag):
+    return f"tag:{alias}:{tag}"
+
+
+def tag_versions(tags, tenant=None):
+    """Current version of each tag (creating missing ones), in order."""
+    if not tags:
+        return []
+    alias = tenant_id(tenant)
+    keys  = [_tag_key(alias, tag) for tag in tags]
+    found = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def invalidate_tags(*tags, tenant=None):
+    """Bump `tags` for one tenant (default: the current one)."""
+    alias = tenant_id(tenant)
+    for tag in tags:
+        key = _tag_key(alias, tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # never read yet (or evicted): nothing cached depends on it
+            cache.set(key, time.time_ns(), timeout=None)
+        except Exception:
+            logger.exception("Cache: could not invalidate tag %s for %s", tag, alias)
+
+
+def _resolve(values, *args, **kwargs):
+    return [value(*args, **kwargs) if callable(value) else value for value in values]
+
+
+def _cacheable_response(request, response):
+    if getattr(response, 'streaming', False) or response.status_code != 200:
+        return False
+    if response.cookies or 'private' in response.get('Cache-Control', ''):
+        return False
+    # a page that embeds a CSRF token is bound to the caller's CSRF cookie
+    return not request.META.get('CSRF_COOKIE_USED')
+
+
+def _cached_call(name, part, tags, timeout, compute, request=None):
+    """Look up (name, part, tag versions) in the cache; compute and store on a miss."""
+    try:
+        versions  = tag_versions(tags)
+        cache_key = tenant_key(name, hashlib.md5(repr((part, versions)).encode()).hexdigest())
+        value     = cache.get(cache_key, _MISSING)
+    except Exception:
+        logger.exception("Cache: lookup failed for %s", name)
+        return compute()
+
+    if value is not _MISSING:
+        cache_stats.record(name, True)
+        return value
+
+    cache_stats.record(name, False)
+    value = compute()
+    if request is not None:
+        if not _cacheable_response(request, value):
+            return value
+        if callable(getattr(value, 'render', None)) and not value.is_rendered:
+            value.render()
+    try:
+        cache.set(cache_key, value, timeout)
+    except Exception:
+        logger.exception("Cache: store failed for %s", name)
+    return value
+
+
+def tenant_cached(timeout=None, tags=(), key=None, per_user=True):
+    """
+    Cache a function or a view per tenant and language.
+
+        @tenant_cached(tags=['patients'])
+        def patient_counts(): ...
+
+        @tenant_cached(timeout=60, tags=[lambda request, patient_id: f"patient:{patient_id}"])
+        def patient_summary(request, patient_id): ...
+
+    - tags: strings, or callables receiving the call arguments; see invalidate_on().
+    - key:  callable receiving the call arguments and returning the key part
+            (default: the arguments' repr, or the request path for views).
+    - per_user: views only; key on request.user as well (default True).
+
+    Views are cached for GET/HEAD only, and only for plain 200 responses
+    without cookies or an embedded CSRF token. Functions should return
+    plain data (lists, dicts), not lazy QuerySets. Cache errors never fail
+    the call: the function simply runs uncached.
+    """
+    timeout = DEFAULT_TIMEOUT if timeout is None else timeout
+
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            request = args[0] if args and isinstance(args[0], HttpRequest) else None
+            if not ENABLED or (request is not None and request.method not in ('GET', 'HEAD')):
+                return func(*args, **kwargs)
+
+            if key is not None:
+                part = key(*args, **kwargs)
+            elif request is not None:
+                user = getattr(request, 'user', None)
+                part = (request.get_full_path(), user.pk if per_user and user is not None else None)
+            else:
+                part = (args, sorted(kwargs.items()))
+
+            return _cached_call(
+                name, part, _resolve(tags, *args, **kwargs), timeout,
+                lambda: func(*args, **kwargs), request,
+            )
+
+        return wrapper
+    return decorator
+
+
+def cached_list(queryset, tags=(), timeout=None):
+    """
+    Evaluate `queryset` through the cache (keyed by its SQL) and return a list.
+    The model's label is always one of the tags, so invalidate_on(model)
+    covers it.
+    """
+    label = queryset.model._meta.label_lower
+    if not ENABLED:
+        return list(queryset)
+    try:
+        sql = str(queryset.query)
+    except Exception:
+        # queries that cannot be rendered to SQL without a connection
+        return list(queryset)
+    return _cached_call(
+        f"cached_list.{label}", sql, [label, *tags],
+        DEFAULT_TIMEOUT if timeout is None else timeout,
+        lambda: list(queryset),
+    )
+
+
+def invalidate_on(model, *tags):
+    """
+    Bump `tags` whenever an instance of `model` is saved or deleted. Tags are
+    strings or callables receiving the instance; the model's label is always
+    included. The tenant is taken from the database the instance lives in.
+
+        invalidate_on(Document, lambda doc: f"patient:{doc.patient_id}")
+
+    QuerySet.update()/bulk_* do not send signals: call invalidate_tags() there.
+    """
+    tags = (model._meta.label_lower, *tags)
+
+    def _invalidate(sender, instance, **kwargs):
+        db       = instance._state.db
+        alias    = primary_of(db) if db else None
+        resolved = _resolve(tags, instance)
+        invalidate_tags(*resolved, tenant=alias)
+        # again after commit, in case a concurrent request re-cached the old rows
+        transaction.on_commit(lambda: invalidate_tags(*resolved, tenant=alias), using=db)
+
+    post_save.connect(_invalidate, sender=model, weak=False)
+    post_delete.connect(_invalidate, sender=model, weak=False)
+    return _invalidate
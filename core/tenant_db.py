@@ -0,0 +1,96 @@
+# core/tenant_db.py
+# Single place that turns a DatabaseConfig row into a settings.DATABASES entry.
+
+from django.conf import settings
+
+from core.db_routers import get_current_tenant
+
+
+POOLED_ENGINES = {
+    'django.db.backends.mysql': 'core.db_backends.mysql_pool',
+}
+
+
+class ActiveTenantOnly:
+    """
+    ATOMIC_REQUESTS of a tenant alias: true only while the request runs for
+    that alias. Django wraps each view in atomic() for every alias whose flag
+    is true, which would check out one connection per registered tenant.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __bool__(self):
+        return get_current_tenant() == self.alias
+
+    def __repr__(self):
+        return f'ActiveTenantOnly({self.alias!r})'
+
+
+def tenant_database_settings(cfg):
+    """
+    Build the DATABASES dict for a tenant.
+
+    MySQL tenants use the pooled backend: Django releases the connection at
+    the end of every request (CONN_MAX_AGE = 0) and core.db_pool keeps it
+    open for the next one, within the tenant's pool limits.
+    """
+    pool_config = getattr(settings, 'TENANT_DB_POOL', {})
+    engine = cfg.db_engine
+    pooled = pool_config.get('ENABLED', True) and engine in POOLED_ENGINES
+
+    return {
+        'ENGINE':            POOLED_ENGINES[engine] if pooled else engine,
+        'NAME':              cfg.db_name,
+        'USER':              cfg.db_user,
+        'PASSWORD':          cfg.db_password,
+        'HOST':              cfg.db_host,
+        'PORT':              cfg.db_port,
+        'OPTIONS':           cfg.db_options,
+        'TIME_ZONE':         cfg.db_timezone,
+        'CONN_MAX_AGE':      0 if pooled else 60,
+        'ATOMIC_REQUESTS':   True,       # per alias: see register_tenant_database()
+        'CONN_HEALTH_CHECKS':True,
+        'AUTOCOMMIT':        True,
+        'POOL': {
+            'MAX_SIZE': cfg.pool_size,       # None → TENANT_DB_POOL default
+            'MAX_IDLE': cfg.pool_max_idle,
+        },
+        'REPLICA_MAX_LAG':   cfg.max_replica_lag,
+        'TENANT':            cfg.name,       # see core.tenant_cache.tenant_id()
+    }
+
+
+def replica_database_settings(primary, endpoint, primary_alias):
+    """
+    DATABASES dict for one replica endpoint of DatabaseConfig.replicas.
+    Keys missing from the endpoint ("host", "port", "user", "password",
+    "name", "options") are taken from the primary.
+    """
+    replica = dict(primary)
+    for key in ('host', 'port', 'user', 'password', 'name', 'options'):
+        if key in endpoint:
+            replica[key.upper()] = endpoint[key]
+    replica.pop('REPLICAS', None)
+    replica.update({
+        'ATOMIC_REQUESTS': False,            # read-only: no per-request transaction
+        'PRIMARY':         primary_alias,
+        'TEST':            {'MIRROR': primary_alias},
+    })
+    return replica
+
+
+def register_tenant_database(alias, cfg):
+    """Add `alias` (and its replicas, "<alias>__replica<N>") to settings.DATABASES if it is not there yet."""
+    if alias not in settings.DATABASES:
+        primary = tenant_database_settings(cfg)
+        replicas = []
+        for index, endpoint in enumerate(cfg.replicas or []):
+            replica_alias = f"{alias}__replica{index}"
+            settings.DATABASES[replica_alias] = replica_database_settings(primary, endpoint, alias)
+            replicas.append(replica_alias)
+        primary['REPLICAS'] = replicas
+        primary['ATOMIC_REQUESTS'] = ActiveTenantOnly(alias)
+        settings.DATABASES[alias] = primary
+    return settings.DATABASES[alias]
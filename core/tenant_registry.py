@@ -0,0 +1,136 @@
+# core/tenant_registry.py
+# Per-worker cache of "request host → tenant configuration" so that
+# DynamicDomainMiddleware does not hit customer_config on every request.
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+from core.models import Branding, Connection
+
+
+# alias: the tenant database's DatabaseConfig.name, the alias commands, Celery
+# tasks and the warm-up register too, so every domain of a database shares
+# one alias (and one set of pooled connections)
+TenantEntry = namedtuple(
+    'TenantEntry',
+    ['alias', 'branding', 'connection', 'database', 'onlyoffice'],
+)
+
+
+class TenantRegistry:
+    """
+    Bounded, TTL-based LRU cache of host → TenantEntry.
+
+    - Known hosts are cached for `ttl` seconds.
+    - Unknown hosts are cached as `None` for `negative_ttl` seconds, so bots
+      probing random sub-domains do not reach customer_config every time.
+    - At most `max_size` hosts are kept; the least recently used is dropped.
+
+    The cache lives inside each worker process. Changes made through the ORM
+    in the same process invalidate it via core/signals.py; other workers pick
+    the change up when their entry expires.
+    """
+
+    MISS = object()   # returned by peek() when the host is not cached
+
+    def __init__(self, max_size=256, ttl=300, negative_ttl=60):
+        self.max_size     = max_size
+        self.ttl          = ttl
+        self.negative_ttl = negative_ttl
+        self._entries     = OrderedDict()   # host → (expires_at, TenantEntry | None)
+        self._lock        = threading.Lock()
+
+    def peek(self, host):
+        """Cached entry (possibly None for an unknown host) or MISS; never queries."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(host)
+            if cached is None:
+                return self.MISS
+            expires_at, entry = cached
+            if expires_at <= now:
+                del self._entries[host]
+                return self.MISS
+            self._entries.move_to_end(host)
+            return entry
+
+    def get(self, host):
+        """Return the TenantEntry for `host`, or None if no tenant uses it."""
+        entry = self.peek(host)
+        if entry is not self.MISS:
+            return entry
+
+        # load outside the lock; two threads may race on a miss, which is harmless
+        entry = self._load(host)
+        ttl = self.ttl if entry is not None else self.negative_ttl
+
+        now = time.monotonic()
+        with self._lock:
+            self._entries[host] = (now + ttl, entry)
+            self._entries.move_to_end(host)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, host=None):
+        """Drop one host, or the whole cache when `host` is None."""
+        with self._lock:
+            if host is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(host, None)
+
+    def _load(self, host):
+        # one query: Connection → Branding + DatabaseConfig + OnlyOfficeConfig
+        conn = (
+            Connection.using_customer_config()
+                .select_related('branding', 'default_database', 'onlyoffice')
+                .filter(branding__domain_name=host)
+                .first()
+        )
+        if conn is None:
+            # a branded domain without a Connection is a configuration error,
+            # not an unknown host: keep failing loudly and do not cache it
+            if Branding.using_customer_config().filter(domain_name=host).exists():
+                raise Connection.DoesNotExist(f"No Connection configured for '{host}'")
+            return None
+
+        return self._entry(conn)
+
+    def preload(self):
+        """Cache every configured host with a single query (worker warm-up)."""
+        conns = (
+            Connection.using_customer_config()
+                .select_related('branding', 'default_database', 'onlyoffice')
+        )
+        entries = [self._entry(conn) for conn in conns]
+        now = time.monotonic()
+        with self._lock:
+            for entry in entries[-self.max_size:]:
+                self._entries[entry.branding.domain_name] = (now + self.ttl, entry)
+                self._entries.move_to_end(entry.branding.domain_name)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entries
+
+    @staticmethod
+    def _entry(conn):
+        return TenantEntry(
+            alias      = conn.default_database.name,
+            branding   = conn.branding,
+            connection = conn,
+            database   = conn.default_database,
+            onlyoffice = conn.onlyoffice,
+        )
+
+
+_config = getattr(settings, 'TENANT_REGISTRY', {})
+
+tenant_registry = TenantRegistry(
+    max_size     = _config.get('MAX_SIZE', 256),
+    ttl          = _config.get('TTL', 300),
+    negative_ttl = _config.get('NEGATIVE_TTL', 60),
+)
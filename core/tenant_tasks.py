@@ -0,0 +1,113 @@
+# core/tenant_tasks.py
+# Tenant context for Celery tasks.
+#
+# - publisher: every task sent while a tenant is active (request, another
+#   task, `with tenant(...)`) carries its alias in the 'tenant' message header;
+# - worker: before the task runs, the tenant DB is registered and the router
+#   context is set; it is reset when the task ends.
+#
+# Imported from core/celery.py, i.e. before Django is set up: Django/ORM
+# imports stay inside the functions.
+
+import logging
+
+from celery import shared_task
+from celery.signals import before_task_publish, task_postrun, task_prerun
+
+logger = logging.getLogger(__name__)
+
+TENANT_HEADER = 'tenant'
+
+_active = {}   # task id → router context token
+
+
+@before_task_publish.connect
+def stamp_tenant(sender=None, headers=None, **kwargs):
+    """Put the current tenant alias into the message (an explicit header wins)."""
+    from core.db_routers import get_current_tenant
+
+    alias = get_current_tenant()
+    if headers is not None and alias and not headers.get(TENANT_HEADER):
+        headers[TENANT_HEADER] = alias
+
+
+@task_prerun.connect
+def enter_tenant(sender=None, task_id=None, task=None, **kwargs):
+    from core.db_routers import set_current_tenant
+
+    alias = task_tenant(task)
+    if not alias:
+        return
+    try:
+        ensure_tenant_database(alias)
+    except Exception:
+        # still switch to the alias: the task then fails on an unknown
+        # database instead of silently running against 'default'
+        logger.exception("Task %s: could not register tenant database %s", task_id, alias)
+    _active[task_id] = set_current_tenant(alias)
+
+
+@task_postrun.connect
+def exit_tenant(sender=None, task_id=None, **kwargs):
+    from core.db_routers import reset_current_tenant
+
+    token = _active.pop(task_id, None)
+    if token is not None:
+        reset_current_tenant(token)
+
+
+def task_tenant(task):
+    """Tenant alias a running task was sent for (None if sent without one)."""
+    request = task.request
+    return getattr(request, TENANT_HEADER, None) or (request.headers or {}).get(TENANT_HEADER)
+
+
+def ensure_tenant_database(alias):
+    """Register `alias` (a DatabaseConfig.name) in this worker."""
+    from django.conf import settings
+    from core.models import DatabaseConfig
+    from core.tenant_db import register_tenant_database
+
+    if alias in settings.DATABASES:
+        return
+    cfg = DatabaseConfig.using_customer_config().filter(name=alias).first()
+    if cfg is None:
+        raise LookupError(f"No tenant database named '{alias}'")
+    register_tenant_database(alias, cfg)
+
+
+def tenant_aliases():
+    """One alias per tenant database (DatabaseConfig.name)."""
+    from core.models import DatabaseConfig
+
+    return list(DatabaseConfig.using_customer_config().order_by('name').values_list('name', flat=True))
+
+
+def for_each_tenant(task, *args, tenants=None, **kwargs):
+    """
+    Enqueue `task(*args, **kwargs)` once per tenant database, each message
+    carrying its tenant; returns {alias: AsyncResult}.
+
+        for_each_tenant(nightly_report, date.today().isoformat())
+    """
+    return {
+        alias: task.apply_async(args, kwargs, headers={TENANT_HEADER: alias})
+        for alias in (tenants if tenants is not None else tenant_aliases())
+    }
+
+
+@shared_task(name='core.for_each_tenant')
+def fan_out(task_name, args=(), kwargs=None, tenants=None):
+    """
+    Task form of for_each_tenant() for the beat schedule:
+
+        'nightly-report': {
+            'task': 'core.for_each_tenant',
+            'args': ('apps.reports.tasks.nightly_report',),
+            'schedule': crontab(minute=0, hour=2),
+        }
+    """
+    from core.celery import celery_app
+
+    results = for_each_tenant(celery_app.tasks[task_name], *args, tenants=tenants, **(kwargs or {}))
+    return {alias: result.id for alias, result in results.items()}
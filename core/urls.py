@@ -31,6 +31,7 @@ import os
 
 
 from apps.common.sitemap import BlogSitemap,ProductSitemap
+from core.instrumentation import metrics_view
 
 sitemaps = {
     'blog': BlogSitemap,
@@ -47,6 +48,7 @@ urlpatterns = [
     path('management/', admin.site.urls),
     path("select2/", include("django_select2.urls")),
     path('f/', include('apps.emr.files.urls', namespace='files')),
+    path('metrics/', metrics_view, name='metrics'),
 
 ]
 
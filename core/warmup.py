@@ -0,0 +1,100 @@
+# core/warmup.py
+# Worker warm-up: called from gunicorn's post_fork hook (gunicorn-cfg.py) so the
+# first request of every tenant on every worker does not pay for alias
+# registration, connection setup and Django's lazy initialisation.
+
+import time
+import logging
+
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.template.loader import get_template
+from django.urls import get_resolver
+from django.utils import translation
+
+from core.models import DatabaseConfig
+from core.tenant_db import register_tenant_database
+from core.tenant_registry import tenant_registry
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    """
+    1. Load every DatabaseConfig / Connection once and register the aliases.
+    2. Open and validate one connection per tenant (left idle in the pool).
+    3. Touch the URL resolver, template loaders and translation catalogs.
+
+    Returns {'tenants': {alias: seconds | None on failure}, 'django': seconds, 'total': seconds}.
+    Never raises: a broken tenant must not keep a worker from booting.
+    """
+    started = time.monotonic()
+    timings = {'tenants': {}}
+
+    # 1) one alias per database, DatabaseConfig.name: the middleware maps every
+    #    domain to it (core/tenant_registry.py), so also cache the hosts
+    aliases = {}
+    try:
+        for cfg in DatabaseConfig.using_customer_config().all():
+            aliases[cfg.name] = cfg
+        tenant_registry.preload()
+    except Exception:
+        logger.exception("Warm-up: could not load tenant configuration")
+
+    # 2) connections
+    for alias, cfg in sorted(aliases.items()):
+        t0 = time.monotonic()
+        try:
+            register_tenant_database(alias, cfg)
+            conn = connections[alias]
+            conn.ensure_connection()
+            if not conn.is_usable():
+                raise RuntimeError("connection is not usable")
+            conn.features.can_return_columns_from_insert    # per-connection lazy init
+            timings['tenants'][alias] = time.monotonic() - t0
+            logger.info("Warm-up: tenant %s ready in %.3fs", alias, timings['tenants'][alias])
+        except Exception:
+            timings['tenants'][alias] = None
+            logger.exception("Warm-up: tenant %s failed", alias)
+        finally:
+            # hand the connection back to the pool (or close it) until the first request
+            connections[alias].close()
+
+    # 3) Django lazy state shared by all tenants
+    t0 = time.monotonic()
+    try:
+        _warm_django()
+    except Exception:
+        logger.exception("Warm-up: Django initialisation failed")
+    timings['django'] = time.monotonic() - t0
+    timings['total'] = time.monotonic() - started
+
+    logger.info(
+        "Warm-up done in %.3fs (%d tenants, %d failed, django %.3fs)",
+        timings['total'],
+        len(timings['tenants']),
+        sum(1 for t in timings['tenants'].values() if t is None),
+        timings['django'],
+    )
+    return timings
+
+
+def _warm_django():
+    resolver = get_resolver()
+    for code, _name in settings.LANGUAGES:
+        with translation.override(code):
+            # loads the catalog and populates the (per-language) i18n_patterns resolver
+            translation.gettext("Home")
+            resolver.reverse_dict
+
+    for engine in engines.all():
+        django_engine = getattr(engine, 'engine', None)
+        if django_engine is not None:
+            django_engine.template_loaders
+
+    for name in getattr(settings, 'TENANT_WARMUP', {}).get('TEMPLATES', []):
+        try:
+            get_template(name)
+        except Exception:
+            logger.warning("Warm-up: template %s could not be loaded", name)
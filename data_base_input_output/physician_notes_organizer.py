@@ -6,6 +6,9 @@ For each immediate subdirectory of PARENT_DIR:
   1) create a 'physician_notes' folder
   2) if '1.pdf' exists, rename it to 'Scan2.pdf' inside physician_notes
   3) move all other .pdf files into physician_notes
+
+The subdirectories are listed in parallel (apps/emr/files/walker.py), which
+matters on the network share where every listing is a round-trip.
 """
 
 import argparse
@@ -13,6 +16,10 @@ from pathlib import Path
 import shutil
 import sys
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from apps.emr.files.walker import WORKERS, parallel_walk
+
 def main():
     parser = argparse.ArgumentParser(
         description="Organize PDF files into physician_notes folders."
@@ -22,6 +29,12 @@ def main():
         type=Path,
         help="Path to the parent directory containing subdirectories."
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="Subdirectories listed concurrently."
+    )
     args = parser.parse_args()
     parent_dir = args.parent_dir
 
@@ -30,25 +43,28 @@ def main():
         sys.exit(1)
 
     for subdir in parent_dir.iterdir():
-        if not subdir.is_dir():
-            continue
+        if subdir.is_dir():
+            (subdir / "physician_notes").mkdir(exist_ok=True)
 
+    def onerror(top, exc):
+        print(f"Error: cannot read {exc.filename}: {exc}", file=sys.stderr)
+
+    # only the files directly inside each subdirectory, not physician_notes/…
+    for entry in parallel_walk(parent_dir, onerror=onerror, workers=args.workers, max_depth=1):
+        if not entry.name.lower().endswith(".pdf"):
+            continue
+        subdir = parent_dir / entry.top
         notes_dir = subdir / "physician_notes"
-        notes_dir.mkdir(exist_ok=True)
 
-        # 1) Rename '1.pdf' → 'Scan2.pdf' inside physician_notes
-        one_pdf = subdir / "1.pdf"
-        if one_pdf.is_file():
+        if entry.name == "1.pdf":
+            # 1) Rename '1.pdf' → 'Scan2.pdf' inside physician_notes
             target = notes_dir / "Scan2.pdf"
-            one_pdf.rename(target)
-            print(f"Renamed: {one_pdf.name} → {target.relative_to(subdir)}")
-
-        # 2) Move all remaining *.pdf files into physician_notes
-        for f in subdir.iterdir():
-            if f.is_file() and f.suffix.lower() == ".pdf":
-                dest = notes_dir / f.name
-                shutil.move(str(f), str(dest))
-                print(f"Moved: {f.name} → {notes_dir.name}/")
+            Path(entry.path).rename(target)
+            print(f"Renamed: {entry.name} → {target.relative_to(subdir)}")
+        else:
+            # 2) Move all remaining *.pdf files into physician_notes
+            shutil.move(entry.path, str(notes_dir / entry.name))
+            print(f"Moved: {entry.name} → {notes_dir.name}/")
 
 if __name__ == "__main__":
     main()
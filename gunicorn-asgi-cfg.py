@@ -0,0 +1,23 @@
+# -*- encoding: utf-8 -*-
+"""
+ASGI (uvicorn workers) counterpart of gunicorn-cfg.py:
+
+    gunicorn -c gunicorn-asgi-cfg.py core.asgi:application
+
+Not the default deployment: gunicorn-cfg.py (WSGI) is. The views are still
+synchronous, and under ASGI Django runs every sync view of a worker through
+sync_to_async(thread_sensitive=True), i.e. one at a time on a single thread.
+The middleware stack is async-capable, but a worker only serves requests
+concurrently once the I/O-bound views (OnlyOffice callback, file serving,
+AI chat) are async themselves; until then it serves fewer requests than a
+threaded WSGI worker. Measure with benchmarks/bench_wsgi_vs_asgi.py before
+switching.
+"""
+
+bind = '0.0.0.0:5006'
+workers = 4
+worker_class = 'uvicorn.workers.UvicornWorker'
+accesslog = '-'
+loglevel = 'error'
+capture_output = True
+enable_stdio_inheritance = True
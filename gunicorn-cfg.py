@@ -9,3 +9,56 @@ accesslog = '-'
 loglevel = 'error'
 capture_output = True
 enable_stdio_inheritance = True
+
+
+def _metrics_dir():
+    import os
+    return os.environ.get('INSTRUMENTATION_DIR',
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'metrics'))
+
+
+def on_starting(server):
+    """Drop the /metrics/ snapshots of workers that no longer run (see core/instrumentation.py)."""
+    import glob, os
+    for path in glob.glob(os.path.join(_metrics_dir(), '*.json')):
+        try:
+            os.kill(int(os.path.basename(path)[:-5]), 0)
+        except (ValueError, ProcessLookupError):
+            os.remove(path)
+        except PermissionError:
+            pass
+
+
+def child_exit(server, worker):
+    """
+    Drop the snapshot of a worker that exited (max_requests, timeout, HUP),
+    so /metrics/ does not keep summing it and the folder does not grow.
+    """
+    import os
+    try:
+        os.remove(os.path.join(_metrics_dir(), f'{worker.pid}.json'))
+    except FileNotFoundError:
+        pass
+
+
+def post_fork(server, worker):
+    """
+    Warm the worker up before it accepts requests: register and pre-connect
+    every tenant DB and initialise Django's lazy state (see core/warmup.py).
+    """
+    import os
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+
+    import django
+    django.setup()
+
+    from django.conf import settings
+    if not getattr(settings, 'TENANT_WARMUP', {}).get('ENABLED', True):
+        return
+
+    from core.warmup import warm_up
+    timings = warm_up()
+    for alias, seconds in sorted(timings['tenants'].items()):
+        worker.log.info("[%s] warm-up %s: %s", worker.pid, alias,
+                        "failed" if seconds is None else f"{seconds:.3f}s")
+    worker.log.info("[%s] warm-up finished in %.3fs", worker.pid, timings['total'])
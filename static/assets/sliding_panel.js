@@ -28,19 +28,29 @@ document.addEventListener("DOMContentLoaded", () => {
   closeBtn.addEventListener("click", hidePanel);
   overlay .addEventListener("click", hidePanel);
 
-  // attach open-button handlers
-  document.querySelectorAll(".open-panel").forEach(btn => {
-    btn.addEventListener("click", () => {
-      // build a doc object straight from data-attrs
-      const doc = {
-        key:         btn.dataset.key,
-        referencedata: btn.dataset.referencedata,
-        url:         btn.dataset.url,
-        token:       btn.dataset.token,
-        title:       btn.dataset.title,
-        permissions: JSON.parse(btn.dataset.permissions),
-        extension:   btn.dataset.extension,
-      };
+  // attach open-button handlers: the signed editor config is fetched on
+  // every click (listing pages carry metadata, no tokens), so a document
+  // saved since the last open gets its new key and a fresh token
+  document.querySelectorAll(".open-panel[data-config-url]").forEach(btn => {
+    btn.addEventListener("click", async () => {
+      let doc;
+      try {
+        const resp = await fetch(btn.dataset.configUrl, { credentials: "same-origin", cache: "no-store" });
+        if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+        const config = await resp.json();
+        doc = {
+          key:           config.key,
+          referencedata: config.referenceData,
+          url:           config.url,
+          token:         config.token,
+          title:         config.title,
+          permissions:   config.permissions,
+          extension:     config.extension,
+        };
+      } catch (err) {
+        console.error("[OnlyOffice] cannot load editor config for", btn.dataset.title, err);
+        return;
+      }
       openDocument(doc);
     });
   });